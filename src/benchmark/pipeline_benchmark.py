@@ -0,0 +1,206 @@
+import argparse
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from benchmark.pyramid_detection import BASE_COLOR, TOLERANCE
+from detection.color_thresholding import ColorSegmenter
+from geometry.geom import SpatialGeometryTransformer, StereoEllipseGeometryExtractor
+from pipeline.pipeline import Consumer, OverflowPolicy, Pipeline
+from stereo.split import StereoSplitter
+from stereo.stereo_pipeline import StereoMapper
+from synthetic.scene import SceneEffects, SyntheticStereoScene, SyntheticStereoSupplier, ballistic_trajectory
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class ResultCollector(Consumer):
+    wants_envelope = True
+
+    def __init__(self, expected: int):
+        super().__init__()
+        self.expected = expected
+        self.results: Dict[int, Any] = {}
+        self.latencies: List[float] = []
+        self.done = threading.Event()
+        self.finished_at: Optional[float] = None
+
+    def consume(self, envelope):
+        if envelope.sequence >= self.expected:
+            return
+        self.latencies.append(envelope.age())
+        self.results[envelope.sequence] = envelope.payload
+        self.finished_at = time.monotonic()
+        if envelope.sequence == self.expected - 1:
+            self.done.set()
+
+
+def _summary(durations: Sequence[float]) -> Dict[str, float]:
+    durations = np.asarray(durations) * 1e3
+    return {
+        "mean_ms": float(durations.mean()),
+        "p50_ms": float(np.percentile(durations, 50)),
+        "p95_ms": float(np.percentile(durations, 95)),
+    }
+
+
+def _time_stage(function: Callable[[Any], Any], inputs: Sequence[Any]) -> Dict[str, float]:
+    durations = []
+    for item in inputs:
+        started = time.perf_counter()
+        function(item)
+        durations.append(time.perf_counter() - started)
+    return _summary(durations)
+
+
+def make_segmenter(options: dict) -> ColorSegmenter:
+    return ColorSegmenter(BASE_COLOR, TOLERANCE, **options)
+
+
+def position_errors(results: Dict[int, Any], supplier: SyntheticStereoSupplier) -> np.ndarray:
+    """3D distance in mm of every result to the ground truth, inf for a miss."""
+    errors = np.full(len(results), np.inf)
+    for i, (sequence, result) in enumerate(sorted(results.items())):
+        if result is not None:
+            position = np.array([result["x"], result["y"], result["z"]])
+            errors[i] = np.linalg.norm(position - supplier.ground_truth(sequence)[0].position)
+    return errors
+
+
+def run_stages(scene: SyntheticStereoScene, frames: Sequence[np.ndarray], segmenter_options: dict,
+               method: str) -> Dict[str, Dict[str, float]]:
+    """Times every stage on its own with the outputs of the previous one."""
+    splitter = StereoSplitter()
+    stereo_segmenter = StereoMapper(make_segmenter(segmenter_options), make_segmenter(segmenter_options))
+    extractor = StereoEllipseGeometryExtractor()
+    transformer = SpatialGeometryTransformer(scene.left_matrix, scene.right_matrix, method)
+
+    pairs = [splitter.map(frame) for frame in frames]
+    segmented = [stereo_segmenter.map(pair) for pair in pairs]
+    circles = [extractor.map(item) for item in segmented]
+    return {
+        "split": _time_stage(splitter.map, frames),
+        "segment_stereo": _time_stage(stereo_segmenter.map, pairs),
+        "extract": _time_stage(extractor.map, segmented),
+        "triangulate": _time_stage(transformer.map, circles),
+    }
+
+
+def run_pipeline(scene: SyntheticStereoScene, trajectory: np.ndarray, fps: float, paced: bool,
+                 segmenter_options: dict, method: str, workers: int, process: bool) -> Dict[str, Any]:
+    """Runs the pipeline of src/main.py along ``trajectory`` without any display,
+    the frames are rendered while it runs."""
+    count = len(trajectory)
+    supplier = SyntheticStereoSupplier(scene, trajectory, fps, paced)
+    collector = ResultCollector(count)
+    # paced runs behave like the camera and keep only the newest frame, others process all
+    overflow = OverflowPolicy.LATEST if paced else OverflowPolicy.BLOCK
+    pipeline = (
+        Pipeline.builder()
+        .add(supplier)
+        .add(StereoSplitter())
+        .add(StereoMapper(make_segmenter(segmenter_options), make_segmenter(segmenter_options)),
+             process=process, workers=workers, overflow=overflow)
+        .add(StereoEllipseGeometryExtractor())
+        .add(SpatialGeometryTransformer(scene.left_matrix, scene.right_matrix, method))
+        .add(collector)
+        .build()
+    )
+    pipeline.run()
+    # a dropped last frame never arrives, the supplier being done plus some slack has to do then
+    while not collector.done.wait(0.1):
+        if supplier.finished.is_set() and time.monotonic() - (collector.finished_at or 0) > 1.0:
+            break
+    stage_stats = pipeline.stats()
+    pipeline.stop()
+
+    elapsed = (collector.finished_at or time.monotonic()) - supplier.started_at
+    latencies = np.array(collector.latencies) * 1e3
+    errors = position_errors(collector.results, supplier)
+    found = errors[np.isfinite(errors)]
+    return {
+        "frames": count,
+        "delivered": len(collector.results),
+        "fps": len(collector.results) / elapsed,
+        "latency_ms": {f"p{p}": float(np.percentile(latencies, p)) for p in LATENCY_PERCENTILES}
+        if len(latencies) else {},
+        "detection_rate": float(len(found) / max(len(errors), 1)),
+        "error_mm": {
+            "mean": float(found.mean()),
+            "p95": float(np.percentile(found, 95)),
+            "max": float(found.max()),
+        } if len(found) else {},
+        "stages": {stats["stage"]: {"items_per_sec": stats["items_per_sec"],
+                                    "service_p50_ms": stats["service_ms"]["p50"]}
+                   for stats in stage_stats},
+    }
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """One line per metric present in both runs with the relative change."""
+    old, new = (flatten({key: value for key, value in results.items() if key != "config"})
+                for results in (previous, current))
+    lines = []
+    for key in sorted(old.keys() & new.keys()):
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else float("nan")
+        lines.append(f"{key}: {old[key]:.3f} -> {new[key]:.3f} ({change:+.1f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of the tracking pipeline on synthetic stereo frames")
+    parser.add_argument("--frames", type=int, default=480, help="frames pushed through the pipeline")
+    parser.add_argument("--stage-frames", type=int, default=60, help="frames to time every stage on")
+    parser.add_argument("--fps", type=float, default=60.0, help="frame rate of the trajectory")
+    parser.add_argument("--paced", action="store_true", help="supply at --fps instead of as fast as possible")
+    parser.add_argument("--method", default="midpoint", choices=["midpoint", "dlt", "optimize"])
+    parser.add_argument("--workers", type=int, default=1, help="workers of the segmenter stage")
+    parser.add_argument("--process", action="store_true", help="run the segmenter stage in a process")
+    parser.add_argument("--track", action="store_true")
+    parser.add_argument("--pyramid-levels", type=int, default=0)
+    parser.add_argument("--classifier", default="lab", choices=["lab", "lut"])
+    parser.add_argument("--noise", type=float, default=0.0, help="sensor noise in gray levels")
+    parser.add_argument("--blur", type=float, default=0.0, help="edge width of the balls in pixels")
+    parser.add_argument("--lighting", type=float, default=0.0, help="relative brightness flicker")
+    parser.add_argument("--distractors", type=int, default=0, help="spheres of other colors")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    segmenter_options = {"track": args.track, "pyramid_levels": args.pyramid_levels,
+                         "classifier": args.classifier}
+    scene = SyntheticStereoScene(effects=SceneEffects(noise=args.noise, blur=args.blur, lighting=args.lighting,
+                                                      distractors=args.distractors))
+    trajectory = ballistic_trajectory(args.frames, args.fps)
+    frames = scene.render_batch(trajectory[:args.stage_frames], fps=args.fps)
+
+    results = {
+        "config": vars(args),
+        "stages": run_stages(scene, frames, segmenter_options, args.method),
+        "pipeline": run_pipeline(scene, trajectory, args.fps, args.paced, segmenter_options, args.method,
+                                 args.workers, args.process),
+    }
+    print(json.dumps({key: value for key, value in results.items() if key != "config"}, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), results)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
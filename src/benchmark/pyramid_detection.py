@@ -0,0 +1,80 @@
+import argparse
+import json
+import time
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from detection.color_thresholding import ColorSegmenter
+
+# LAB color of the ball in src/main.py, the tolerance is the one used there as well
+BASE_COLOR = [252, 157, 199]
+TOLERANCE = [0.925, 0.075, 0.075]
+
+
+def make_frames(count: int, radius: int, resolution=(1280, 720), seed=0
+                ) -> Tuple[List[np.ndarray], np.ndarray]:
+    """Textured background with a ball of the tracked color moving across it."""
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    background = rng.integers(30, 120, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (21, 21), 5)
+    color = cv2.cvtColor(np.uint8([[[200, 157, 199]]]), cv2.COLOR_LAB2BGR)[0, 0].tolist()
+
+    frames, centers = [], []
+    for i in range(count):
+        t = i / max(count - 1, 1)
+        center = np.array([radius + t * (width - 2 * radius), height / 2 + height / 3 * np.sin(4 * t)])
+        frame = background.copy()
+        # sub pixel center through the shift parameter of cv2.circle
+        cv2.circle(frame, tuple(int(c) for c in np.round(center * 16)), radius * 16, color, -1,
+                   cv2.LINE_AA, shift=4)
+        frames.append(frame)
+        centers.append(center)
+    return frames, np.array(centers)
+
+
+def run(levels: List[int], count: int, radius: int) -> List[Dict]:
+    frames, centers = make_frames(count, radius)
+    results = []
+    for level in levels:
+        segmenter = ColorSegmenter(BASE_COLOR, TOLERANCE, pyramid_levels=level)
+        durations, errors = [], []
+        for frame, center in zip(frames, centers):
+            started = time.perf_counter()
+            ellipse = segmenter.map(frame)
+            durations.append(time.perf_counter() - started)
+            errors.append(np.inf if ellipse is None else np.hypot(*(np.array(ellipse.center) - center)))
+        errors = np.array(errors)
+        found = np.isfinite(errors)
+        results.append({
+            "pyramid_levels": level,
+            "ms_p50": float(np.percentile(durations, 50) * 1e3),
+            "ms_p95": float(np.percentile(durations, 95) * 1e3),
+            "detection_rate": float(found.mean()),
+            "center_error_px_mean": float(errors[found].mean()) if found.any() else None,
+            "center_error_px_max": float(errors[found].max()) if found.any() else None,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and time of ColorSegmenter per pyramid level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[0, 1, 2, 3])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--radius", type=int, default=20)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.levels, args.frames, args.radius)
+    for result in results:
+        print(", ".join(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}"
+                        for key, value in result.items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
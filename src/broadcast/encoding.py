@@ -0,0 +1,57 @@
+import json
+import struct
+from typing import Any, Callable, Dict, List, Union
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack is optional, the encoding is only offered if it is installed
+    msgpack = None
+
+# sequence, capture time and position, little endian
+POSITION_STRUCT = struct.Struct("<qdddd")
+# sequence, capture time and number of balls, followed by a TRACK_STRUCT per ball
+TRACKS_HEADER_STRUCT = struct.Struct("<qdI")
+# ID, position and whether the position is only predicted
+TRACK_STRUCT = struct.Struct("<qddd?")
+
+# a single position or the list of balls of a MultiBallTracker
+Message = Union[dict, List[dict]]
+
+
+def _fields(message: Message) -> Dict[str, Any]:
+    if isinstance(message, list):
+        # positions that are not tracked yet have no ID
+        return {"balls": [
+            {"id": ball.get("id", -1), "x": ball["x"], "y": ball["y"], "z": ball["z"],
+             "predicted": ball.get("predicted", False)}
+            for ball in message
+        ]}
+    return {"x": message["x"], "y": message["y"], "z": message["z"]}
+
+
+def encode_json(message: Message, captured_at: float, sequence: int) -> bytes:
+    return json.dumps({**_fields(message), "t": captured_at, "seq": sequence}).encode()
+
+
+def encode_struct(message: Message, captured_at: float, sequence: int) -> bytes:
+    """40 bytes for a position, see ``POSITION_STRUCT``, and 20 + 33 bytes per ball
+    for a list of balls, see ``TRACKS_HEADER_STRUCT``."""
+    if isinstance(message, list):
+        return TRACKS_HEADER_STRUCT.pack(sequence, captured_at, len(message)) + b"".join(
+            TRACK_STRUCT.pack(ball["id"], ball["x"], ball["y"], ball["z"], ball["predicted"])
+            for ball in _fields(message)["balls"]
+        )
+    return POSITION_STRUCT.pack(sequence, captured_at, message["x"], message["y"], message["z"])
+
+
+def encode_msgpack(message: Message, captured_at: float, sequence: int) -> bytes:
+    return msgpack.packb({**_fields(message), "t": captured_at, "seq": sequence})
+
+
+ENCODINGS: Dict[str, Callable[[Message, float, int], bytes]] = {
+    "json": encode_json,
+    "struct": encode_struct,
+}
+if msgpack is not None:
+    ENCODINGS["msgpack"] = encode_msgpack
@@ -0,0 +1,167 @@
+import asyncio
+import struct
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from broadcast.encoding import ENCODINGS
+from pipeline.pipeline import Consumer
+
+# binary messages are prefixed with their length on TCP, JSON messages end with a newline
+LENGTH_PREFIX = struct.Struct("<H")
+
+
+class _TcpSubscriber(asyncio.Protocol):
+    def __init__(self, clients: Set[asyncio.Transport]):
+        self.__clients = clients
+        self.__transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.__transport = transport
+        self.__clients.add(transport)
+
+    def connection_lost(self, exc) -> None:
+        self.__clients.discard(self.__transport)
+
+    def data_received(self, data: bytes) -> None:
+        # subscribers only listen
+        pass
+
+
+class _UdpSubscribers(asyncio.DatagramProtocol):
+    """Any datagram subscribes its sender for ``timeout`` seconds, clients resend
+    to stay subscribed."""
+
+    def __init__(self, clients: Dict[Tuple, float], timeout: float):
+        self.__clients = clients
+        self.__timeout = timeout
+
+    def datagram_received(self, data: bytes, address: Tuple) -> None:
+        self.__clients[address] = time.monotonic() + self.__timeout
+
+
+class FanoutServer(Consumer):
+    """Serves every position directly to any number of TCP and UDP subscribers.
+
+    An asyncio loop on its own thread accepts the clients; ``consume`` encodes a
+    message once and hands it to the loop, which writes it to every client. Each
+    TCP client has a send buffer of at most ``max_buffered`` bytes, a client
+    that lets it fill up is disconnected instead of slowing down the others.
+    UDP clients subscribe by sending any datagram to ``udp_port`` and have to
+    repeat that every ``udp_timeout`` seconds.
+
+    JSON messages are newline terminated on TCP, binary ones are prefixed with
+    their length as little endian uint16.
+    """
+
+    wants_envelope = True
+
+    def __init__(self, host: str = "0.0.0.0", port: Optional[int] = 5555,
+                 udp_port: Optional[int] = None, encoding: str = "json",
+                 max_buffered: int = 64 * 1024, udp_timeout: float = 10.0):
+        super().__init__()
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding}, available are {', '.join(ENCODINGS)}")
+        self.host = host
+        self.port = port
+        self.udp_port = udp_port
+        self.encoding = encoding
+        self.max_buffered = max_buffered
+        self.udp_timeout = udp_timeout
+        self.sent = 0
+        self.disconnected = 0
+        # the loop is created on first use, the component may be copied into a process before
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__thread: Optional[threading.Thread] = None
+        self.__servers = []
+        self.__tcp_clients: Set[asyncio.Transport] = set()
+        self.__udp_clients: Dict[Tuple, float] = {}
+        self.__udp_transport: Optional[asyncio.DatagramTransport] = None
+
+    @property
+    def client_count(self) -> int:
+        return len(self.__tcp_clients) + len(self.__udp_clients)
+
+    def start(self) -> 'FanoutServer':
+        """Starts listening, otherwise done on the first ``consume``."""
+        if self.__thread is not None:
+            return self
+        started = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, args=(started,), name="fanout", daemon=True)
+        self.__thread.start()
+        started.wait()
+        return self
+
+    def __run(self, started: threading.Event) -> None:
+        self.__loop = asyncio.new_event_loop()
+        self.__loop.run_until_complete(self.__listen())
+        started.set()
+        self.__loop.run_forever()
+
+    async def __listen(self) -> None:
+        if self.port is not None:
+            server = await self.__loop.create_server(
+                lambda: _TcpSubscriber(self.__tcp_clients), self.host, self.port
+            )
+            self.port = server.sockets[0].getsockname()[1]
+            self.__servers.append(server)
+        if self.udp_port is not None:
+            self.__udp_transport, _ = await self.__loop.create_datagram_endpoint(
+                lambda: _UdpSubscribers(self.__udp_clients, self.udp_timeout),
+                local_addr=(self.host, self.udp_port),
+            )
+            self.udp_port = self.__udp_transport.get_extra_info("sockname")[1]
+
+    def consume(self, envelope):
+        if self.__thread is None:
+            self.start()
+        message = envelope.payload
+        if message is None:
+            return
+        encoded = ENCODINGS[self.encoding](message, envelope.captured_at, envelope.sequence)
+        self.__loop.call_soon_threadsafe(self.__broadcast, encoded)
+
+    def __broadcast(self, encoded: bytes) -> None:
+        if self.__tcp_clients:
+            if self.encoding == "json":
+                framed = encoded + b"\n"
+            else:
+                framed = LENGTH_PREFIX.pack(len(encoded)) + encoded
+            # copied since aborting a client removes it from the set
+            for transport in list(self.__tcp_clients):
+                if transport.is_closing():
+                    # connection_lost follows on the next loop iteration
+                    self.__tcp_clients.discard(transport)
+                    continue
+                if transport.get_write_buffer_size() > self.max_buffered:
+                    transport.abort()
+                    self.__tcp_clients.discard(transport)
+                    self.disconnected += 1
+                    continue
+                transport.write(framed)
+                self.sent += 1
+
+        if self.__udp_clients:
+            now = time.monotonic()
+            for address, expires in list(self.__udp_clients.items()):
+                if expires < now:
+                    del self.__udp_clients[address]
+                    continue
+                # a full socket buffer silently drops the datagram, as UDP would anyway
+                self.__udp_transport.sendto(encoded, address)
+                self.sent += 1
+
+    def stop(self) -> None:
+        if self.__loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.__close(), self.__loop).result(timeout=1.0)
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join(timeout=1.0)
+
+    async def __close(self) -> None:
+        for server in self.__servers:
+            server.close()
+        for transport in list(self.__tcp_clients):
+            transport.close()
+        if self.__udp_transport is not None:
+            self.__udp_transport.close()
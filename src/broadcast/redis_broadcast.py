@@ -1,31 +1,123 @@
+import json
+import queue
+import threading
 import time
+from typing import Optional
 
+from broadcast.encoding import ENCODINGS
+from pipeline.stats import RollingHistogram
 from pipeline.pipeline import Consumer
 import redis
-import pickle
 
 
 class RedisBroadcast(Consumer):
-
-    def __init__(self, redis_client: redis.Redis, channel: str):
+    """Publishes the positions to a Redis channel or appends them to a stream.
+
+    ``consume`` only encodes the message and queues it; a sender thread writes
+    the queued messages in batches of up to ``batch_size`` with one pipelined
+    round trip, so a slow or unreachable Redis never stalls the pipeline. When
+    the queue of ``queue_size`` messages is full the oldest one is dropped.
+    With ``stream`` the messages are appended with ``XADD`` to a stream named
+    like the channel and trimmed to about ``maxlen`` entries, for later replay.
+
+    The latency the pipeline records for this consumer ends when the message is
+    queued. ``publish_latency`` holds the time from capture until the batch of
+    a message was written, in seconds, so it includes the network hop.
+    """
+
+    wants_envelope = True
+    # pause after a failed batch before the next attempt
+    RETRY_INTERVAL = 0.5
+
+    def __init__(self, redis_client: redis.Redis, channel: str, encoding: str = "json",
+                 stream: bool = False, maxlen: Optional[int] = 10000, batch_size: int = 64,
+                 queue_size: int = 1024):
         super().__init__()
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding}, available are {', '.join(ENCODINGS)}")
         self.redis_client = redis_client
         self.channel = channel
-
-    def consume(self, message):
+        self.encoding = encoding
+        self.stream = stream
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.failed = 0
+        self.sent = 0
+        self.publish_latency = RollingHistogram()
+        # the sender is created on first use, the component may be copied into a worker before
+        self.__queue: Optional[queue.Queue] = None
+        self.__sender: Optional[threading.Thread] = None
+        self.__stopped = threading.Event()
+
+    def consume(self, envelope):
+        message = envelope.payload
         if message is None:
             return
-
-        json_message = "{\"x\": %f, \"y\": %f, \"z\": %f}" % (message["x"], message["y"], message["z"])
-        print(json_message)
-        self.redis_client.publish(self.channel, json_message)
+        if self.__sender is None:
+            self.__start()
+
+        encoded = ENCODINGS[self.encoding](message, envelope.captured_at, envelope.sequence)
+        while True:
+            try:
+                self.__queue.put_nowait((encoded, envelope.captured_monotonic))
+                return
+            except queue.Full:
+                pass
+            try:
+                self.__queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def __start(self) -> None:
+        self.__queue = queue.Queue(self.queue_size)
+        self.__sender = threading.Thread(target=self.__send_loop, name="redis-broadcast", daemon=True)
+        self.__sender.start()
+
+    def __send_loop(self) -> None:
+        while not self.__stopped.is_set() or not self.__queue.empty():
+            try:
+                batch = [self.__queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.__send([encoded for encoded, _ in batch])
+                self.sent += len(batch)
+                sent_at = time.monotonic()
+                for _, captured_monotonic in batch:
+                    self.publish_latency.record(sent_at - captured_monotonic)
+            except redis.RedisError:
+                # positions are only worth something live, the batch is given up
+                self.failed += len(batch)
+                self.__stopped.wait(self.RETRY_INTERVAL)
+
+    def __send(self, batch) -> None:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for encoded in batch:
+            if self.stream:
+                pipe.xadd(self.channel, {"data": encoded}, maxlen=self.maxlen, approximate=True)
+            else:
+                pipe.publish(self.channel, encoded)
+        pipe.execute()
+
+    def stop(self) -> None:
+        """Sends what is still queued and ends the sender thread."""
+        self.__stopped.set()
+        if self.__sender is not None:
+            self.__sender.join(timeout=1.0)
 
 
 if __name__ == "__main__":
     client = redis.Redis(host='localhost', port=6379)
 
     from pipeline.pipeline import Supplier, Pipeline, PipelineComponent
-    import json
 
 
     class TestSupplier(Supplier):
@@ -37,10 +129,9 @@ if __name__ == "__main__":
         def supply(self):
             self.i += 0.1
             pos = {"x": -0.5, "y": 1.2, "z": 0.4}
-            msg = json.dumps(pos)
             time.sleep(0.5)
-            print(msg)
-            return msg
+            print(json.dumps(pos))
+            return pos
 
 
     pipe = Pipeline.builder() \
@@ -2,6 +2,8 @@
 Created on Sat Jun 17 12:26:01 2023
 
 @author: Franz Ostler
+
+Siehe capture/stereo_calibration.py für die vollständige Stereokalibrierung.
 """
 import numpy as np
 import cv2
@@ -10,6 +12,7 @@ import glob
 def kalibriere_kamera(feldanzahl_schachbrett = 8):
     schachbrett_größe = (feldanzahl_schachbrett-1, feldanzahl_schachbrett-1)  # Größe des Schachbrettmusters
     schachbrettmuster_punkte = []  # 3D-Koordinaten des Schachbrettmusters
+    objekt_punkte = []  # 3D-Koordinaten des Schachbrettmusters je Bild
     bilder_punkte = []  # 2D-Koordinaten des Schachbrettmusters in den Bildern
 
     # Erzeugen der 3D-Koordinaten des Schachbrettmusters
@@ -27,16 +30,20 @@ def kalibriere_kamera(feldanzahl_schachbrett = 8):
         ret, ecken = cv2.findChessboardCorners(grau, schachbrett_größe, None)
 
         if ret:
-            schachbrettmuster_punkte.append(np.float32(schachbrettmuster_punkte))
+            objekt_punkte.append(np.float32(schachbrettmuster_punkte))
             bilder_punkte.append(ecken)
 
     ret, matrix, dist_koeff, rvecs, tvecs = cv2.calibrateCamera(
-        schachbrettmuster_punkte, bilder_punkte, grau.shape[::-1], None, None
+        objekt_punkte, bilder_punkte, grau.shape[::-1], None, None
     )
     np.savetxt("object_points.txt", np.float32(schachbrettmuster_punkte))
     return matrix, dist_koeff, bilder_punkte
 
-def kalibriere_beide_Kameras(cameraMatrix1, distCoeffs1, imagePoints1, imageSize=(640, 480), objectPoints=np.loadtxt("object_points.txt")):
+def kalibriere_beide_Kameras(cameraMatrix1, distCoeffs1, imagePoints1, imageSize=(640, 480), objectPoints=None):
+    # erst beim Aufruf laden, nicht schon beim Import
+    if objectPoints is None:
+        objectPoints = [np.loadtxt("object_points.txt", dtype=np.float32)] * len(imagePoints1)
+
     # Abstand zwischen den Kameras
     baseline = 50.0  # 50 cm
     
@@ -44,13 +51,13 @@ def kalibriere_beide_Kameras(cameraMatrix1, distCoeffs1, imagePoints1, imageSize
     translationVector2 = np.array([[baseline, 0, 0]], dtype=np.float64)
     
     # Kalibrierung der zweiten Kamera
-    (_, _, _, rotationMatrix2, _, _) = cv2.calibrateCamera(
+    (_, _, _, rotationVectors2, _) = cv2.calibrateCamera(
         objectPoints, imagePoints1, imageSize,
         cameraMatrix1, distCoeffs1,
         flags=cv2.CALIB_FIX_INTRINSIC
     )
     
     # Extrinsische Parameter für die zweite Kamera
-    rotationMatrix2 = rotationMatrix2[0]  # Extrahieren der Rotationsmatrix
+    rotationMatrix2, _ = cv2.Rodrigues(rotationVectors2[0])  # Extrahieren der Rotationsmatrix
     
     return translationVector2, rotationMatrix2
\ No newline at end of file
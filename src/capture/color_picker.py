@@ -3,8 +3,15 @@ import numpy as np
 
 
 class ColorPicker:
-    def __init__(self, radius=100):
+    def __init__(self, radius=100, segmenter=None):
         self.radius = radius
+        # ColorSegmenters retuned to every color read with "r", one or a list like both of a StereoMapper
+        if segmenter is None:
+            self.segmenters = []
+        elif isinstance(segmenter, (list, tuple)):
+            self.segmenters = list(segmenter)
+        else:
+            self.segmenters = [segmenter]
 
         self.half_width: int
         self.half_height: int
@@ -56,7 +63,10 @@ class ColorPicker:
                     self.radius = max(10, self.radius - 10)
                     self.update_mask()
                 case "r":
+                    color = np.mean(self.color_median, axis=0)
                     median, std = self.print_color()
+                    for segmenter in self.segmenters:
+                        segmenter.set_color(color)
 
             if median is not None:
                 cv2.putText(
@@ -1,11 +1,17 @@
 import threading
-from typing import Tuple, Union, Any
+import time
+from typing import Any, Optional, Tuple, Union
 
 import cv2
 import numpy as np
 
+from capture.grabber import CaptureThread, GrabbedFrame
+from pipeline.envelope import Envelope
 from pipeline.pipeline import Supplier
 
+# how often a supplier waiting for frames checks whether it was stopped, in seconds
+STOP_CHECK_INTERVAL = 0.1
+
 
 class StereoFrameSupplier(Supplier):
     def __init__(self, left_device, right_device, resolution: Union[None, Tuple[int, int]] = None):
@@ -71,7 +77,16 @@ class StereoFrameSupplier(Supplier):
 
 
 class FrameSupplier(Supplier):
-    def __init__(self, capture_device, resolution: Union[None, Tuple[int, int]] = None):
+    """Reads frames of a single capture device.
+
+    With ``background`` a dedicated thread keeps draining the device into a single
+    slot, so ``supply`` always returns the freshest frame instead of one that
+    waited in the driver buffer. The number of frames skipped in between is
+    attached to the envelope and summed up in ``skipped``.
+    """
+
+    def __init__(self, capture_device, resolution: Union[None, Tuple[int, int]] = None,
+                 background: bool = False):
         super().__init__()
 
         self.capture_device = (
@@ -88,9 +103,119 @@ class FrameSupplier(Supplier):
         if not self.capture_device or not self.capture_device.isOpened():
             raise IOError(f"Cannot open capture device {self.capture_device}!")
 
-    def supply(self) -> np.ndarray:
-        ret, frame = self.capture_device.read()
-        return frame if ret else None
+        self.skipped = 0
+        self.__sequence = 0
+        self.__stopped = threading.Event()
+        self.__grabber = CaptureThread(self.capture_device).start() if background else None
+
+    def supply(self) -> Any:
+        if self.__grabber is None:
+            ret, frame = self.capture_device.read()
+            return frame if ret else None
+
+        grabbed, skipped = self.__grabber.take_latest(STOP_CHECK_INTERVAL)
+        while grabbed is None:
+            # without frames from the device only stop ends the wait
+            if self.__stopped.is_set():
+                return None
+            grabbed, skipped = self.__grabber.take_latest(STOP_CHECK_INTERVAL)
+        self.skipped += skipped
+        self.__sequence += 1
+        return Envelope.capture(
+            grabbed.frame,
+            self.__sequence - 1,
+            captured_at=time.time() - (time.monotonic() - grabbed.timestamp),
+            captured_monotonic=grabbed.timestamp,
+            skipped=skipped,
+        )
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__grabber is not None:
+            self.__grabber.stop()
+        else:
+            self.capture_device.release()
+
+
+class SynchronizedStereoSupplier(Supplier):
+    """Captures two devices concurrently and pairs their frames by timestamp.
+
+    Each device is drained by its own ``CaptureThread``. A pair is formed from
+    the frames closest in time, if they are at most ``tolerance`` seconds apart;
+    frames without a partner are dropped. With ``use_device_time`` the pairing
+    uses ``CAP_PROP_POS_MSEC`` of the devices instead of the grab time.
+    """
+
+    def __init__(self, left_device, right_device, resolution: Union[None, Tuple[int, int]] = None,
+                 tolerance: float = 0.008, use_device_time: bool = False, buffer_size: int = 4):
+        super().__init__()
+        self.tolerance = tolerance
+        self.use_device_time = use_device_time
+        self.dropped = 0
+        self.__sequence = 0
+        self.__changed = threading.Condition()
+        self.__stopped = threading.Event()
+        self.__grabbers = []
+        for device, name in ((left_device, "left"), (right_device, "right")):
+            capture = cv2.VideoCapture(device) if isinstance(device, int) else device
+            if resolution is not None:
+                width, height = resolution
+                capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            if not capture or not capture.isOpened():
+                raise IOError(f"Cannot open capture device {device}!")
+            self.__grabbers.append(CaptureThread(capture, buffer_size, name, self.__changed))
+        self.__started = False
+
+    def __time(self, grabbed: GrabbedFrame) -> float:
+        return grabbed.device_msec / 1e3 if self.use_device_time else grabbed.timestamp
+
+    def __pair(self) -> Optional[Tuple[GrabbedFrame, GrabbedFrame]]:
+        left, right = self.__grabbers
+        while True:
+            left_frames, right_frames = left.peek(), right.peek()
+            if not left_frames or not right_frames:
+                return None
+            offset = self.__time(left_frames[0]) - self.__time(right_frames[0])
+            # a later frame of the other device may still be a closer partner
+            if offset < 0 and len(left_frames) > 1 and \
+                    abs(self.__time(left_frames[1]) - self.__time(right_frames[0])) < -offset:
+                offset = -np.inf
+            elif offset > 0 and len(right_frames) > 1 and \
+                    abs(self.__time(left_frames[0]) - self.__time(right_frames[1])) < offset:
+                offset = np.inf
+            if abs(offset) <= self.tolerance:
+                return left.pop_oldest(), right.pop_oldest()
+            # the older frame can not be matched by any later frame anymore
+            (left if offset < 0 else right).pop_oldest()
+            self.dropped += 1
+
+    def supply(self) -> Any:
+        if not self.__started:
+            for grabber in self.__grabbers:
+                grabber.start()
+            self.__started = True
+
+        with self.__changed:
+            pair = self.__pair()
+            while pair is None:
+                # a device that stopped delivering must not keep the pipeline from stopping
+                if self.__stopped.is_set():
+                    return None
+                self.__changed.wait(STOP_CHECK_INTERVAL)
+                pair = self.__pair()
+        left, right = pair
+        self.__sequence += 1
+        return Envelope.capture(
+            (left.frame, right.frame),
+            self.__sequence - 1,
+            captured_at=time.time() - (time.monotonic() - min(left.timestamp, right.timestamp)),
+            captured_monotonic=min(left.timestamp, right.timestamp),
+        )
 
     def stop(self):
-        self.capture_device.release()
+        with self.__changed:
+            self.__stopped.set()
+            self.__changed.notify_all()
+        for grabber in self.__grabbers:
+            grabber.stop()
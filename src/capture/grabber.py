@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class GrabbedFrame:
+    frame: np.ndarray
+    # monotonic time right after the grab, i.e. close to the end of the exposure
+    timestamp: float
+    # position reported by the device, 0 for most webcams
+    device_msec: float
+
+
+class CaptureThread:
+    """Continuously drains a capture device on its own thread.
+
+    ``grab()`` and ``retrieve()`` are called separately so that the timestamp is
+    taken as close to the capture as possible and not after the decoding. The
+    newest ``buffer_size`` frames are kept, older ones are counted as skipped.
+    Several threads may share one ``condition`` to wait for any of them.
+    """
+
+    def __init__(self, capture: cv2.VideoCapture, buffer_size: int = 1, name: str = "capture",
+                 condition: Optional[threading.Condition] = None):
+        self.capture = capture
+        self.__frames = deque(maxlen=buffer_size)
+        self.__changed = condition or threading.Condition()
+        self.__skipped = 0
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__loop, name=name, daemon=True)
+
+    def start(self) -> 'CaptureThread':
+        self.__thread.start()
+        return self
+
+    def __loop(self):
+        while not self.__stopped.is_set():
+            if not self.capture.grab():
+                # device gone or end of a file, keep the thread cheap until stopped
+                self.__stopped.wait(0.01)
+                continue
+            timestamp = time.monotonic()
+            device_msec = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+            ok, frame = self.capture.retrieve()
+            if not ok:
+                continue
+            with self.__changed:
+                if len(self.__frames) == self.__frames.maxlen:
+                    self.__skipped += 1
+                self.__frames.append(GrabbedFrame(frame, timestamp, device_msec))
+                self.__changed.notify_all()
+
+    def take_latest(self, timeout: Optional[float] = None) -> Tuple[Optional[GrabbedFrame], int]:
+        """Newest frame and the number of frames skipped since the previous call."""
+        with self.__changed:
+            if not self.__changed.wait_for(lambda: len(self.__frames) > 0, timeout):
+                return None, 0
+            skipped = self.__skipped + len(self.__frames) - 1
+            frame = self.__frames.pop()
+            self.__frames.clear()
+            self.__skipped = 0
+            return frame, skipped
+
+    def peek(self) -> List[GrabbedFrame]:
+        """Buffered frames, oldest first."""
+        with self.__changed:
+            return list(self.__frames)
+
+    def pop_oldest(self) -> Optional[GrabbedFrame]:
+        with self.__changed:
+            return self.__frames.popleft() if self.__frames else None
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.__thread.join(timeout=1.0)
+        self.capture.release()
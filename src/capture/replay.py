@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+
+from pipeline.envelope import Envelope
+from pipeline.pipeline import Consumer, Supplier
+
+FRAMES_FILE = "frames.raw"
+META_FILE = "meta.json"
+TIMESTAMPS_FILE = "timestamps.npy"
+
+
+class SessionRecorder(Consumer):
+    """Records the frames reaching it into a session directory for ``ReplaySupplier``.
+
+    ``frames.raw`` holds the raw frames back to back, ``meta.json`` their shape
+    and dtype and ``timestamps.npy`` the monotonic capture time of each frame.
+    Stereo pairs are stored as one frame of both eyes stacked. All frames of a
+    session must have the same shape.
+    """
+
+    wants_envelope = True
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.count = 0
+        self.__file = None
+        self.__shape = None
+        self.__timestamps = []
+        # the pipeline stops components while their stage may still be running
+        self.__lock = threading.Lock()
+        self.__closed = False
+
+    def consume(self, envelope):
+        payload = envelope.payload
+        if payload is None:
+            return
+        stereo = isinstance(payload, tuple)
+        frame = np.stack(payload) if stereo else np.ascontiguousarray(payload)
+        with self.__lock:
+            if self.__closed:
+                return
+            if self.__file is None:
+                self.__open(frame, stereo)
+            elif frame.shape != self.__shape:
+                raise ValueError(f"Frame of shape {frame.shape} in a session of {self.__shape}")
+            self.__file.write(frame.data)
+            self.__timestamps.append(envelope.captured_monotonic)
+            self.count += 1
+
+    def __open(self, frame: np.ndarray, stereo: bool) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.__shape = frame.shape
+        with open(os.path.join(self.directory, META_FILE), "w") as file:
+            json.dump({"shape": list(frame.shape), "dtype": frame.dtype.str, "stereo": stereo}, file)
+        self.__file = open(os.path.join(self.directory, FRAMES_FILE), "wb")
+
+    def stop(self) -> None:
+        with self.__lock:
+            self.__closed = True
+            if self.__file is None:
+                return
+            self.__file.close()
+            np.save(os.path.join(self.directory, TIMESTAMPS_FILE), np.array(self.__timestamps))
+
+
+class ReplaySupplier(Supplier):
+    """Replays a session of ``SessionRecorder`` or a video file.
+
+    Raw sessions are memory mapped and handed out without copying. By default
+    frames are supplied as fast as the pipeline takes them, for throughput
+    measurements; with ``realtime`` they are released at their recorded
+    timestamps divided by ``speed``, for latency measurements. A video file is
+    paced by a ``timestamps.npy`` next to it or by its frame rate.
+
+    The capture time of a supplied envelope is the moment the frame is released.
+    Without ``loop`` the supplier sets ``finished`` after the last frame and
+    then blocks until stopped.
+    """
+
+    def __init__(self, path: str, realtime: bool = False, speed: float = 1.0, loop: bool = False):
+        super().__init__()
+        self.path = path
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.finished = threading.Event()
+        self.__stopped = threading.Event()
+        self.__index = 0
+        self.__sequence = 0
+        self.__frames: Optional[np.ndarray] = None
+        self.__video: Optional[cv2.VideoCapture] = None
+        self.__stereo = False
+        self.__start: Optional[float] = None
+
+        if os.path.isdir(path):
+            with open(os.path.join(path, META_FILE)) as file:
+                meta = json.load(file)
+            shape, dtype = tuple(meta["shape"]), np.dtype(meta["dtype"])
+            frame_bytes = int(np.prod(shape)) * dtype.itemsize
+            # the file size rather than the meta data, a recording may have been cut short
+            count = os.path.getsize(os.path.join(path, FRAMES_FILE)) // frame_bytes
+            self.__frames = np.memmap(os.path.join(path, FRAMES_FILE), dtype=dtype, mode="r",
+                                      shape=(count,) + shape)
+            self.__stereo = meta["stereo"]
+            self.timestamps = self.__load_timestamps(os.path.join(path, TIMESTAMPS_FILE), count)
+        else:
+            self.__video = cv2.VideoCapture(path)
+            if not self.__video.isOpened():
+                raise IOError(f"Cannot open video {path}!")
+            count = int(self.__video.get(cv2.CAP_PROP_FRAME_COUNT))
+            sidecar = os.path.join(os.path.dirname(path), TIMESTAMPS_FILE)
+            self.timestamps = self.__load_timestamps(sidecar, count)
+            if self.timestamps is None:
+                fps = self.__video.get(cv2.CAP_PROP_FPS) or 30.0
+                self.timestamps = np.arange(count) / fps
+        self.frame_count = count
+
+    @staticmethod
+    def __load_timestamps(path: str, count: int) -> Optional[np.ndarray]:
+        if not os.path.exists(path):
+            return None
+        timestamps = np.load(path)[:count]
+        return timestamps - timestamps[0] if len(timestamps) else timestamps
+
+    def __read(self) -> Any:
+        if self.__frames is not None:
+            frame = self.__frames[self.__index]
+            return (frame[0], frame[1]) if self.__stereo else frame
+        ok, frame = self.__video.read()
+        return frame if ok else None
+
+    def __rewind(self) -> None:
+        self.__index = 0
+        self.__start = None
+        if self.__video is not None:
+            self.__video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def supply(self) -> Any:
+        if self.__index >= self.frame_count and self.loop:
+            self.__rewind()
+        frame = self.__read() if self.__index < self.frame_count else None
+        if frame is None:
+            self.finished.set()
+            self.__stopped.wait()
+            return None
+
+        if self.realtime and self.timestamps is not None and len(self.timestamps) > self.__index:
+            if self.__start is None:
+                self.__start = time.monotonic()
+            due = self.__start + self.timestamps[self.__index] / self.speed
+            # sleeping only until shortly before and spinning the rest keeps the release precise
+            remaining = due - time.monotonic()
+            if remaining > 0.002:
+                self.__stopped.wait(remaining - 0.002)
+            while time.monotonic() < due and not self.__stopped.is_set():
+                pass
+            if self.__stopped.is_set():
+                # the pipeline drops whatever is supplied after stop
+                return None
+
+        self.__index += 1
+        self.__sequence += 1
+        return Envelope.capture(frame, self.__sequence - 1)
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__video is not None:
+            self.__video.release()
@@ -4,13 +4,16 @@ Created on Sat Jun 17 14:45:13 2023
 
 @author: Franz Ostler
 """
-import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from calibrate import kalibriere_kamera, kalibriere_beide_Kameras
+from stereo.parameter_store import save_parameters
 
 matrix1, distkoeff1, bildpt1 = kalibriere_kamera()
 transl2, rot2 = kalibriere_beide_Kameras(matrix1, distkoeff1, bildpt1)
 
-np.savetxt("intrinsische_matrix_left_camera.txt", matrix1)
-np.savetxt("translationsvektor_right_camera.txt", transl2)
-np.savetxt("rotationsvektor_right_camera.txt", rot2)
\ No newline at end of file
+# eine binäre Datei statt einzelner Textdateien, siehe stereo/parameter_store.py
+save_parameters("calibration_parameters.npz", K1=matrix1, D1=distkoeff1, R=rot2, T=transl2)
\ No newline at end of file
@@ -0,0 +1,186 @@
+import argparse
+import glob
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from stereo.parameter_store import save_parameters
+from stereo.rectify import StereoCalibration, StereoRectification
+
+# inner corners of the 8x8 board used for the rigs
+PATTERN_SIZE = (7, 7)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ball_motion", "corners")
+DETECTION_FLAGS = cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE
+SUBPIX_WINDOW = (11, 11)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 1e-3)
+
+
+@dataclass
+class CornerResult:
+    # image path of the left view, or of both views side by side if there is no right path
+    left_path: str
+    right_path: Optional[str]
+    # width, height of a single view
+    image_size: Tuple[int, int]
+    left_corners: Optional[np.ndarray]
+    right_corners: Optional[np.ndarray]
+
+    @property
+    def found(self) -> bool:
+        return self.left_corners is not None and self.right_corners is not None
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def find_corners(gray: np.ndarray, pattern_size: Tuple[int, int]) -> Optional[np.ndarray]:
+    found, corners = cv2.findChessboardCorners(gray, pattern_size, flags=DETECTION_FLAGS)
+    if not found:
+        return None
+    return cv2.cornerSubPix(gray, corners, SUBPIX_WINDOW, (-1, -1), SUBPIX_CRITERIA)
+
+
+def detect_pair(left_path: str, right_path: Optional[str] = None,
+                pattern_size: Tuple[int, int] = PATTERN_SIZE,
+                cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> CornerResult:
+    """Refined chessboard corners of both views of one stereo pair.
+
+    Without ``right_path`` the left image holds both views side by side as
+    delivered by the stereo camera. Results are cached under the hash of the
+    image files, so only new or changed images are processed again.
+    """
+    side_by_side = right_path is None
+    digests = [file_digest(path) for path in (left_path, right_path) if path is not None]
+    key = "_".join(digests + ["x".join(str(i) for i in pattern_size)])
+    cache_path = os.path.join(cache_dir, f"{key}.npz") if cache_dir is not None else None
+    if cache_path is not None and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            corners = [data[name] if name in data else None for name in ("left", "right")]
+            return CornerResult(left_path, right_path, tuple(int(i) for i in data["image_size"]), *corners)
+
+    if side_by_side:
+        image = cv2.imread(left_path, cv2.IMREAD_GRAYSCALE)
+        half = image.shape[1] // 2
+        views = [image[:, :half], image[:, half:]]
+    else:
+        views = [cv2.imread(path, cv2.IMREAD_GRAYSCALE) for path in (left_path, right_path)]
+    image_size = (views[0].shape[1], views[0].shape[0])
+    corners = [find_corners(np.ascontiguousarray(view), pattern_size) for view in views]
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = {name: c for name, c in zip(("left", "right"), corners) if c is not None}
+        temporary = f"{cache_path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, image_size=np.array(image_size), **arrays)
+        os.replace(temporary, cache_path)
+    return CornerResult(left_path, right_path, image_size, *corners)
+
+
+def _detect_pair(args) -> CornerResult:
+    return detect_pair(*args)
+
+
+def detect_all(pairs: Sequence[Tuple[str, Optional[str]]], pattern_size: Tuple[int, int] = PATTERN_SIZE,
+               cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+               workers: Optional[int] = None) -> List[CornerResult]:
+    """Runs ``detect_pair`` for all pairs on a pool of ``workers`` processes."""
+    jobs = [(left, right, pattern_size, cache_dir) for left, right in pairs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_detect_pair, jobs))
+
+
+def board_points(pattern_size: Tuple[int, int] = PATTERN_SIZE, square_size: float = 1.0) -> np.ndarray:
+    """3D corner coordinates in the plane of the board, in units of ``square_size``."""
+    points = np.zeros((pattern_size[0] * pattern_size[1], 3), dtype=np.float32)
+    points[:, :2] = np.mgrid[0:pattern_size[0], 0:pattern_size[1]].T.reshape(-1, 2) * square_size
+    return points
+
+
+def calibrate(results: Sequence[CornerResult], pattern_size: Tuple[int, int] = PATTERN_SIZE,
+              square_size: float = 1.0) -> Tuple[StereoCalibration, dict]:
+    """Calibrates both cameras on their own and then their relative pose.
+
+    Returns the calibration and the RMS reprojection errors in pixels.
+    """
+    usable = [result for result in results if result.found]
+    if not usable:
+        raise ValueError("The chessboard was not found in both views of any image")
+    image_size = usable[0].image_size
+    object_points = [board_points(pattern_size, square_size)] * len(usable)
+    left_points = [result.left_corners for result in usable]
+    right_points = [result.right_corners for result in usable]
+
+    rms_left, left_matrix, left_distortion, _, _ = cv2.calibrateCamera(
+        object_points, left_points, image_size, None, None
+    )
+    rms_right, right_matrix, right_distortion, _, _ = cv2.calibrateCamera(
+        object_points, right_points, image_size, None, None
+    )
+    rms_stereo, left_matrix, left_distortion, right_matrix, right_distortion, rotation, translation, _, _ = \
+        cv2.stereoCalibrate(
+            object_points, left_points, right_points,
+            left_matrix, left_distortion, right_matrix, right_distortion, image_size,
+            flags=cv2.CALIB_FIX_INTRINSIC,
+        )
+    calibration = StereoCalibration(
+        left_matrix, left_distortion, right_matrix, right_distortion,
+        rotation, translation, image_size,
+    )
+    errors = {"left": rms_left, "right": rms_right, "stereo": rms_stereo, "pairs": len(usable)}
+    return calibration, errors
+
+
+def save(path: str, calibration: StereoCalibration, errors: dict, alpha: float = 0.0) -> None:
+    """Writes the calibration together with its rectification and remap tables into
+    a parameter store, see ``StereoRectification.load``."""
+    rectification = StereoRectification(calibration, alpha, cache_dir=None)
+    save_parameters(
+        path,
+        **calibration.parameters(),
+        **rectification.parameters(),
+        **{f"rms_{name}": np.array(value) for name, value in errors.items()},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stereo calibration from chessboard images.")
+    parser.add_argument("images", nargs="*", help="side by side stereo images")
+    parser.add_argument("--left", help="directory of left images, paired by file name with --right")
+    parser.add_argument("--right", help="directory of right images")
+    parser.add_argument("--pattern", type=int, nargs=2, default=PATTERN_SIZE, help="inner corners")
+    parser.add_argument("--square-size", type=float, default=1.0, help="edge of a square in mm")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=DEFAULT_CACHE_DIR, help="corner cache directory")
+    parser.add_argument("--alpha", type=float, default=0.0, help="free scaling of the rectification")
+    parser.add_argument("--output", default="stereo_calibration.npz")
+    args = parser.parse_args()
+
+    if args.left and args.right:
+        names = sorted(os.listdir(args.left))
+        pairs = [(os.path.join(args.left, name), os.path.join(args.right, name))
+                 for name in names if os.path.exists(os.path.join(args.right, name))]
+    else:
+        paths = sorted(path for pattern in args.images for path in glob.glob(pattern))
+        pairs = [(path, None) for path in paths]
+
+    results = detect_all(pairs, tuple(args.pattern), args.cache, args.workers)
+    for result in results:
+        if not result.found:
+            print("Chessboard not found in", result.left_path)
+    calibration, errors = calibrate(results, tuple(args.pattern), args.square_size)
+    save(args.output, calibration, errors, args.alpha)
+    print("RMS reprojection errors:", errors)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import time
 import cv2
 
 from pipeline.pipeline import Consumer, Pipeline, Supplier
+from visualization.frame_viewer import DebugViewer, FrameViewer
 
 
 class DebugCamSupplier(Supplier):
@@ -15,16 +16,6 @@ class DebugCamSupplier(Supplier):
         return frame
 
 
-class DebugCamImageDisplay(Consumer):
-    def __init__(self, name):
-        super().__init__()
-        self.name = name
-
-    def consume(self, image):
-        cv2.imshow(self.name, image)
-        cv2.waitKey(1)
-
-
 class ResultPrinter(Consumer):
 
     def __init__(self):
@@ -43,7 +34,7 @@ def main():
     pipe = (
         Pipeline.builder()
         .add(DebugCamSupplier(cam))
-        .add(DebugCamImageDisplay("cam1"))
+        .add(FrameViewer(DebugViewer(rate=30.0), "cam1"))
         .build()
     )
     pipe.run()
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+class RespStandInServer:
+    """Tiny in-memory stand-in for a Redis server, enough to try out the broadcasters.
+
+    Understands HELLO, PING, PUBLISH, SUBSCRIBE, XADD with MAXLEN, XLEN and XRANGE
+    over RESP2 and the parts of RESP3 they need, and records everything published
+    in ``published`` and ``streams``. Runs its own event loop thread, ``port=0`` picks a free port.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.published: List[Tuple[bytes, bytes]] = []
+        self.streams: Dict[bytes, List[Tuple[bytes, List[bytes]]]] = defaultdict(list)
+        self.commands = 0
+        self.__subscribers: Dict[bytes, List[asyncio.StreamWriter]] = defaultdict(list)
+        # RESP version of every open connection
+        self.__protocols: Dict[asyncio.StreamWriter, int] = {}
+        self.__last_id = (0, 0)
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__server = None
+        self.__thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'RespStandInServer':
+        started = threading.Event()
+
+        def run():
+            self.__loop = asyncio.new_event_loop()
+            self.__server = self.__loop.run_until_complete(
+                asyncio.start_server(self.__serve, self.host, self.port)
+            )
+            self.port = self.__server.sockets[0].getsockname()[1]
+            started.set()
+            self.__loop.run_forever()
+
+        self.__thread = threading.Thread(target=run, name="resp-stand-in", daemon=True)
+        self.__thread.start()
+        started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self.__loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.__shutdown(), self.__loop).result(timeout=1.0)
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join(timeout=1.0)
+
+    async def __shutdown(self) -> None:
+        self.__server.close()
+        # closing the connections lets their handlers run out instead of cancelling them
+        for writer in list(self.__protocols):
+            writer.close()
+        current = asyncio.current_task()
+        await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not current),
+                             return_exceptions=True)
+
+    @staticmethod
+    async def __read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # inline command as typed into telnet
+            return line.split()
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    def __push(self, writer: asyncio.StreamWriter, values: list) -> bytes:
+        # out of band messages are a push type in RESP3
+        encoded = self.encode(values)
+        return b">" + encoded[1:] if self.__protocols[writer] == 3 else encoded
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, (bytes, str)):
+            value = value.encode() if isinstance(value, str) else value
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        return b"*%d\r\n" % len(value) + b"".join(RespStandInServer.encode(item) for item in value)
+
+    async def __serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__protocols[writer] = 2
+        try:
+            while True:
+                command = await self.__read_command(reader)
+                if command is None:
+                    break
+                if not command:
+                    continue
+                self.commands += 1
+                writer.write(self.__execute(command, writer))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.__protocols.pop(writer, None)
+            for writers in self.__subscribers.values():
+                if writer in writers:
+                    writers.remove(writer)
+            writer.close()
+
+    def __execute(self, command: List[bytes], writer: asyncio.StreamWriter) -> bytes:
+        name, arguments = command[0].upper(), command[1:]
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"HELLO":
+            protocol = int(arguments[0]) if arguments else 2
+            self.__protocols[writer] = protocol
+            info = [b"server", b"redis", b"version", b"7.0.0", b"proto", protocol, b"mode", b"standalone"]
+            if protocol == 3:
+                return b"%%%d\r\n" % (len(info) // 2) + b"".join(self.encode(item) for item in info)
+            return self.encode(info)
+        if name in (b"CLIENT", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"PUBLISH":
+            channel, message = arguments
+            self.published.append((channel, message))
+            subscribers = self.__subscribers[channel]
+            for subscriber in subscribers:
+                subscriber.write(self.__push(subscriber, [b"message", channel, message]))
+            return self.encode(len(subscribers))
+        if name == b"SUBSCRIBE":
+            replies = []
+            for count, channel in enumerate(arguments, 1):
+                self.__subscribers[channel].append(writer)
+                replies.append(self.__push(writer, [b"subscribe", channel, count]))
+            return b"".join(replies)
+        if name == b"XADD":
+            return self.__xadd(arguments)
+        if name == b"XLEN":
+            return self.encode(len(self.streams.get(arguments[0], [])))
+        if name == b"XRANGE":
+            entries = self.streams.get(arguments[0], [])
+            if len(arguments) >= 5 and arguments[3].upper() == b"COUNT":
+                entries = entries[:int(arguments[4])]
+            return self.encode([[entry_id, fields] for entry_id, fields in entries])
+        return b"-ERR unknown command '%s'\r\n" % command[0]
+
+    def __xadd(self, arguments: List[bytes]) -> bytes:
+        key, arguments = arguments[0], arguments[1:]
+        maxlen = None
+        if arguments[0].upper() == b"MAXLEN":
+            arguments = arguments[1:]
+            if arguments[0] in (b"~", b"="):
+                arguments = arguments[1:]
+            maxlen, arguments = int(arguments[0]), arguments[1:]
+        entry_id, fields = arguments[0], arguments[1:]
+        if entry_id == b"*":
+            milliseconds = int(time.time() * 1000)
+            sequence = self.__last_id[1] + 1 if milliseconds <= self.__last_id[0] else 0
+            self.__last_id = (max(milliseconds, self.__last_id[0]), sequence)
+            entry_id = b"%d-%d" % self.__last_id
+        stream = self.streams[key]
+        stream.append((entry_id, fields))
+        if maxlen is not None and len(stream) > maxlen:
+            del stream[:len(stream) - maxlen]
+        return self.encode(entry_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Redis stand-in for broadcast tests.")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RespStandInServer(port=args.port).start()
+    print("Listening on port", server.port)
+    try:
+        while True:
+            time.sleep(1.0)
+            print(len(server.published), "published,",
+                  {key.decode(): len(entries) for key, entries in server.streams.items()})
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,12 +1,57 @@
-from typing import List, Optional, Union, Tuple
+from typing import List, NamedTuple, Optional, Union, Tuple
 
 import cv2
 import numpy as np
-from numpy import ndarray
 
+from detection.lut_classifier import LabLutClassifier
 from pipeline.pipeline import Mapper
 
 
+def axes_eccentricity(first_axis: float, second_axis: float) -> float:
+    """Eccentricity of an ellipse from its axes in either order, 0 for a point."""
+    minor, major = sorted((first_axis, second_axis))
+    if major <= 0:
+        return 0.0
+    return float(np.sqrt(1 - (minor / major) ** 2))
+
+
+class Detection(NamedTuple):
+    """What ``ColorSegmenter`` passes on for a found ball: the fitted ellipse and
+    the area of its contour, a few numbers instead of images. The overlay is
+    only rendered when ``draw`` is called."""
+
+    center: Tuple[float, float]
+    axes: Tuple[float, float]
+    angle: float
+    area: float
+
+    @property
+    def radius(self) -> float:
+        return (self.axes[0] + self.axes[1]) / 4
+
+    @property
+    def eccentricity(self) -> float:
+        return axes_eccentricity(*self.axes)
+
+    def draw(self, image: np.ndarray) -> np.ndarray:
+        radius = self.radius
+        circ_area = np.pi * radius ** 2
+        # a degenerate contour has no area to relate the error to
+        rel_error = (self.area - circ_area) / self.area if self.area > 0 else float("nan")
+        cv2.ellipse(image, (self.center, self.axes, self.angle), (0, 255, 0), 2)
+        cv2.circle(image, tuple(int(i) for i in self.center), 6, (0, 0, 255), -1)
+
+        lines = (
+            f"Radius: {radius:.2f}, Eccentricity: {self.eccentricity:.2f},",
+            f"Cnt Area: {self.area:.2f}, Circ Area: {circ_area:.2f}",
+            f"Rel Error: {rel_error:.2%}",
+        )
+        for i, text in enumerate(lines):
+            cv2.putText(image, text, (10, 20 + 15 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (255, 255, 255), 1, cv2.LINE_AA)
+        return image
+
+
 class Ellipse:
     def __init__(self, cnt: np.ndarray, eccentricity_treshold: float = 0.9) -> None:
         self.ellipse = cv2.fitEllipse(cnt)
@@ -47,57 +92,76 @@ class Ellipse:
 
     def get_eccentricity(self) -> float:
         if self.eccentricity is None:
-            self.eccentricity = np.sqrt(1 - (self.major_axis / self.minor_axis) ** 2)
+            self.eccentricity = axes_eccentricity(self.major_axis, self.minor_axis)
         return self.eccentricity
 
+    def to_detection(self) -> Detection:
+        return Detection(self.center, self.ellipse[1], self.angle, self.cnt_area)
+
     def draw(self, image: np.ndarray) -> np.ndarray:
         if self.get_eccentricity() > self.eccentricity_treshold:
             return image
-        # color_image = cv2.cvtColor(binary_image, cv2.COLOR_GRAY2BGR)
-        cv2.ellipse(image, self.ellipse, (0, 255, 0), 2)
-        cv2.circle(image, tuple(int(i) for i in self.center), 6, (0, 0, 255), -1)
+        return self.to_detection().draw(image)
 
-        textA = f"Radius: {self.get_radius():.2f}, Eccentricity: {self.get_eccentricity():.2f},"
-        textB = f"Cnt Area: {self.cnt_area:.2f}, Circ Area: {self.get_circ_area():.2f}"
-        textC = f"Rel Error: {self.get_rel_area_error():.2%}"
-
-        cv2.putText(
-            image,
-            textA,
-            (10, 20),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (255, 255, 255),
-            1,
-            cv2.LINE_AA,
-        )
 
-        cv2.putText(
-            image,
-            textB,
-            (10, 35),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (255, 255, 255),
-            1,
-            cv2.LINE_AA,
-        )
+def draw_detections(image: np.ndarray, detections: List[Detection]) -> np.ndarray:
+    for detection in detections:
+        detection.draw(image)
+    return image
 
-        cv2.putText(
-            image,
-            textC,
-            (10, 50),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (255, 255, 255),
-            1,
-            cv2.LINE_AA,
-        )
 
-        return image
+def equalization_lut(channel: np.ndarray) -> np.ndarray:
+    """Lookup table that performs the histogram equalization of ``channel`` like
+    ``cv2.equalizeHist``, so it can be applied to other images of the same scene."""
+    hist = np.bincount(channel.ravel(), minlength=256)
+    cdf = np.cumsum(hist)
+    first = hist[np.flatnonzero(hist)[0]]
+    if cdf[-1] == first:
+        return np.arange(256, dtype=np.uint8)
+    lut = np.round((cdf - first) * 255.0 / (cdf[-1] - first))
+    return np.clip(lut, 0, 255).astype(np.uint8)
 
 
 class ColorSegmenter(Mapper):
+    """Segments the ball by its LAB color and fits an ellipse to the largest blob.
+
+    With ``track`` only a window around the position predicted from the last two
+    detections is processed; the window is ``roi_padding`` ball radii plus the
+    last displacement wide on every side. The full frame is searched again as
+    soon as the ball is lost. Tracking relies on seeing the frames in order, so a
+    tracking segmenter should not be spread over several workers.
+
+    With ``pyramid_levels`` a full frame search first thresholds a frame that was
+    halved that many times and then fits the ellipse at full resolution only
+    inside the bounding boxes of the ``max_candidates`` largest coarse blobs.
+    The opening of the coarse frame removes blobs narrower than the structuring
+    element, so the ball has to be about ``morph_ksize * 2**pyramid_levels``
+    pixels wide to be found.
+
+    ``classifier="lut"`` replaces the LAB conversion and ``inRange`` by a lookup
+    table over ``lut_bits`` bits per BGR channel, see ``LabLutClassifier``; the
+    blur is then applied to the binary mask instead of the LAB frame.
+
+    With ``max_objects`` above one every blob of the full frame is a candidate:
+    the area, circularity (4 pi area / perimeter^2) and eccentricity of all
+    contours are tested at once from their moments and ``map`` returns a list
+    of up to ``max_objects`` Detections, largest first. Tracking windows and the
+    pyramid search follow a single ball and can not be combined with it.
+
+    ``map`` returns a ``Detection`` or None, no images leave the stage. All
+    images, the binary one included, live in scratch arrays that are reused for
+    every frame. The annotated frame and the mask are only rendered for an
+    attached observer, see ``PipelineComponent.observe``.
+    """
+
+    # the histogram equalization of a window uses the histogram of every n-th pixel of the frame
+    EQUALIZATION_SUBSAMPLING = 8
+    MIN_ROI_HALF_SIZE = 32
+    # windows larger than this fraction of the frame are not worth the bookkeeping
+    MAX_ROI_FRACTION = 0.5
+    # window sizes change from frame to frame, only the most recent scratch arrays are kept
+    MAX_SCRATCH_ARRAYS = 16
+
     def __init__(
             self,
             base_color: List[int],
@@ -105,63 +169,266 @@ class ColorSegmenter(Mapper):
             morph_ksize: int = 5,
             blur_ksize: int = 11,
             blur_sigma: int = 3,
+            track: bool = False,
+            roi_padding: float = 3.0,
+            pyramid_levels: int = 0,
+            max_candidates: int = 3,
+            classifier: str = "lab",
+            lut_bits: int = 5,
+            max_objects: int = 1,
+            min_area: float = 20.0,
+            min_circularity: float = 0.6,
+            max_eccentricity: float = 0.9,
     ) -> None:
         super(ColorSegmenter, self).__init__()
+        if max_objects > 1 and (track or pyramid_levels > 0):
+            raise ValueError("track and pyramid_levels only work with max_objects=1")
         self.blur_ksize = blur_ksize
         self.blur_sigma = blur_sigma
 
+        self.track = track
+        self.roi_padding = roi_padding
+        self.pyramid_levels = pyramid_levels
+        self.max_candidates = max_candidates
+        self.max_objects = max_objects
+        self.min_area = min_area
+        self.min_circularity = min_circularity
+        self.max_eccentricity = max_eccentricity
+        self.opening_iterations = 6
+        self.__last_center: Optional[np.ndarray] = None
+        self.__velocity = np.zeros(2)
+        self.__last_radius = 0.0
+        self.__search_hint: Optional[np.ndarray] = None
+        self.__scratch = {}
+
         self.ellipses: List[Ellipse] = []
 
-        rel_tol = np.array(rel_tol, dtype=np.float32)
-        lab_color_range = np.array([255, 255, 255], dtype=np.uint8)
-        self.lower_bound = np.clip(
-            base_color - rel_tol * lab_color_range, a_min=0, a_max=lab_color_range
-        ).astype(np.uint8)
-        self.upper_bound = np.clip(
-            base_color + rel_tol * lab_color_range, a_min=0, a_max=lab_color_range
-        ).astype(np.uint8)
+        if classifier not in ("lab", "lut"):
+            raise ValueError(f"Unknown classifier {classifier}")
+        self.lut: Optional[LabLutClassifier] = None
+        self.rel_tol = None
+        self.set_color(base_color, rel_tol)
+        if classifier == "lut":
+            self.lut = LabLutClassifier(self.lower_bound, self.upper_bound, lut_bits)
 
         # Structuring element for morphological operations
         self.structuring_element = cv2.getStructuringElement(
             cv2.MORPH_ELLIPSE, (morph_ksize, morph_ksize)
         )
 
-    def map(self, frame: np.ndarray) -> tuple[ndarray, np.ndarray, np.ndarray, Optional[Ellipse]]:
-        binary_image = self.apply_color_thresholding(frame)
-        ellipse = self.detect_ellipse(binary_image)
-        circled = frame.copy()
-        if ellipse is not None:
-            circled = ellipse.draw(circled)
-        else:
-            circled = frame
-        return frame, circled, binary_image, ellipse
+    def set_color(self, base_color: List[int], rel_tol: Optional[List[float]] = None) -> None:
+        """Changes the segmented color, the tolerance is kept if not given."""
+        if rel_tol is not None:
+            self.rel_tol = np.array(rel_tol, dtype=np.float32)
+        lab_color_range = np.array([255, 255, 255], dtype=np.uint8)
+        self.lower_bound = np.clip(
+            base_color - self.rel_tol * lab_color_range, a_min=0, a_max=lab_color_range
+        ).astype(np.uint8)
+        self.upper_bound = np.clip(
+            base_color + self.rel_tol * lab_color_range, a_min=0, a_max=lab_color_range
+        ).astype(np.uint8)
+        if self.lut is not None:
+            self.lut.rebuild(self.lower_bound, self.upper_bound)
 
-    def apply_color_thresholding(self, frame: np.ndarray) -> np.ndarray:
-        lab_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+    def map(self, frame: np.ndarray) -> Union[Optional[Detection], List[Detection]]:
+        if self.max_objects > 1:
+            binary_image = self.apply_color_thresholding(frame)
+            detections = self.detect_candidates(binary_image)
+            self.observe(lambda: draw_detections(frame.copy(), detections))
+            self.observe(binary_image.copy, "mask")
+            return detections
+
+        binary_image, ellipse = None, None
+        roi = self.predict_roi(frame.shape) if self.track else None
+        if roi is not None:
+            binary_image, ellipse = self.detect_in_roi(frame, roi)
+        if ellipse is None and self.pyramid_levels > 0:
+            binary_image, ellipse = self.detect_coarse_to_fine(frame)
+        elif ellipse is None:
+            binary_image = self.apply_color_thresholding(frame)
+            ellipse = self.detect_ellipse(binary_image)
+        if self.track:
+            self.update_track(ellipse)
+
+        detection = ellipse.to_detection() if ellipse is not None else None
+        self.observe(lambda: frame.copy() if detection is None else detection.draw(frame.copy()))
+        self.observe(binary_image.copy, "mask")
+        return detection
+
+    def __workspace(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        key = (name, tuple(shape))
+        array = self.__scratch.pop(key, None)
+        if array is None:
+            array = np.empty(shape, dtype=np.uint8)
+            if len(self.__scratch) >= self.MAX_SCRATCH_ARRAYS:
+                del self.__scratch[next(iter(self.__scratch))]
+        # reinserting keeps the dict ordered from least to most recently used
+        self.__scratch[key] = array
+        return array
+
+    def set_search_hint(self, center: np.ndarray) -> None:
+        """Center of the next tracking window, e.g. predicted by a trajectory filter."""
+        self.__search_hint = np.asarray(center, dtype=np.float64)
+
+    def predict_roi(self, shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+        """Window (x0, y0, x1, y1) around the predicted ball position or None."""
+        hint, self.__search_hint = self.__search_hint, None
+        if hint is not None:
+            center = hint
+        elif self.__last_center is not None:
+            center = self.__last_center + self.__velocity
+        else:
+            return None
+        height, width = shape[:2]
+        half_size = max(
+            self.roi_padding * self.__last_radius + np.abs(self.__velocity).max(),
+            self.MIN_ROI_HALF_SIZE,
+        )
+        x0, y0 = np.maximum(np.floor(center - half_size), 0).astype(int)
+        x1, y1 = np.minimum(np.ceil(center + half_size), (width, height)).astype(int)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        if (x1 - x0) * (y1 - y0) > self.MAX_ROI_FRACTION * width * height:
+            return None
+        return x0, y0, x1, y1
+
+    def detect_in_roi(self, frame: np.ndarray, roi: Tuple[int, int, int, int]
+                      ) -> Tuple[np.ndarray, Optional[Ellipse]]:
+        x0, y0, x1, y1 = roi
+        # equalizing the window on its own would stretch the ball's colors, so the
+        # equalization is derived from the whole frame
+        lut = self.frame_equalization(frame)
+
+        binary_image = self.__workspace("binary", frame.shape[:2])
+        binary_image.fill(0)
+        roi_binary = self.apply_color_thresholding(
+            frame[y0:y1, x0:x1], lut, dst=binary_image[y0:y1, x0:x1]
+        )
+        return binary_image, self.detect_ellipse(roi_binary, offset=(x0, y0))
+
+    def detect_coarse_to_fine(self, frame: np.ndarray) -> Tuple[np.ndarray, Optional[Ellipse]]:
+        scale = 2 ** self.pyramid_levels
+        small = frame
+        for level in range(self.pyramid_levels):
+            height, width = small.shape[:2]
+            shape = ((height + 1) // 2, (width + 1) // 2, small.shape[2])
+            small = cv2.pyrDown(small, dst=self.__workspace(f"pyramid{level}", shape))
+
+        small_lab = cv2.cvtColor(
+            small, cv2.COLOR_BGR2LAB, dst=self.__workspace("small_lab", small.shape)
+        )
+        lut = equalization_lut(small_lab[:, :, 0])
+        coarse_binary = self.apply_color_thresholding(
+            small, lut, scale, dst=self.__workspace("coarse", small.shape[:2])
+        )
+        contours, _ = cv2.findContours(
+            coarse_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        contours = sorted(contours, key=cv2.contourArea, reverse=True)[: self.max_candidates]
+
+        height, width = frame.shape[:2]
+        # the full resolution blur and opening need some context around the blob
+        padding = scale + self.blur_ksize + self.opening_iterations * 2
+        binary_image = self.__workspace("binary", (height, width))
+        binary_image.fill(0)
+        best: Optional[Ellipse] = None
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            x0, y0 = max(x * scale - padding, 0), max(y * scale - padding, 0)
+            x1 = min((x + w) * scale + padding, width)
+            y1 = min((y + h) * scale + padding, height)
+            roi_binary = self.apply_color_thresholding(
+                frame[y0:y1, x0:x1], lut, dst=binary_image[y0:y1, x0:x1]
+            )
+            ellipse = self.detect_ellipse(roi_binary, offset=(x0, y0))
+            if ellipse is not None and (best is None or ellipse.cnt_area > best.cnt_area):
+                best = ellipse
+        return binary_image, best
+
+    def update_track(self, ellipse: Optional[Ellipse]) -> None:
+        if ellipse is None:
+            self.__last_center = None
+            self.__velocity = np.zeros(2)
+            return
+        center = np.array(ellipse.center, dtype=np.float64)
+        if self.__last_center is not None:
+            self.__velocity = center - self.__last_center
+        self.__last_center = center
+        self.__last_radius = ellipse.get_radius()
+
+    def frame_equalization(self, frame: np.ndarray) -> np.ndarray:
+        """Histogram equalization lookup table of the L channel from every n-th pixel."""
+        step = self.EQUALIZATION_SUBSAMPLING
+        sample = cv2.cvtColor(np.ascontiguousarray(frame[::step, ::step]), cv2.COLOR_BGR2LAB)
+        return equalization_lut(sample[:, :, 0])
+
+    def apply_color_thresholding(self, frame: np.ndarray,
+                                 equalization: Optional[np.ndarray] = None,
+                                 scale: int = 1,
+                                 dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """``scale`` shrinks the blur and opening for frames downscaled by that factor,
+        the result is written to ``dst`` if given, e.g. a window of a larger mask."""
+        blur_ksize = max(self.blur_ksize // scale, 1) | 1
+        blur_sigma = self.blur_sigma / scale
+        iterations = max(self.opening_iterations // scale, 1)
+        mask_shape = frame.shape[:2]
+        if dst is None:
+            dst = self.__workspace("binary", mask_shape)
+
+        if self.lut is not None:
+            if equalization is None and self.lut.can_equalize:
+                equalization = self.frame_equalization(frame)
+            # smoothing the single channel mask instead of the color frame is a third of the work
+            binary_image = self.lut.classify(
+                frame, equalization, dst=self.__workspace("mask", mask_shape)
+            )
+            binary_image = cv2.GaussianBlur(
+                binary_image,
+                ksize=(blur_ksize, blur_ksize),
+                sigmaX=blur_sigma,
+                sigmaY=blur_sigma,
+                dst=self.__workspace("blurred_mask", mask_shape),
+            )
+            cv2.threshold(binary_image, 127, 255, cv2.THRESH_BINARY, dst=binary_image)
+            return cv2.morphologyEx(
+                binary_image, cv2.MORPH_OPEN, self.structuring_element,
+                dst=dst, iterations=iterations
+            )
+
+        lab_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB, dst=self.__workspace("lab", frame.shape))
 
         # Perform histogram equalization on the V channel to improve contrast
-        lab_frame[:, :, 0] = cv2.equalizeHist(lab_frame[:, :, 0])
+        lightness = cv2.extractChannel(lab_frame, 0, dst=self.__workspace("lightness", mask_shape))
+        if equalization is None:
+            cv2.equalizeHist(lightness, dst=lightness)
+        else:
+            cv2.LUT(lightness, equalization, dst=lightness)
+        cv2.insertChannel(lightness, lab_frame, 0)
 
         lab_frame = cv2.GaussianBlur(
             lab_frame,
-            ksize=(self.blur_ksize, self.blur_ksize),
-            sigmaX=self.blur_sigma,
-            sigmaY=self.blur_sigma,
+            ksize=(blur_ksize, blur_ksize),
+            sigmaX=blur_sigma,
+            sigmaY=blur_sigma,
+            dst=self.__workspace("blurred", frame.shape),
         )
 
-        binary_image = cv2.inRange(lab_frame, self.lower_bound, self.upper_bound)
+        binary_image = cv2.inRange(
+            lab_frame, self.lower_bound, self.upper_bound, dst=self.__workspace("mask", mask_shape)
+        )
 
         # binary_image = cv2.medianBlur(binary_image, 5)
         # Perform opening
         binary_image = cv2.morphologyEx(
-            binary_image, cv2.MORPH_OPEN, self.structuring_element, iterations=6
+            binary_image, cv2.MORPH_OPEN, self.structuring_element, dst=dst, iterations=iterations
         )
 
         return binary_image
 
-    def detect_ellipse(self, binary_image: np.ndarray) -> Optional[Ellipse]:
+    def detect_ellipse(self, binary_image: np.ndarray,
+                       offset: Tuple[int, int] = (0, 0)) -> Optional[Ellipse]:
         contours, _ = cv2.findContours(
-            binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+            binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset
         )
         if not contours:
             return None
@@ -174,6 +441,39 @@ class ColorSegmenter(Mapper):
             return None
         return detected_ellipse
 
+    def detect_candidates(self, binary_image: np.ndarray) -> List[Detection]:
+        contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return []
+        # one call per contour to gather the moments, every test below runs on all of them at once
+        moments = np.array([
+            (m["m00"], m["m10"], m["m01"], m["mu20"], m["mu11"], m["mu02"])
+            for m in map(cv2.moments, contours)
+        ])
+        perimeters = np.array([cv2.arcLength(contour, True) for contour in contours])
+        area, m10, m01, mu20, mu11, mu02 = moments.T
+
+        valid = area >= max(self.min_area, 1e-9)
+        safe_area = np.where(valid, area, 1.0)
+        # covariance of the blob, its eigenvalues are a quarter of the squared semi axes
+        var_x, cov_xy, var_y = mu20 / safe_area, mu11 / safe_area, mu02 / safe_area
+        spread = np.sqrt(((var_x - var_y) / 2) ** 2 + cov_xy ** 2)
+        major = np.maximum((var_x + var_y) / 2 + spread, 0.0)
+        minor = np.maximum((var_x + var_y) / 2 - spread, 0.0)
+        eccentricity = np.sqrt(1 - minor / np.where(major > 0, major, 1.0))
+        circularity = 4 * np.pi * area / np.maximum(perimeters ** 2, 1e-9)
+        angle = np.degrees(0.5 * np.arctan2(2 * cov_xy, var_x - var_y))
+
+        keep = np.flatnonzero(valid & (circularity >= self.min_circularity)
+                              & (eccentricity <= self.max_eccentricity))
+        keep = keep[np.argsort(-area[keep], kind="stable")][:self.max_objects]
+        return [
+            Detection((float(m10[i] / area[i]), float(m01[i] / area[i])),
+                      (float(4 * np.sqrt(major[i])), float(4 * np.sqrt(minor[i]))),
+                      float(angle[i]), float(area[i]))
+            for i in keep
+        ]
+
     def generate_bin_img(self) -> None:
         cap = cv2.VideoCapture(0)
 
@@ -0,0 +1,95 @@
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+
+class LabLutClassifier:
+    """Classifies BGR pixels against a LAB color range with a single table lookup.
+
+    The LAB values of all ``2**bits`` cubed BGR bins are computed once. The
+    membership table derived from them is rebuilt when the color range changes
+    or, for tables of up to ``MAX_EQUALIZED_BITS`` bits, for every frame with the
+    histogram equalization of the L channel folded in, which only touches the
+    table and not the pixels. Larger tables skip the equalization, and the 8 bit
+    table takes more than a second to build.
+    """
+
+    MAX_EQUALIZED_BITS = 6
+
+    def __init__(self, lower_bound: np.ndarray, upper_bound: np.ndarray, bits: int = 5):
+        if not 1 <= bits <= 8:
+            raise ValueError("bits has to be between 1 and 8")
+        self.bits = bits
+        self.__shift = 8 - bits
+        bins = 1 << bits
+        # center of every bin, the full 8 bit table uses the values themselves
+        values = (np.arange(bins, dtype=np.uint16) << self.__shift) + ((1 << self.__shift) >> 1)
+        b, g, r = np.meshgrid(values, values, values, indexing="ij")
+        bgr = np.stack((b, g, r), axis=-1).astype(np.uint8).reshape(-1, 1, 3)
+        lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB).reshape(-1, 3)
+        self.__lightness = np.ascontiguousarray(lab[:, 0])
+        self.__chroma = np.ascontiguousarray(lab[:, 1:])
+        self.__lower = None
+        self.__upper = None
+        self.__chroma_table = None
+        self.__table = None
+        self.__planes: List[np.ndarray] = []
+        self.__index: Optional[np.ndarray] = None
+        self.rebuild(lower_bound, upper_bound)
+
+    @property
+    def can_equalize(self) -> bool:
+        return self.bits <= self.MAX_EQUALIZED_BITS
+
+    def rebuild(self, lower_bound: np.ndarray, upper_bound: np.ndarray) -> None:
+        self.__lower = np.asarray(lower_bound, dtype=np.uint8)
+        self.__upper = np.asarray(upper_bound, dtype=np.uint8)
+        inside = np.all((self.__chroma >= self.__lower[1:]) & (self.__chroma <= self.__upper[1:]), axis=1)
+        self.__chroma_table = np.where(inside, np.uint8(255), np.uint8(0))
+        self.__table = self.__membership(np.arange(256, dtype=np.uint8))
+
+    def __membership(self, equalization: np.ndarray) -> np.ndarray:
+        # the equalization only moves L, so per frame the range test of the 256 L
+        # values is combined with the A and B test that was done on rebuild
+        equalized = equalization.astype(np.uint8)
+        lightness = np.where((equalized >= self.__lower[0]) & (equalized <= self.__upper[0]),
+                             np.uint8(255), np.uint8(0))
+        table = np.take(lightness, self.__lightness)
+        table &= self.__chroma_table
+        return table
+
+    def classify(self, frame: np.ndarray, equalization: Optional[np.ndarray] = None,
+                 dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """Binary image of the pixels inside the color range.
+
+        ``equalization`` is a lookup table for the L channel, see
+        ``equalization_lut``; it is ignored by tables too large to rebuild per frame.
+        """
+        table = self.__table
+        if equalization is not None and self.can_equalize:
+            table = self.__membership(equalization)
+
+        # contiguous planes and in place operations keep this at a few passes over the frame
+        channels = self.__split(frame)
+        if self.__shift:
+            for channel in channels:
+                np.right_shift(channel, self.__shift, out=channel)
+        index = self.__index
+        np.copyto(index, channels[0])
+        index <<= self.bits
+        index |= channels[1]
+        index <<= self.bits
+        index |= channels[2]
+        if dst is None:
+            dst = np.empty(frame.shape[:2], dtype=np.uint8)
+        np.take(table, index, out=dst)
+        return dst
+
+    def __split(self, frame: np.ndarray) -> List[np.ndarray]:
+        # the planes and the index are reused as long as the frame size stays the same
+        shape = frame.shape[:2]
+        if self.__index is None or self.__index.shape != shape:
+            self.__planes = [np.empty(shape, dtype=np.uint8) for _ in range(3)]
+            self.__index = np.empty(shape, dtype=np.uint32)
+        return cv2.split(frame, self.__planes)
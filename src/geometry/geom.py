@@ -3,7 +3,6 @@ from typing import Optional, Tuple
 
 import cv2
 import numpy as np
-from scipy.optimize import minimize
 
 from pipeline.pipeline import Mapper
 
@@ -35,66 +34,76 @@ class Sphere(Geom3D):
 
 
 class StereoEllipseGeometryExtractor(Mapper):
+    """Turns the ``Detection`` of both eyes into circles."""
+
     def __init__(self):
         super().__init__()
 
     def map(self, obj):
-        left = obj[0]
-        right = obj[1]
-
-        cv2.imshow("left", left[1])
-        cv2.waitKey(1)
-        cv2.imshow("right", right[1])
-        cv2.waitKey(1)
-
-        ellipse_left = left[-1]
-        center_left = None
-        radius_left = None
-        if ellipse_left is not None:
-            radius_left = ellipse_left.get_radius()
-            center_left = np.array(ellipse_left.center, dtype=np.float64)
-
-        ellipse_right = right[-1]
-        center_right = None
-        radius_right = None
-        if ellipse_right is not None:
-            radius_right = ellipse_right.get_radius()
-            center_right = np.array(ellipse_right.center, dtype=np.float64)
-
-        circle_left = (
-            Circle(center_left, radius_left) if ellipse_left is not None else None
-        )
-        circle_right = (
-            Circle(center_right, radius_right) if ellipse_right is not None else None
+        return tuple(
+            Circle(np.array(detection.center, dtype=np.float64), detection.radius)
+            if detection is not None else None
+            for detection in obj
         )
 
-        return circle_left, circle_right
-
 
 class SpatialGeometryTransformer(Mapper):
-    def __init__(self, left_matrix, right_matrix):
+    """Triangulates the ball from the circle centers of both eyes.
+
+    ``method`` selects how the two back projected rays are intersected:
+    ``"midpoint"`` solves for the closest points of both rays in closed form,
+    ``"dlt"`` uses the linear triangulation of ``cv2.triangulatePoints`` and
+    ``"optimize"`` minimizes the ray distance numerically (needs scipy).
+    The pseudo inverses of the matrices can be passed in precomputed, e.g. from
+    a ``ParameterStore``.
+
+    Maps a pair of circles to one position and a list of pairs, as made by
+    ``StereoMatcher``, to a list of positions.
+    """
+
+    # rays closer to parallel than this can not be intersected in closed form
+    PARALLEL_TOLERANCE = 1e-12
+
+    def __init__(self, left_matrix, right_matrix, method: str = "midpoint",
+                 left_inverse=None, right_inverse=None):
         super().__init__()
-        self.__left_inverse = np.linalg.pinv(left_matrix)
-        self.__right_inverse = np.linalg.pinv(right_matrix)
+        if method not in ("midpoint", "dlt", "optimize"):
+            raise ValueError(f"Unknown triangulation method {method}")
+        self.method = method
+        self.__left_matrix = np.asarray(left_matrix, dtype=np.float64)
+        self.__right_matrix = np.asarray(right_matrix, dtype=np.float64)
+        self.__left_inverse = np.linalg.pinv(self.__left_matrix) if left_inverse is None \
+            else np.asarray(left_inverse, dtype=np.float64)
+        self.__right_inverse = np.linalg.pinv(self.__right_matrix) if right_inverse is None \
+            else np.asarray(right_inverse, dtype=np.float64)
         self.alpha = np.array([0.5, 0.5])
-        self.tau_world = np.array([[0, 0, 0, 0], [120.0, 0, 0, 0]])
+        # camera centers, the rays start there
+        self.tau_world = np.vstack((self.camera_center(self.__left_matrix),
+                                    self.camera_center(self.__right_matrix)))
+        self.tau_world[:, 3] = 0
+
+    @staticmethod
+    def camera_center(matrix: np.ndarray) -> np.ndarray:
+        """Homogeneous camera center, the null space of the projection matrix."""
+        center = np.linalg.svd(matrix)[2][-1]
+        return center / center[3]
+
+    def ray_directions(self, points: np.ndarray, inverse: np.ndarray, center: np.ndarray) -> np.ndarray:
+        """Directions of the rays through (N, 2) pixels, from the camera center
+        towards the back projected points ``inverse @ x``."""
+        back_projected = np.hstack((points, np.ones((points.shape[0], 1)))) @ inverse.T
+        return back_projected[:, :3] - back_projected[:, 3:] * center[:3]
 
     def homogenize(self, point):
         return np.append(point, 1)
 
     def find_closest_alpha(self, ray_direction) -> Optional[np.ndarray]:
         """Find both alpha values that minimize the distance between the two rays
-        There is porbably a closed form solution to this..."""
+        numerically, only used as a fallback to ``closest_alphas``."""
+        from scipy.optimize import minimize
 
         def objective(alpha):
-            # assert left_vec.shape == (
-            #     4,
-            # ), f"left_vec.shape = {(alpha[0] * left_vec).shape}"
-            # assert right_vec.shape == (
-            #     4,
-            # ), f"right_vec.shape: {(alpha[1] * right_vec).shape}"
-
-            points_on_rays = self.tau_world + np.multiply(
+            points_on_rays = self.tau_world[:, :3] + np.multiply(
                 alpha.reshape((-1, 1)), ray_direction
             )
             return np.linalg.norm(points_on_rays[0, :3] - points_on_rays[1, :3])
@@ -103,44 +112,95 @@ class SpatialGeometryTransformer(Mapper):
         if result.success:
             return result.x
 
-    def triangulate(self, left: Circle, right: Circle) -> Optional[Sphere]:
-        # use the same v coordinate for both points
-        mean_v = (left.position[1] + right.position[1]) / 2
-
-        left.position[1] = mean_v
-        right.position[1] = mean_v
+    def closest_alphas(self, left_directions: np.ndarray, right_directions: np.ndarray
+                       ) -> Tuple[np.ndarray, np.ndarray]:
+        """Closed form of ``find_closest_alpha`` for N ray pairs at once.
+
+        Returns the (N, 2) alphas and a mask of the pairs that are not parallel.
+        """
+        d_left = left_directions[:, :3]
+        d_right = right_directions[:, :3]
+        w = self.tau_world[0, :3] - self.tau_world[1, :3]
+
+        a = np.einsum("ij,ij->i", d_left, d_left)
+        b = np.einsum("ij,ij->i", d_left, d_right)
+        c = np.einsum("ij,ij->i", d_right, d_right)
+        d = d_left @ w
+        e = d_right @ w
+
+        denominator = a * c - b * b
+        valid = np.abs(denominator) > self.PARALLEL_TOLERANCE * a * c
+        safe = np.where(valid, denominator, 1.0)
+        alphas = np.stack(((b * e - c * d) / safe, (a * e - b * d) / safe), axis=1)
+        return alphas, valid
+
+    def triangulate_points(self, left_points: np.ndarray, right_points: np.ndarray,
+                           equalize_rows: bool = True) -> np.ndarray:
+        """Triangulates N point pairs given as (N, 2) pixel coordinates into (N, 3).
+
+        With ``equalize_rows`` both points of a pair are moved to their mean row as
+        expected from rectified cameras.
+        """
+        left_points = np.array(left_points, dtype=np.float64).reshape(-1, 2)
+        right_points = np.array(right_points, dtype=np.float64).reshape(-1, 2)
+        if equalize_rows:
+            mean_v = (left_points[:, 1] + right_points[:, 1]) / 2
+            left_points[:, 1] = mean_v
+            right_points[:, 1] = mean_v
+
+        if self.method == "dlt":
+            world_h = cv2.triangulatePoints(
+                self.__left_matrix, self.__right_matrix, left_points.T, right_points.T
+            )
+            return (world_h[:3] / world_h[3]).T
+
+        left_directions = self.ray_directions(left_points, self.__left_inverse, self.tau_world[0])
+        right_directions = self.ray_directions(right_points, self.__right_inverse, self.tau_world[1])
+
+        if self.method == "optimize":
+            alphas = np.empty((left_points.shape[0], 2))
+            valid = np.zeros(left_points.shape[0], dtype=bool)
+        else:
+            alphas, valid = self.closest_alphas(left_directions, right_directions)
+
+        for i in np.flatnonzero(~valid):
+            alpha = self.find_closest_alpha(np.vstack((left_directions[i], right_directions[i])))
+            if alpha is not None:
+                self.alpha = alpha
+            alphas[i] = self.alpha
+        if valid.any():
+            self.alpha = alphas[np.flatnonzero(valid)[-1]]
+
+        # points on both rays closest to each other, their mean is the world point
+        left_world = self.tau_world[0, :3] + alphas[:, :1] * left_directions[:, :3]
+        right_world = self.tau_world[1, :3] + alphas[:, 1:] * right_directions[:, :3]
+        return (left_world + right_world) / 2
 
+    def triangulate(self, left: Circle, right: Circle) -> Optional[Sphere]:
         mean_radius = (
             left.radius + right.radius
         ) / 2  # the radius should be scaled based on the distance the distance towards the camera
 
-        left_homogeneous_q = self.homogenize(left.position).T
-        right_homogeneous_q = self.homogenize(right.position).T
-
-        # together with variable alphas these describe ray equations
-        left_vect = self.__left_inverse @ left_homogeneous_q
-        right_vect = self.__right_inverse @ right_homogeneous_q
-        ray_directions = np.vstack((left_vect, right_vect))
-
-        # find the point that is closest to the intersection of the two rays
-        alpha = self.find_closest_alpha(ray_directions)
-        if alpha is not None:
-            self.alpha = alpha
-
-        # calculate the world points, use the mean and de-homogenize
-        world_points_h = self.tau_world + np.multiply(
-            self.alpha.reshape(-1, 1), ray_directions
-        )
-        # world_points_h = np.divide(world_points_h[:, :3], world_points_h[:, 3].reshape((-1, 1)))
-        world_points_h = np.divide(world_points_h[:, :3], 1)
-        world_point = np.mean(world_points_h, axis=0)
-        # world_point = np.mean(world_point_h[:, :3] / world_point_h[:, 3], axis=0)
+        world_point = self.triangulate_points(left.position, right.position)[0]
 
         return Sphere(
             world_point, mean_radius
         )  # or right.radius depending on how you handle radius in 3D.
 
+    def triangulate_pairs(self, pairs) -> list:
+        """Triangulates a list of (left, right) circles at once, see ``StereoMatcher``."""
+        if not pairs:
+            return []
+        left_points = np.array([left.position for left, _ in pairs])
+        right_points = np.array([right.position for _, right in pairs])
+        return [
+            {"x": float(x), "y": float(y), "z": float(z)}
+            for x, y, z in self.triangulate_points(left_points, right_points)
+        ]
+
     def map(self, obj):
+        if isinstance(obj, list):
+            return self.triangulate_pairs(obj)
         left = obj[0]
         right = obj[1]
 
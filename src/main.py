@@ -1,37 +1,55 @@
+import os
 import time
 
 import numpy as np
 import redis
 
+from broadcast.fanout_server import FanoutServer
 from broadcast.redis_broadcast import RedisBroadcast
 from capture.frame_supplier import FrameSupplier
 from debug.debug_cam_pipeline import ResultPrinter
 from detection.color_thresholding import ColorSegmenter
 from geometry.geom import SpatialGeometryTransformer, StereoEllipseGeometryExtractor
-from pipeline.pipeline import Pipeline
+from pipeline.pipeline import OverflowPolicy, Pipeline
+from pipeline.stats import format_stats
+from post_processing.tracks import MultiBallTracker
+from stereo.matching import StereoMatcher
+from stereo.parameter_store import ParameterStore
+from stereo.rectify import StereoCalibration, StereoCircleRectifier, StereoRectification
 from stereo.split import StereoSplitter
 from stereo.stereo_pipeline import *
-from visualization.frame_viewer import FrameViewer
+from visualization.frame_viewer import DebugViewer
+
+# print per stage timings next to the connector sizes
+PRINT_STAGE_STATS = True
+# annotated frames and masks of both segmenters shown in windows at this rate, needs a display
+DEBUG_VIEW_RATE = None
+# above one every ball of the color is tracked with its own ID and broadcast as a list of balls
+MAX_BALLS = 1
+# parameter store written by capture/stereo_calibration.py; ideal cameras are assumed without it
+CALIBRATION_FILE = "stereo_calibration.npz"
 
 
 def main():
-    stereo_cam_sup = FrameSupplier(0, resolution=(1280 * 2, 720))
+    stereo_cam_sup = FrameSupplier(0, resolution=(1280 * 2, 720), background=True)
 
     frame_splitter = StereoSplitter()
 
-    left_image_view = FrameViewer()
-    right_image_view = FrameViewer()
-    stereo_frame_view = StereoConsumer(left_image_view, right_image_view)
-
     # color_point = [87, 192, 167]
     # color_point = [202, 134, 192]
     color_point = [252, 157, 199]
     # tolerance = [0.7, 0.11, 0.1]
     tolerance = [0.925, 0.075, 0.075]
 
-    left_segmenter = ColorSegmenter(base_color=color_point, rel_tol=tolerance)
-    right_segmenter = ColorSegmenter(base_color=color_point, rel_tol=tolerance)
+    # the segmenters only pass on a small Detection record, no images
+    left_segmenter = ColorSegmenter(base_color=color_point, rel_tol=tolerance, max_objects=MAX_BALLS)
+    right_segmenter = ColorSegmenter(base_color=color_point, rel_tol=tolerance, max_objects=MAX_BALLS)
     stereo_segmenter = StereoMapper(left_segmenter, right_segmenter)
+    if DEBUG_VIEW_RATE:
+        # the segmenters only draw when the viewer wants an image, it shows them from its own thread
+        debug_viewer = DebugViewer(rate=DEBUG_VIEW_RATE)
+        left_segmenter.attach_observer(debug_viewer, "left")
+        right_segmenter.attach_observer(debug_viewer, "right")
 
     geometry_extractor = StereoEllipseGeometryExtractor()
 
@@ -45,7 +63,7 @@ def main():
     #       (cx, cy) = principal point, [cx] = [cy] = px
     # Resolution: 1280x720: size(px) =  0.004mm, focal length = 700px
     # fmt: off
-    p_right_matrix = np.array([[700, 0, 640, -120.0],
+    p_right_matrix = np.array([[700, 0, 640, -700 * 120.0],
                                [0, 700, 360, 0],
                                [0, 0, 1, 0]])
     p_left_matrix = np.array([[700, 0, 640, 0],
@@ -53,19 +71,44 @@ def main():
                               [0, 0, 1, 0]])
     # fmt: on
 
-    geometry_transformer = SpatialGeometryTransformer(p_left_matrix, p_right_matrix)
+    rectification = None
+    if os.path.exists(CALIBRATION_FILE):
+        # the store is memory mapped, nothing but the zip directory is read here
+        store = ParameterStore(CALIBRATION_FILE)
+        rectification = StereoRectification(StereoCalibration.from_parameters(store), parameters=store)
+        geometry_transformer = SpatialGeometryTransformer(
+            store["P1"], store["P2"], method="dlt",
+            left_inverse=store["P1_pinv"], right_inverse=store["P2_pinv"],
+        )
+    else:
+        geometry_transformer = SpatialGeometryTransformer(p_left_matrix, p_right_matrix)
+
+    builder = (
+        Pipeline.builder()
+        .add(stereo_cam_sup)
+        .add(frame_splitter)
+        # only the most recent frame is worth segmenting, stale positions are useless
+        .add(stereo_segmenter, overflow=OverflowPolicy.LATEST)
+    )
+    if MAX_BALLS > 1:
+        # the candidates of both eyes are paired by row and radius, rectified first if calibrated
+        builder.add(StereoMatcher(rectification=rectification))
+    else:
+        builder.add(geometry_extractor)
+        if rectification is not None:
+            # undistorting the two centers is enough, the frames stay as they are
+            builder.add(StereoCircleRectifier(rectification))
+    builder.add(geometry_transformer)
+    if MAX_BALLS > 1:
+        builder.add(MultiBallTracker())
 
     client = redis.Redis(host="localhost", port=6379)
 
     pipe1 = (
-        Pipeline.builder()
-        .add(stereo_cam_sup)
-        .add(frame_splitter)
-        .add(stereo_segmenter)
-        .add(geometry_extractor)
-        .add(geometry_transformer)
+        builder
         .add(ResultPrinter())
         # .add(RedisBroadcast(client, "Ball"))
+        # .add(FanoutServer(port=5555, udp_port=5556))
         .build()
     )
 
@@ -73,6 +116,8 @@ def main():
         pipe1.run()
         while True:
             print(pipe1.get_endpoint_sizes())
+            if PRINT_STAGE_STATS:
+                print(format_stats(pipe1.stats()))
             time.sleep(2.0)
     except KeyboardInterrupt:
         pipe1.stop()
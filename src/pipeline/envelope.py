@@ -0,0 +1,43 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+
+@dataclass
+class Envelope:
+    """Carries an item through the pipeline together with its capture metadata.
+
+    ``captured_at`` is wall clock time for consumers outside of the pipeline,
+    ``captured_monotonic`` and the stage stamps use the monotonic clock which is
+    shared by all processes of the machine.
+    """
+
+    payload: Any
+    sequence: int
+    captured_at: float
+    captured_monotonic: float
+    stage_times: List[Tuple[str, float]] = field(default_factory=list)
+    # frames the supplier skipped right before this one to stay current
+    skipped: int = 0
+
+    @staticmethod
+    def capture(payload: Any, sequence: int, captured_at: Optional[float] = None,
+                captured_monotonic: Optional[float] = None, skipped: int = 0) -> 'Envelope':
+        return Envelope(
+            payload,
+            sequence,
+            time.time() if captured_at is None else captured_at,
+            time.monotonic() if captured_monotonic is None else captured_monotonic,
+            skipped=skipped,
+        )
+
+    def with_payload(self, payload: Any) -> 'Envelope':
+        return Envelope(payload, self.sequence, self.captured_at,
+                        self.captured_monotonic, list(self.stage_times), self.skipped)
+
+    def stamp(self, stage: str) -> None:
+        self.stage_times.append((stage, time.monotonic()))
+
+    def age(self) -> float:
+        """Seconds since capture."""
+        return time.monotonic() - self.captured_monotonic
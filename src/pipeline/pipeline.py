@@ -1,21 +1,67 @@
+import copy
+import itertools
+import multiprocessing
+import queue
 import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any
-from multiprocessing import Queue, Pool, Process
-from concurrent.futures import ThreadPoolExecutor as ThreadPool
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Optional, Type
 
-# from multiprocessing import Pool
+from pipeline.envelope import Envelope
+from pipeline.reorder import ReorderBuffer
+from pipeline.shared_memory import SharedFrameRing, SharedFrameRingClosed, POLL_INTERVAL
+from pipeline.stats import StageStats
 
 MAX_QUEUE_BUFFER = 4
+# shared memory transport of process stages, a slot has to fit all arrays of one item
+SHARED_MEMORY_SLOTS = MAX_QUEUE_BUFFER + 2
+SHARED_MEMORY_SLOT_BYTES = 16 << 20
+# spawn instead of fork, the pipeline is already multithreaded when stages start
+PROCESS_START_METHOD = "spawn"
+
+
+class OverflowPolicy(Enum):
+    """What a connector does with a new item while it is full."""
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    # mailbox of size one, the consumer always gets the most recent item
+    LATEST = "latest"
 
 
 class PipelineComponent(ABC):
+    # components that need the capture metadata get the whole Envelope instead of its payload
+    wants_envelope = False
+    # debug images are only rendered for an observer, see ``attach_observer``
+    debug_observer = None
+    debug_name: Optional[str] = None
+
     def __init__(self):
         pass
 
     def abbreviate(self) -> str:
         return self.__class__.__name__
 
+    def attach_observer(self, observer, name: Optional[str] = None) -> 'PipelineComponent':
+        """Lets the component hand debug images to ``observer``, an object with
+        ``due(name) -> bool`` and ``publish(name, image)`` like ``DebugViewer``."""
+        self.debug_observer = observer
+        self.debug_name = name or self.abbreviate()
+        return self
+
+    def observe(self, render: Callable[[], Any], channel: str = "") -> None:
+        """Publishes ``render()`` to the attached observer if it wants an image now,
+        without an observer nothing is rendered. Components must never show
+        images themselves, the GUI belongs to the observer."""
+        observer = self.debug_observer
+        if observer is None:
+            return
+        name = f"{self.debug_name}_{channel}" if channel else self.debug_name
+        if observer.due(name):
+            observer.publish(name, render())
+
     def stop(self) -> None:
         pass
 
@@ -57,9 +103,11 @@ class Mapper(PipelineComponent):
 
 
 class Pipeline:
-    def __init__(self):
+    def __init__(self, connector_type: Type['PipelineConnector'] = None):
         self.__stages = []
         self.__working = False
+        # stages run as threads, so by default items are handed over by reference
+        self.__connector_type = connector_type or ThreadPipelineConnector
 
     def __str__(self):
         message = ""
@@ -68,13 +116,22 @@ class Pipeline:
             message += stage.component.abbreviate()
             if i < len(self.__stages) - 1:
                 trailing_size = stage.trailing.get_size() if stage.trailing else 0
-                message += " -[" + str(trailing_size) + "]-> "
+                dropped = stage.trailing.get_dropped() if stage.trailing else 0
+                if dropped:
+                    message += " -[" + str(trailing_size) + ", " + str(dropped) + " dropped]-> "
+                else:
+                    message += " -[" + str(trailing_size) + "]-> "
         return message
 
-    def add_component(self, component: PipelineComponent, simple_threading=False) -> None:
-        stage = PipelineStage(component, simple_threading)
+    def add_component(self, component: PipelineComponent, process=False, workers=1,
+                      slot_bytes=SHARED_MEMORY_SLOT_BYTES,
+                      overflow=OverflowPolicy.BLOCK) -> None:
+        if process:
+            stage = ProcessPipelineStage(component, workers, slot_bytes)
+        else:
+            stage = PipelineStage(component, workers)
         if len(self.__stages) > 0:
-            connector = PipelineConnector()
+            connector = self.__connector_type(overflow)
             before = self.__stages[-1]
             connector.between(before, stage)
         self.__stages.append(stage)
@@ -100,21 +157,41 @@ class Pipeline:
     def get_endpoint_sizes(self):
         return [stage.get_endpoint_sizes() for stage in self.__stages]
 
+    def stats(self):
+        """Per stage item counts, throughput and p50/p95/p99 of the service time, the
+        time waited for input and the time blocked on a full output. The consumer
+        additionally reports the capture-to-consume latency of its items."""
+        return [stage.stats() for stage in self.__stages]
+
+    def latency(self):
+        """Distribution of the time from capture until the consumer is done with an item.
+
+        A consumer that hands items to a thread of its own, like ``RedisBroadcast``,
+        is done once the item is queued there."""
+        return self.__stages[-1].stats()["latency_ms"]
+
     def stop(self):
         for stage in self.__stages:
             stage.stop()
 
     @staticmethod
-    def builder() -> 'PipelineBuilder':
-        return PipelineBuilder()
+    def builder(connector_type: Type['PipelineConnector'] = None) -> 'PipelineBuilder':
+        return PipelineBuilder(connector_type)
 
 
 class PipelineBuilder:
-    def __init__(self):
-        self.__pipeline = Pipeline()
-
-    def add(self, component: PipelineComponent, simple_threading=False) -> 'PipelineBuilder':
-        self.__pipeline.add_component(component, simple_threading)
+    def __init__(self, connector_type: Type['PipelineConnector'] = None):
+        self.__pipeline = Pipeline(connector_type)
+
+    def add(self, component: PipelineComponent, process=False, workers=1,
+            slot_bytes=SHARED_MEMORY_SLOT_BYTES,
+            overflow=OverflowPolicy.BLOCK) -> 'PipelineBuilder':
+        """Appends a stage. With ``process`` the component runs in its own process and
+        must be picklable, frames are then moved through shared memory slots of
+        ``slot_bytes`` each. A Mapper may be spread over several ``workers``, each
+        with its own copy of the component, without changing the order of items.
+        ``overflow`` sets the policy of the connector feeding this stage."""
+        self.__pipeline.add_component(component, process, workers, slot_bytes, overflow)
         return self
 
     def build(self) -> Pipeline:
@@ -122,8 +199,7 @@ class PipelineBuilder:
 
 
 class PipelineStage:
-    def __init__(self, component: PipelineComponent, use_simple_threading=False):
-        use_simple_threading = True
+    def __init__(self, component: PipelineComponent, workers=1):
         self._leadingConnector = None
         self._trailingConnector = None
         self.component = component
@@ -135,11 +211,23 @@ class PipelineStage:
             self.__action = self.__map
         else:
             raise TypeError('Unknown component type')
-        if use_simple_threading:
-            self.__pool = threading.Thread(target=self.__loop)
-        else:
-            self.__pool = ThreadPool(1)
-        self.__simple_threading = use_simple_threading
+        if workers < 1:
+            raise ValueError('A stage needs at least one worker')
+        if workers > 1 and not isinstance(component, Mapper):
+            raise ValueError('Only Mappers can be spread over several workers')
+        self._name = component.__class__.__name__
+        self._stopped = threading.Event()
+        self._reorder = ReorderBuffer(lambda obj: self._trailingConnector.put(obj))
+        self.__sequence = itertools.count()
+        self.__intake = threading.Lock()
+        self.__components = [component] + [copy.deepcopy(component) for _ in range(workers - 1)]
+        # one recorder per worker, each is written by a single thread only
+        self._stats = [StageStats() for _ in self.__components]
+        # daemon, a stage blocked on an empty connector must not keep the interpreter alive
+        self.__threads = [
+            threading.Thread(target=self.__loop, args=(worker, stats), daemon=True)
+            for worker, stats in zip(self.__components, self._stats)
+        ]
 
     @property
     def leading(self) -> 'PipelineConnector':
@@ -158,52 +246,326 @@ class PipelineStage:
         self._trailingConnector = connector
 
     def run(self):
-        if self.__simple_threading:
-            self.__pool.start()
-        else:
-            self.__pool.submit(self.__loop)
+        for thread in self.__threads:
+            thread.start()
+
+    def __loop(self, worker: PipelineComponent, stats: StageStats):
+        while not self._stopped.is_set():
+            self.__action(worker, stats)
+
+    def __supply(self, worker: Supplier, stats: StageStats) -> None:
+        started = time.perf_counter()
+        obj = worker.supply()
+        if self._stopped.is_set():
+            # a supplier woken up by stop returns None or a stale item, nobody takes it anymore
+            return
+        envelope = _seal(obj, next(self.__sequence))
+        envelope.stamp(self._name)
+        supplied = time.perf_counter()
+        self._trailingConnector.put(envelope)
+        stats.record(None, supplied - started, time.perf_counter() - supplied)
+
+    def __consume(self, worker: Consumer, stats: StageStats) -> None:
+        started = time.perf_counter()
+        envelope = self._leadingConnector.get()
+        received = time.perf_counter()
+        worker.consume(_open(worker, envelope))
+        stats.record(received - started, time.perf_counter() - received, None)
+        stats.latency.record(envelope.age())
+
+    def __map(self, worker: Mapper, stats: StageStats) -> None:
+        started = time.perf_counter()
+        with self.__intake:
+            envelope = self._leadingConnector.get()
+            sequence = next(self.__sequence)
+        received = time.perf_counter()
+        envelope = _reseal(envelope, worker.map(_open(worker, envelope)))
+        envelope.stamp(self._name)
+        mapped = time.perf_counter()
+        self._reorder.submit(sequence, envelope)
+        stats.record(received - started, mapped - received, time.perf_counter() - mapped)
 
-    def __loop(self):
-        while True:
-            self.__action()
+    def get_endpoint_sizes(self):
+        """Size and number of dropped items of the leading and trailing connector."""
+        leading = self.__describe(self._leadingConnector)
+        trailing = self.__describe(self._trailingConnector)
+        return [leading, trailing]
 
-    def __supply(self) -> None:
-        assert isinstance(self.component, Supplier)
-        self._trailingConnector.put(self.component.supply())
+    @staticmethod
+    def __describe(connector: 'PipelineConnector'):
+        if connector is None:
+            return "N/A"
+        return connector.get_size(), connector.get_dropped()
 
-    def __consume(self) -> None:
-        assert isinstance(self.component, Consumer)
-        self.component.consume(self._leadingConnector.get())
+    def stats(self):
+        return StageStats.merge(self._name, self._stats)
 
-    def __map(self) -> None:
-        assert isinstance(self.component, Mapper)
-        obj = self._leadingConnector.get()
-        self._trailingConnector.put(self.component.map(obj))
+    def stop(self):
+        self._stopped.set()
+        for worker in self.__components:
+            worker.stop()
+
+
+class ProcessPipelineStage(PipelineStage):
+    """Runs the component in a child process to get around the GIL.
+
+    Two relay threads stay in the pipeline process: one moves items from the
+    leading connector into the shared memory ring read by the child, the other
+    copies the child's results out of their slot into the trailing connector.
+    The service time is measured in the child and reported with every result.
+    """
+
+    def __init__(self, component: PipelineComponent, workers=1,
+                 slot_bytes=SHARED_MEMORY_SLOT_BYTES):
+        # the local instance is never run, every child unpickles its own copy
+        super().__init__(component)
+        if workers > 1 and not isinstance(component, Mapper):
+            raise ValueError('Only Mappers can be spread over several workers')
+        context = multiprocessing.get_context(PROCESS_START_METHOD)
+        slots = SHARED_MEMORY_SLOTS + workers - 1
+        self.__inbound = None
+        self.__outbound = None
+        if not isinstance(component, Supplier):
+            self.__inbound = SharedFrameRing(slots, slot_bytes, context)
+        if not isinstance(component, Consumer):
+            self.__outbound = SharedFrameRing(slots, slot_bytes, context)
+        self.__requests = context.Queue(MAX_QUEUE_BUFFER)
+        self.__results = context.Queue(MAX_QUEUE_BUFFER)
+        self.__child_stopped = context.Event()
+        self.__processes = [
+            context.Process(
+                target=_run_process_stage,
+                args=(component, self.__inbound, self.__outbound,
+                      self.__requests, self.__results, self.__child_stopped),
+                daemon=True,
+            )
+            for _ in range(workers)
+        ]
+        # the feeder only records input waits, the collector everything else
+        self._stats = [StageStats()]
+        self.__relays = [threading.Thread(target=self.__collect, daemon=True)]
+        if self.__inbound is not None:
+            self.__relays.append(threading.Thread(target=self.__feed, daemon=True))
 
-    def get_endpoint_sizes(self):
-        leading = self._leadingConnector.get_size() if self._leadingConnector else "N/A"
-        trailing = self._trailingConnector.get_size() if self._trailingConnector else "N/A"
-        return [leading, trailing]
+    def run(self):
+        for process in self.__processes:
+            process.start()
+        for relay in self.__relays:
+            relay.start()
+
+    def __feed(self):
+        stats = self._stats[0]
+        try:
+            for sequence in itertools.count():
+                if self._stopped.is_set():
+                    break
+                started = time.perf_counter()
+                envelope = self._leadingConnector.get()
+                stats.wait_input.record(time.perf_counter() - started)
+                # only the payload goes through shared memory, the metadata is pickled
+                slot, packed = self.__inbound.encode(envelope.payload)
+                message = (sequence, slot, packed, envelope.with_payload(None))
+                _put_until_stopped(self.__requests, message, self._stopped)
+        except SharedFrameRingClosed:
+            pass
+
+    def __collect(self):
+        # a supplier child numbers its items itself, a consumer child only reports timings
+        stats = self._stats[0]
+        while not self._stopped.is_set():
+            try:
+                sequence, slot, packed, envelope, service = self.__results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if sequence is None:
+                stats.record(None, service, None)
+                stats.latency.record(envelope.age())
+                continue
+            envelope = envelope.with_payload(self.__outbound.decode(slot, packed, copy=True))
+            self.__outbound.release(slot)
+            started = time.perf_counter()
+            self._reorder.submit(sequence, envelope)
+            stats.record(None, service, time.perf_counter() - started)
 
     def stop(self):
-        self.component.stop()
-        if self.__simple_threading:
-            self.__pool.shutdown(wait=False)
+        # the component lives and is stopped in the child
+        self._stopped.set()
+        self.__child_stopped.set()
+        for ring in (self.__inbound, self.__outbound):
+            if ring is not None:
+                ring.close()
+        for process in self.__processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for ring in (self.__inbound, self.__outbound):
+            if ring is not None:
+                ring.unlink()
+
+
+def _put_until_stopped(target, obj: Any, stopped) -> None:
+    while not stopped.is_set():
+        try:
+            target.put(obj, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            continue
+
+
+def _seal(obj: Any, sequence: int) -> Envelope:
+    return obj if isinstance(obj, Envelope) else Envelope.capture(obj, sequence)
+
+
+def _reseal(envelope: Envelope, result: Any) -> Envelope:
+    return result if isinstance(result, Envelope) else envelope.with_payload(result)
+
+
+def _open(component: PipelineComponent, envelope: Envelope) -> Any:
+    return envelope if component.wants_envelope else envelope.payload
+
+
+def _run_process_stage(component, inbound, outbound, requests, results, stopped):
+    name = component.__class__.__name__
+    supplied = itertools.count()
+    try:
+        while not stopped.is_set():
+            slot = None
+            if isinstance(component, Supplier):
+                started = time.perf_counter()
+                sequence = next(supplied)
+                obj = component.supply()
+                if stopped.is_set():
+                    break
+                envelope = _seal(obj, sequence)
+            else:
+                try:
+                    sequence, slot, packed, envelope = requests.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                started = time.perf_counter()
+                envelope = envelope.with_payload(inbound.decode(slot, packed))
+
+            if isinstance(component, Consumer):
+                component.consume(_open(component, envelope))
+                inbound.release(slot)
+                message = (None, None, None, envelope.with_payload(None), time.perf_counter() - started)
+                _put_until_stopped(results, message, stopped)
+                continue
+
+            if isinstance(component, Mapper):
+                envelope = _reseal(envelope, component.map(_open(component, envelope)))
+            envelope.stamp(name)
+            service = time.perf_counter() - started
+            # the result may still reference the input slot, so encode before releasing it
+            slot_out, packed = outbound.encode(envelope.payload)
+            if inbound is not None:
+                inbound.release(slot)
+            message = (sequence, slot_out, packed, envelope.with_payload(None), service)
+            _put_until_stopped(results, message, stopped)
+    except SharedFrameRingClosed:
+        pass
+    finally:
+        component.stop()
 
 
-class PipelineConnector:
-    def __init__(self):
-        self.__buffer = Queue(MAX_QUEUE_BUFFER)
+class PipelineConnector(ABC):
+    def __init__(self, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        self.policy = policy
+        self.capacity = 1 if policy is OverflowPolicy.LATEST else MAX_QUEUE_BUFFER
 
     def between(self, first: PipelineStage, second: PipelineStage) -> None:
         first.trailing = self
         second.leading = self
 
+    @abstractmethod
     def put(self, obj: Any) -> None:
-        self.__buffer.put(obj)
+        pass
+
+    @abstractmethod
+    def get(self) -> Any:
+        pass
+
+    @abstractmethod
+    def get_size(self) -> int:
+        pass
+
+    @abstractmethod
+    def get_dropped(self) -> int:
+        pass
+
+
+class ThreadPipelineConnector(PipelineConnector):
+    """Hands objects over by reference between stages living in the same process."""
+
+    def __init__(self, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        super().__init__(policy)
+        self.__buffer = deque()
+        self.__changed = threading.Condition()
+        self.__dropped = 0
+
+    def put(self, obj: Any) -> None:
+        with self.__changed:
+            if len(self.__buffer) >= self.capacity:
+                if self.policy is OverflowPolicy.BLOCK:
+                    self.__changed.wait_for(lambda: len(self.__buffer) < self.capacity)
+                elif self.policy is OverflowPolicy.DROP_NEWEST:
+                    self.__dropped += 1
+                    return
+                else:
+                    self.__buffer.popleft()
+                    self.__dropped += 1
+            self.__buffer.append(obj)
+            self.__changed.notify_all()
+
+    def get(self) -> Any:
+        with self.__changed:
+            self.__changed.wait_for(lambda: len(self.__buffer) > 0)
+            obj = self.__buffer.popleft()
+            self.__changed.notify_all()
+            return obj
+
+    def get_size(self) -> int:
+        return len(self.__buffer)
+
+    def get_dropped(self) -> int:
+        return self.__dropped
+
+
+class ProcessPipelineConnector(PipelineConnector):
+    """Pickles objects through an OS pipe, needed once stages live in separate processes."""
+
+    def __init__(self, policy: OverflowPolicy = OverflowPolicy.BLOCK):
+        super().__init__(policy)
+        self.__buffer = multiprocessing.Queue(self.capacity)
+        self.__dropped = multiprocessing.Value("L", 0)
+
+    def put(self, obj: Any) -> None:
+        if self.policy is OverflowPolicy.BLOCK:
+            self.__buffer.put(obj)
+            return
+        while True:
+            try:
+                self.__buffer.put_nowait(obj)
+                return
+            except queue.Full:
+                pass
+            if self.policy is not OverflowPolicy.DROP_NEWEST:
+                try:
+                    self.__buffer.get_nowait()
+                except queue.Empty:
+                    # a reader was faster, try again
+                    continue
+            with self.__dropped.get_lock():
+                self.__dropped.value += 1
+            if self.policy is OverflowPolicy.DROP_NEWEST:
+                return
 
     def get(self) -> Any:
         return self.__buffer.get()
 
     def get_size(self) -> int:
         return self.__buffer.qsize()
+
+    def get_dropped(self) -> int:
+        return self.__dropped.value
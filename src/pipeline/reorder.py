@@ -0,0 +1,26 @@
+import threading
+from typing import Any, Callable, Dict
+
+
+class ReorderBuffer:
+    """Emits items submitted out of order strictly by their sequence number.
+
+    Used behind a stage with several workers so that downstream stages still see
+    the items in the order they left the upstream stage.
+    """
+
+    def __init__(self, emit: Callable[[Any], None]):
+        self.__emit = emit
+        self.__pending: Dict[int, Any] = {}
+        self.__next = 0
+        self.__lock = threading.Lock()
+
+    def submit(self, sequence: int, obj: Any) -> None:
+        with self.__lock:
+            self.__pending[sequence] = obj
+            while self.__next in self.__pending:
+                self.__emit(self.__pending.pop(self.__next))
+                self.__next += 1
+
+    def get_size(self) -> int:
+        return len(self.__pending)
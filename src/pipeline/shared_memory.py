@@ -0,0 +1,144 @@
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+# arrays smaller than this are cheaper to pickle than to copy into a slot
+MIN_SHARED_BYTES = 1 << 12
+ALIGNMENT = 64
+POLL_INTERVAL = 0.1
+
+
+class SharedFrameRingClosed(RuntimeError):
+    pass
+
+
+class _SharedArray:
+    """Placeholder for an array that was moved into a shared memory slot."""
+
+    def __init__(self, offset: int, shape: Tuple[int, ...], dtype: str):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+
+
+class _Packer:
+    def __init__(self, ring: 'SharedFrameRing'):
+        self.ring = ring
+        self.slot: Optional[int] = None
+        self.cursor = 0
+
+    def pack(self, obj: Any) -> Any:
+        if isinstance(obj, np.ndarray):
+            return self.__place(obj)
+        if type(obj) is tuple:
+            return tuple(self.pack(item) for item in obj)
+        if type(obj) is list:
+            return [self.pack(item) for item in obj]
+        if type(obj) is dict:
+            return {key: self.pack(value) for key, value in obj.items()}
+        return obj
+
+    def __place(self, array: np.ndarray) -> Any:
+        if array.nbytes < MIN_SHARED_BYTES or array.dtype.hasobject:
+            return array
+        offset = -(-self.cursor // ALIGNMENT) * ALIGNMENT
+        if offset + array.nbytes > self.ring.slot_bytes:
+            # does not fit anymore, let it travel through the queue instead
+            return array
+        if self.slot is None:
+            self.slot = self.ring.acquire()
+        view = self.ring.view(self.slot, offset, array.shape, array.dtype)
+        np.copyto(view, array)
+        self.cursor = offset + array.nbytes
+        return _SharedArray(offset, array.shape, array.dtype.str)
+
+
+class SharedFrameRing:
+    """Fixed ring of shared memory slots used to move frames between processes.
+
+    Only the slot index and the shape/dtype of every array cross the queue, the
+    pixel data is copied once into the slot by the writer. The reader hands the
+    slot back with ``release`` once it no longer needs the data.
+    """
+
+    def __init__(self, slots: int, slot_bytes: int, context=None):
+        context = context or multiprocessing.get_context()
+        self.slot_bytes = slot_bytes
+        self.__segments = [
+            shared_memory.SharedMemory(create=True, size=slot_bytes)
+            for _ in range(slots)
+        ]
+        self.__owner = True
+        self.__free = context.Queue(slots)
+        self.__closed = context.Event()
+        for index in range(slots):
+            self.__free.put(index)
+
+    def __getstate__(self):
+        names = [segment.name for segment in self.__segments]
+        return names, self.slot_bytes, self.__free, self.__closed
+
+    def __setstate__(self, state):
+        names, self.slot_bytes, self.__free, self.__closed = state
+        self.__segments = [shared_memory.SharedMemory(name=name) for name in names]
+        self.__owner = False
+
+    def acquire(self) -> int:
+        while True:
+            if self.__closed.is_set():
+                raise SharedFrameRingClosed()
+            try:
+                return self.__free.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def release(self, slot: Optional[int]) -> None:
+        if slot is not None:
+            self.__free.put(slot)
+
+    def view(self, slot: int, offset: int, shape, dtype) -> np.ndarray:
+        return np.ndarray(shape, dtype, buffer=self.__segments[slot].buf, offset=offset)
+
+    def encode(self, obj: Any) -> Tuple[Optional[int], Any]:
+        """Moves the large arrays of ``obj`` into a free slot.
+
+        Returns the slot index (``None`` if nothing was moved) and the packed object
+        that has to be sent alongside it.
+        """
+        packer = _Packer(self)
+        packed = packer.pack(obj)
+        return packer.slot, packed
+
+    def decode(self, slot: Optional[int], packed: Any, copy: bool = False) -> Any:
+        """Rebuilds an object from ``encode``.
+
+        Without ``copy`` the arrays are views into the slot and are only valid until
+        the slot is released.
+        """
+        if isinstance(packed, _SharedArray):
+            array = self.view(slot, packed.offset, packed.shape, np.dtype(packed.dtype))
+            return array.copy() if copy else array
+        if type(packed) is tuple:
+            return tuple(self.decode(slot, item, copy) for item in packed)
+        if type(packed) is list:
+            return [self.decode(slot, item, copy) for item in packed]
+        if type(packed) is dict:
+            return {key: self.decode(slot, value, copy) for key, value in packed.items()}
+        return packed
+
+    def close(self) -> None:
+        self.__closed.set()
+
+    def unlink(self) -> None:
+        self.close()
+        for segment in self.__segments:
+            try:
+                segment.close()
+            except BufferError:
+                # a view into the slot is still alive, the mapping goes with the process
+                pass
+            if self.__owner:
+                segment.unlink()
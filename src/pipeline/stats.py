@@ -0,0 +1,118 @@
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+STATS_WINDOW = 1024
+PERCENTILES = (50, 95, 99)
+
+
+class RollingHistogram:
+    """Keeps the most recent samples of a single writer.
+
+    Appending to a bounded deque is atomic, so the writing stage never takes a
+    lock; readers work on a snapshot and pay for sorting only when they ask.
+    """
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.__samples = deque(maxlen=window)
+
+    def record(self, value: float) -> None:
+        self.__samples.append(value)
+
+    def snapshot(self) -> List[float]:
+        return list(self.__samples)
+
+    @staticmethod
+    def summarize(samples: List[float], scale: float = 1.0) -> Dict[str, Optional[float]]:
+        summary: Dict[str, Optional[float]] = {"count": len(samples), "mean": None}
+        summary.update({f"p{q}": None for q in PERCENTILES})
+        if not samples:
+            return summary
+        ordered = sorted(samples)
+        summary["mean"] = sum(ordered) / len(ordered) * scale
+        for q in PERCENTILES:
+            # nearest rank
+            rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+            summary[f"p{q}"] = ordered[rank] * scale
+        return summary
+
+
+class StageStats:
+    """Timings of one worker of a stage, all durations are recorded in seconds."""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.service = RollingHistogram(window)
+        self.wait_input = RollingHistogram(window)
+        self.blocked_output = RollingHistogram(window)
+        # capture-to-consume time, only recorded by consumers
+        self.latency = RollingHistogram(window)
+        self.__completions = deque(maxlen=window)
+        self.items = 0
+
+    def record(self, wait_input: Optional[float], service: float,
+               blocked_output: Optional[float]) -> None:
+        if wait_input is not None:
+            self.wait_input.record(wait_input)
+        self.service.record(service)
+        if blocked_output is not None:
+            self.blocked_output.record(blocked_output)
+        self.__completions.append(time.perf_counter())
+        self.items += 1
+
+    def completions(self) -> List[float]:
+        return list(self.__completions)
+
+    @staticmethod
+    def merge(name: str, workers: Iterable['StageStats']) -> Dict:
+        """Combines the stats of all workers of a stage into one summary in milliseconds."""
+        workers = list(workers)
+        service, wait_input, blocked_output, latency, completions = [], [], [], [], []
+        for worker in workers:
+            service += worker.service.snapshot()
+            wait_input += worker.wait_input.snapshot()
+            blocked_output += worker.blocked_output.snapshot()
+            latency += worker.latency.snapshot()
+            completions += worker.completions()
+
+        items_per_sec = None
+        if len(completions) > 1:
+            completions.sort()
+            span = completions[-1] - completions[0]
+            if span > 0:
+                items_per_sec = (len(completions) - 1) / span
+
+        return {
+            "stage": name,
+            "items": sum(worker.items for worker in workers),
+            "items_per_sec": items_per_sec,
+            "service_ms": RollingHistogram.summarize(service, 1e3),
+            "wait_input_ms": RollingHistogram.summarize(wait_input, 1e3),
+            "blocked_output_ms": RollingHistogram.summarize(blocked_output, 1e3),
+            "latency_ms": RollingHistogram.summarize(latency, 1e3),
+        }
+
+
+def format_stats(stats: List[Dict]) -> str:
+    def fmt(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    lines = [
+        f"{'stage':<24} {'items':>8} {'items/s':>8} "
+        f"{'service p50/p95/p99 ms':>24} {'wait p50/p95 ms':>16} {'blocked p50/p95 ms':>19}"
+    ]
+    for stage in stats:
+        service, wait, blocked = stage["service_ms"], stage["wait_input_ms"], stage["blocked_output_ms"]
+        lines.append(
+            f"{stage['stage']:<24} {stage['items']:>8} {fmt(stage['items_per_sec']):>8} "
+            f"{fmt(service['p50']) + '/' + fmt(service['p95']) + '/' + fmt(service['p99']):>24} "
+            f"{fmt(wait['p50']) + '/' + fmt(wait['p95']):>16} "
+            f"{fmt(blocked['p50']) + '/' + fmt(blocked['p95']):>19}"
+        )
+    for stage in stats:
+        latency = stage["latency_ms"]
+        if latency["count"]:
+            lines.append(
+                f"capture to {stage['stage']} latency p50/p95/p99 ms: "
+                f"{fmt(latency['p50'])}/{fmt(latency['p95'])}/{fmt(latency['p99'])}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,47 @@
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    # scipy is optional, assign falls back to greedy matching
+    linear_sum_assignment = None
+
+
+def assign(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows and columns of the pairs of an (N, M) cost matrix with the least total
+    cost, pairs costing inf are never made.
+
+    Solved optimally with the Hungarian method of scipy if it is installed,
+    otherwise greedily by taking the cheapest remaining pair min(N, M) times.
+    The Hungarian method makes as many feasible pairs as it can before looking
+    at the costs, the greedy matching may leave out pairs whose only partner was
+    taken by a cheaper pair.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    empty = np.empty(0, dtype=np.intp)
+    if cost.size == 0:
+        return empty, empty
+    feasible = np.isfinite(cost)
+    if not feasible.any():
+        return empty, empty
+
+    if linear_sum_assignment is not None:
+        # more than any set of feasible pairs costs, linear_sum_assignment can not handle inf
+        infeasible = np.abs(cost[feasible]).sum() + 1.0
+        rows, cols = linear_sum_assignment(np.where(feasible, cost, infeasible))
+        keep = feasible[rows, cols]
+        return rows[keep], cols[keep]
+
+    remaining = np.where(feasible, cost, np.inf)
+    rows, cols = [], []
+    for _ in range(min(cost.shape)):
+        row, col = np.unravel_index(np.argmin(remaining), remaining.shape)
+        if not np.isfinite(remaining[row, col]):
+            break
+        rows.append(row)
+        cols.append(col)
+        remaining[row, :] = np.inf
+        remaining[:, col] = np.inf
+    return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
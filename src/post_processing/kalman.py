@@ -0,0 +1,191 @@
+from typing import Any, Callable, Optional, Sequence
+
+import numpy as np
+
+from geometry.geom import Sphere
+from pipeline.pipeline import Mapper
+
+# world units are mm, the y axis of a level camera points down
+GRAVITY_MM = (0.0, 9810.0, 0.0)
+# 99% quantile of the chi-squared distribution with 3 degrees of freedom
+GATE_CHI2_3DOF = 11.34
+# uncertainty of the unknown velocity of a new track, mm/s; it has to cover a
+# fast throw or the gate rejects the second measurement of the track
+INITIAL_VELOCITY_STD_MM = 10000.0
+
+
+class KalmanTrajectoryFilter(Mapper):
+    """Smooths the triangulated ball positions and bridges short detection gaps.
+
+    The state holds position and velocity, ``gravity`` is applied as a known
+    acceleration. With ``estimate_acceleration`` the acceleration becomes part of
+    the state, starting out at ``gravity``.
+    Accepts the ``{"x", "y", "z"}`` dicts of ``SpatialGeometryTransformer``,
+    ``Sphere`` objects or ``None`` for a miss, and emits position, velocity,
+    position covariance and whether the position is only predicted. After
+    ``max_gap`` consecutive misses the track is dropped and ``None`` is emitted.
+
+    ``on_predict`` is called with the position predicted for the next frame,
+    e.g. a ``RoiFeedback`` that steers the search windows of the segmenters.
+    """
+
+    wants_envelope = True
+
+    def __init__(
+            self,
+            process_noise: float = 5e6,
+            measurement_noise: float = 25.0,
+            max_gap: int = 5,
+            gravity: Optional[Sequence[float]] = GRAVITY_MM,
+            estimate_acceleration: bool = False,
+            gate: Optional[float] = GATE_CHI2_3DOF,
+            default_dt: float = 1 / 30,
+            on_predict: Optional[Callable[[np.ndarray], None]] = None,
+    ):
+        super().__init__()
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_gap = max_gap
+        self.gravity = np.zeros(3) if gravity is None else np.asarray(gravity, dtype=np.float64)
+        self.order = 3 if estimate_acceleration else 2
+        self.gate = gate
+        self.default_dt = default_dt
+        self.on_predict = on_predict
+
+        size = 3 * self.order
+        self.__h = np.zeros((3, size))
+        self.__h[:, :3] = np.eye(3)
+        self.__state: Optional[np.ndarray] = None
+        self.__covariance: Optional[np.ndarray] = None
+        self.__last_time: Optional[float] = None
+        self.__dt = default_dt
+        self.__misses = 0
+
+    def reset(self) -> None:
+        self.__state = None
+        self.__covariance = None
+        self.__misses = 0
+
+    def __transition(self, dt: float):
+        # per axis kinematics, expanded to all three axes with a kronecker product
+        if self.order == 2:
+            f_axis = np.array([[1, dt], [0, 1]])
+            g_axis = np.array([dt ** 2 / 2, dt])
+        else:
+            f_axis = np.array([[1, dt, dt ** 2 / 2], [0, 1, dt], [0, 0, 1]])
+            g_axis = np.array([dt ** 3 / 6, dt ** 2 / 2, dt])
+        f = np.kron(f_axis, np.eye(3))
+        q = np.kron(np.outer(g_axis, g_axis), np.eye(3)) * self.process_noise
+        if self.order == 2:
+            control = np.kron(g_axis, self.gravity)
+        else:
+            # gravity is the initial estimate of the acceleration state instead
+            control = np.zeros(9)
+        return f, q, control
+
+    def __predict(self, dt: float) -> None:
+        f, q, control = self.__transition(dt)
+        self.__state = f @ self.__state + control
+        self.__covariance = f @ self.__covariance @ f.T + q
+
+    def __initialize(self, position: np.ndarray) -> None:
+        size = 3 * self.order
+        self.__state = np.zeros(size)
+        self.__state[:3] = position
+        if self.order == 3:
+            self.__state[6:] = self.gravity
+        self.__covariance = np.eye(size) * 1e6
+        self.__covariance[:3, :3] = np.eye(3) * self.measurement_noise
+        self.__covariance[3:6, 3:6] = np.eye(3) * INITIAL_VELOCITY_STD_MM ** 2
+        self.__misses = 0
+
+    def __update(self, position: np.ndarray) -> bool:
+        innovation = position - self.__h @ self.__state
+        s = self.__h @ self.__covariance @ self.__h.T + np.eye(3) * self.measurement_noise
+        s_inv = np.linalg.inv(s)
+        if self.gate is not None and innovation @ s_inv @ innovation > self.gate:
+            return False
+        gain = self.__covariance @ self.__h.T @ s_inv
+        self.__state = self.__state + gain @ innovation
+        self.__covariance = (np.eye(self.__state.size) - gain @ self.__h) @ self.__covariance
+        return True
+
+    @staticmethod
+    def position_of(measurement: Any) -> Optional[np.ndarray]:
+        if measurement is None:
+            return None
+        if isinstance(measurement, Sphere):
+            return np.asarray(measurement.position, dtype=np.float64)
+        return np.array([measurement["x"], measurement["y"], measurement["z"]], dtype=np.float64)
+
+    def predict_position(self, dt: Optional[float] = None) -> Optional[np.ndarray]:
+        """Position expected ``dt`` seconds (one frame by default) after the last update."""
+        if self.__state is None:
+            return None
+        f, _, control = self.__transition(self.__dt if dt is None else dt)
+        return (f @ self.__state + control)[:3]
+
+    def map(self, envelope):
+        position = self.position_of(envelope.payload)
+
+        now = envelope.captured_monotonic
+        if self.__last_time is not None and now > self.__last_time:
+            self.__dt = now - self.__last_time
+        self.__last_time = now
+
+        predicted = True
+        if self.__state is None:
+            if position is None:
+                return None
+            self.__initialize(position)
+            predicted = False
+        else:
+            self.__predict(self.__dt)
+            if position is not None and self.__update(position):
+                self.__misses = 0
+                predicted = False
+            else:
+                self.__misses += 1
+                if self.__misses > self.max_gap:
+                    self.reset()
+                    if position is None:
+                        return None
+                    # the measurement failed the gate for too long, start over from it
+                    self.__initialize(position)
+                    predicted = False
+
+        if self.on_predict is not None:
+            self.on_predict(self.predict_position())
+
+        x, y, z = self.__state[:3]
+        vx, vy, vz = self.__state[3:6]
+        return {
+            "x": float(x), "y": float(y), "z": float(z),
+            "vx": float(vx), "vy": float(vy), "vz": float(vz),
+            "covariance": self.__covariance[:3, :3].tolist(),
+            "predicted": predicted,
+        }
+
+
+class RoiFeedback:
+    """Projects a predicted 3D position into both eyes and hands it to the
+    segmenters as search hint for their next frame.
+
+    The positions have to be in the frame of the projection matrices, i.e. come
+    from a ``SpatialGeometryTransformer`` using the DLT method or rectified
+    matrices. Only works when the segmenters run in the pipeline process.
+    """
+
+    def __init__(self, left_matrix, right_matrix, left_segmenter, right_segmenter):
+        self.__matrices = (np.asarray(left_matrix, dtype=np.float64),
+                           np.asarray(right_matrix, dtype=np.float64))
+        self.__segmenters = (left_segmenter, right_segmenter)
+
+    def __call__(self, position: Optional[np.ndarray]) -> None:
+        if position is None:
+            return
+        homogeneous = np.append(position, 1.0)
+        for matrix, segmenter in zip(self.__matrices, self.__segmenters):
+            pixel = matrix @ homogeneous
+            if pixel[2] > 0:
+                segmenter.set_search_hint(pixel[:2] / pixel[2])
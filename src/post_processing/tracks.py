@@ -0,0 +1,106 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+from pipeline.pipeline import Mapper
+from post_processing.assignment import assign
+from post_processing.kalman import GRAVITY_MM, KalmanTrajectoryFilter
+
+
+class MultiBallTracker(Mapper):
+    """Keeps persistent IDs for several balls.
+
+    Accepts the lists of positions ``SpatialGeometryTransformer`` makes from a
+    ``StereoMatcher``, as ``{"x", "y", "z"}`` dicts or ``Sphere`` objects. Every
+    track predicts its next position from its velocity and ``gravity``; the
+    positions of a frame are assigned to the tracks with the least total
+    distance, pairs more than ``max_distance`` mm apart are never made.
+    Positions left over start new tracks with new IDs, tracks without a
+    position for more than ``max_gap`` frames are dropped. The velocity is the
+    last displacement, smoothed with ``velocity_smoothing``.
+
+    Emits one dict per track with its ``id``, position, velocity and whether the
+    position is only predicted, ordered by ID.
+    """
+
+    wants_envelope = True
+
+    def __init__(
+            self,
+            max_distance: float = 250.0,
+            max_gap: int = 5,
+            gravity: Optional[Sequence[float]] = GRAVITY_MM,
+            velocity_smoothing: float = 0.5,
+            default_dt: float = 1 / 30,
+    ):
+        super().__init__()
+        self.max_distance = max_distance
+        self.max_gap = max_gap
+        self.gravity = np.zeros(3) if gravity is None else np.asarray(gravity, dtype=np.float64)
+        self.velocity_smoothing = velocity_smoothing
+        self.default_dt = default_dt
+        self.__next_id = 0
+        self.__track_ids = np.empty(0, dtype=np.int64)
+        self.__positions = np.empty((0, 3))
+        self.__velocities = np.empty((0, 3))
+        self.__misses = np.empty(0, dtype=np.int64)
+        self.__last_time: Optional[float] = None
+        self.__dt = default_dt
+
+    def reset(self) -> None:
+        self.__track_ids = np.empty(0, dtype=np.int64)
+        self.__positions = np.empty((0, 3))
+        self.__velocities = np.empty((0, 3))
+        self.__misses = np.empty(0, dtype=np.int64)
+
+    def map(self, envelope):
+        measurements = [KalmanTrajectoryFilter.position_of(item) for item in envelope.payload or []]
+        measured = np.array([m for m in measurements if m is not None]).reshape(-1, 3)
+
+        now = envelope.captured_monotonic
+        if self.__last_time is not None and now > self.__last_time:
+            self.__dt = now - self.__last_time
+        self.__last_time = now
+        dt = self.__dt
+
+        # all tracks move on, the assigned ones are then moved onto their measurement
+        previous = self.__positions
+        self.__positions = previous + self.__velocities * dt + 0.5 * self.gravity * dt ** 2
+        self.__velocities = self.__velocities + self.gravity * dt
+        self.__misses = self.__misses + 1
+
+        distance = np.linalg.norm(self.__positions[:, None] - measured[None], axis=2)
+        rows, cols = assign(np.where(distance <= self.max_distance, distance, np.inf))
+
+        observed = measured[cols]
+        smoothing = self.velocity_smoothing
+        self.__velocities[rows] = smoothing * self.__velocities[rows] \
+            + (1 - smoothing) * (observed - previous[rows]) / dt
+        self.__positions[rows] = observed
+        self.__misses[rows] = 0
+
+        new = np.setdiff1d(np.arange(len(measured)), cols)
+        self.__track_ids = np.concatenate(
+            (self.__track_ids, np.arange(self.__next_id, self.__next_id + len(new))))
+        self.__next_id += len(new)
+        self.__positions = np.concatenate((self.__positions, measured[new]))
+        self.__velocities = np.concatenate((self.__velocities, np.zeros((len(new), 3))))
+        self.__misses = np.concatenate((self.__misses, np.zeros(len(new), dtype=np.int64)))
+
+        alive = self.__misses <= self.max_gap
+        self.__track_ids = self.__track_ids[alive]
+        self.__positions = self.__positions[alive]
+        self.__velocities = self.__velocities[alive]
+        self.__misses = self.__misses[alive]
+
+        return [
+            {
+                "id": int(track_id),
+                "x": float(x), "y": float(y), "z": float(z),
+                "vx": float(vx), "vy": float(vy), "vz": float(vz),
+                "predicted": bool(misses > 0),
+            }
+            # new tracks are appended, so the tracks are ordered by ID
+            for track_id, (x, y, z), (vx, vy, vz), misses in zip(
+                self.__track_ids, self.__positions, self.__velocities, self.__misses)
+        ]
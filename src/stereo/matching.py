@@ -0,0 +1,68 @@
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from geometry.geom import Circle
+from pipeline.pipeline import Mapper
+from post_processing.assignment import assign
+from stereo.rectify import StereoRectification
+
+
+class StereoMatcher(Mapper):
+    """Pairs the detections of both eyes, e.g. of two ``ColorSegmenter`` with
+    ``max_objects`` above one in a ``StereoMapper``.
+
+    In rectified images a ball appears in the same row of both eyes with about
+    the same radius, and further left in the right eye. A pair costs its row
+    difference over ``row_tolerance`` pixels squared plus its relative radius
+    difference over ``radius_tolerance`` squared. Pairs outside either tolerance
+    or with a disparity outside ``min_disparity`` to ``max_disparity`` are never
+    made, the others are assigned with the least total cost. All costs of a
+    frame are computed at once. With ``rectification`` the detections are
+    rectified first, which the row test needs unless the frames already are.
+
+    Emits a list of (left, right) ``Circle`` pairs for ``SpatialGeometryTransformer``.
+    """
+
+    def __init__(self, row_tolerance: float = 4.0, radius_tolerance: float = 0.3,
+                 min_disparity: float = 0.0, max_disparity: Optional[float] = None,
+                 rectification: Optional[StereoRectification] = None):
+        super().__init__()
+        self.row_tolerance = row_tolerance
+        self.radius_tolerance = radius_tolerance
+        self.min_disparity = min_disparity
+        self.max_disparity = max_disparity
+        self.rectification = rectification
+
+    def __eye(self, detections: List[Any], eye: int) -> Tuple[np.ndarray, np.ndarray]:
+        centers = np.array([detection.center for detection in detections], dtype=np.float64)
+        radii = np.array([detection.radius for detection in detections], dtype=np.float64)
+        if self.rectification is not None:
+            centers = self.rectification.rectify_points(centers, eye)
+            radii = radii * self.rectification.scale(eye)
+        return centers, radii
+
+    def cost(self, left_centers: np.ndarray, left_radii: np.ndarray,
+             right_centers: np.ndarray, right_radii: np.ndarray) -> np.ndarray:
+        """(left, right) cost matrix, inf for pairs that must not be made."""
+        rows = (left_centers[:, None, 1] - right_centers[None, :, 1]) / self.row_tolerance
+        larger = np.maximum(left_radii[:, None], right_radii[None, :])
+        radii = (left_radii[:, None] - right_radii[None, :]) / (np.maximum(larger, 1e-9) * self.radius_tolerance)
+        disparity = left_centers[:, None, 0] - right_centers[None, :, 0]
+
+        feasible = (np.abs(rows) <= 1) & (np.abs(radii) <= 1) & (disparity >= self.min_disparity)
+        if self.max_disparity is not None:
+            feasible &= disparity <= self.max_disparity
+        return np.where(feasible, rows ** 2 + radii ** 2, np.inf)
+
+    def map(self, obj: Any) -> List[Tuple[Circle, Circle]]:
+        left, right = obj
+        if not left or not right:
+            return []
+        left_centers, left_radii = self.__eye(left, 0)
+        right_centers, right_radii = self.__eye(right, 1)
+        rows, cols = assign(self.cost(left_centers, left_radii, right_centers, right_radii))
+        return [
+            (Circle(left_centers[i], left_radii[i]), Circle(right_centers[j], right_radii[j]))
+            for i, j in zip(rows, cols)
+        ]
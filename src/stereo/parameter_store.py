@@ -0,0 +1,134 @@
+import hashlib
+import os
+import struct
+import zipfile
+from typing import Dict, Iterator, Mapping
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+# entries describing the store itself, not covered by the checksum
+SCHEMA_KEY = "schema_version"
+CHECKSUM_KEY = "checksum"
+# fixed part of a zip local file header, followed by the name and the extra field
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+
+class ParameterStoreError(Exception):
+    pass
+
+
+def _checksum(arrays: Mapping[str, np.ndarray]) -> str:
+    sha = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        sha.update(name.encode())
+        sha.update(array.dtype.str.encode())
+        sha.update(str(array.shape).encode())
+        sha.update(array.tobytes())
+    return sha.hexdigest()
+
+
+def save_parameters(path: str, **arrays: np.ndarray) -> None:
+    """Writes the arrays into an uncompressed ``.npz`` with schema version and checksum.
+
+    The file is written next to ``path`` and renamed, so readers never see a
+    partially written store.
+    """
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    for key in (SCHEMA_KEY, CHECKSUM_KEY):
+        if key in arrays:
+            raise ValueError(f"{key} is reserved")
+    temporary = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        temporary,
+        **arrays,
+        **{SCHEMA_KEY: np.array(SCHEMA_VERSION), CHECKSUM_KEY: np.array(_checksum(arrays))},
+    )
+    os.replace(temporary, path)
+
+
+class ParameterStore(Mapping[str, np.ndarray]):
+    """Read only view of a store written by ``save_parameters``.
+
+    Only the zip directory is read on open. Every array is memory mapped on first
+    access straight from its position in the file, so large entries like remap
+    tables cost nothing until they are used and are shared between processes by
+    the page cache. ``verify`` reads everything once to compare the checksum.
+    """
+
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        self.__offsets: Dict[str, int] = {}
+        self.__arrays: Dict[str, np.ndarray] = {}
+        with open(path, "rb") as file, zipfile.ZipFile(file) as archive:
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ParameterStoreError(f"{info.filename} in {path} is compressed")
+                file.seek(info.header_offset)
+                header = LOCAL_HEADER.unpack(file.read(LOCAL_HEADER.size))
+                name_length, extra_length = header[-2:]
+                self.__offsets[info.filename[:-len(".npy")]] = (
+                    info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+                )
+
+        if SCHEMA_KEY not in self.__offsets:
+            raise ParameterStoreError(f"{path} is not a parameter store")
+        self.schema_version = int(self[SCHEMA_KEY])
+        if self.schema_version > SCHEMA_VERSION:
+            raise ParameterStoreError(
+                f"{path} has schema version {self.schema_version}, "
+                f"only up to {SCHEMA_VERSION} is supported"
+            )
+        if verify:
+            self.verify()
+
+    def __getstate__(self):
+        # mappings are cheap to recreate and should not be copied into other processes
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        array = self.__arrays.get(name)
+        if array is None:
+            array = self.__map(name)
+            self.__arrays[name] = array
+        return array
+
+    def __map(self, name: str) -> np.ndarray:
+        if name not in self.__offsets:
+            raise KeyError(name)
+        with open(self.path, "rb") as file:
+            file.seek(self.__offsets[name])
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            offset = file.tell()
+        if dtype.hasobject:
+            raise ParameterStoreError(f"{name} in {self.path} holds python objects")
+        if not shape or 0 in shape:
+            # memmap can not map empty or scalar arrays, they are tiny anyway
+            with open(self.path, "rb") as file:
+                file.seek(offset)
+                count = int(np.prod(shape))
+                return np.fromfile(file, dtype=dtype, count=count).reshape(shape)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                         order="F" if fortran_order else "C")
+
+    def __contains__(self, name) -> bool:
+        return name in self.__offsets
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in self.__offsets if name not in (SCHEMA_KEY, CHECKSUM_KEY))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def verify(self) -> None:
+        expected = str(self[CHECKSUM_KEY])
+        if _checksum({name: self[name] for name in self}) != expected:
+            raise ParameterStoreError(f"Checksum mismatch in {self.path}")
@@ -0,0 +1,230 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from geometry.geom import Circle
+from pipeline.pipeline import Mapper
+from stereo.parameter_store import ParameterStore
+
+# remap tables only depend on the calibration, so they survive restarts here
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ball_motion", "rectify")
+
+
+@dataclass
+class StereoCalibration:
+    """Intrinsics of both cameras and the pose of the right camera relative to the left."""
+
+    left_matrix: np.ndarray
+    left_distortion: np.ndarray
+    right_matrix: np.ndarray
+    right_distortion: np.ndarray
+    rotation: np.ndarray
+    translation: np.ndarray
+    # width, height
+    image_size: Tuple[int, int]
+
+    @staticmethod
+    def load(path: str) -> 'StereoCalibration':
+        return StereoCalibration.from_parameters(ParameterStore(path))
+
+    @staticmethod
+    def from_parameters(parameters: Mapping[str, np.ndarray]) -> 'StereoCalibration':
+        """Reads the keys K1, D1, K2, D2, R, T and image_size, e.g. of a ``ParameterStore``."""
+        return StereoCalibration(
+            *(np.array(parameters[key]) for key in ("K1", "D1", "K2", "D2", "R", "T")),
+            tuple(int(i) for i in parameters["image_size"]),
+        )
+
+    def parameters(self) -> Dict[str, np.ndarray]:
+        return {
+            "K1": self.left_matrix, "D1": self.left_distortion,
+            "K2": self.right_matrix, "D2": self.right_distortion,
+            "R": self.rotation, "T": self.translation,
+            "image_size": np.array(self.image_size),
+        }
+
+    def digest(self) -> str:
+        sha = hashlib.sha1()
+        for array in (self.left_matrix, self.left_distortion, self.right_matrix,
+                      self.right_distortion, self.rotation, self.translation,
+                      np.array(self.image_size)):
+            sha.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return sha.hexdigest()
+
+
+class StereoRectification:
+    """Rectifying transforms of a calibrated stereo pair.
+
+    ``cv2.stereoRectify`` runs on construction, the remap tables are built on
+    first use and cached in ``cache_dir`` under the hash of the calibration.
+    Both are taken from ``parameters`` instead if they were stored there for the
+    same ``alpha``, see ``parameters()``.
+    ``left_projection`` and ``right_projection`` are the projection matrices of
+    the rectified cameras to triangulate with; the resulting positions are in
+    the frame of the rectified left camera, i.e. rotated by ``left_rotation``
+    with respect to the physical one.
+    """
+
+    def __init__(self, calibration: StereoCalibration, alpha: float = 0.0,
+                 cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 parameters: Optional[Mapping[str, np.ndarray]] = None):
+        self.calibration = calibration
+        self.alpha = alpha
+        self.cache_dir = cache_dir
+        if parameters is not None and "rectify_alpha" in parameters \
+                and float(parameters["rectify_alpha"]) == alpha:
+            self.__parameters = parameters
+            (self.left_rotation, self.right_rotation, self.left_projection,
+             self.right_projection, self.disparity_to_depth) = (
+                np.array(parameters[key]) for key in ("R1", "R2", "P1", "P2", "Q")
+            )
+        else:
+            self.__parameters = None
+            (self.left_rotation, self.right_rotation, self.left_projection,
+             self.right_projection, self.disparity_to_depth, _, _) = cv2.stereoRectify(
+                calibration.left_matrix, calibration.left_distortion,
+                calibration.right_matrix, calibration.right_distortion,
+                calibration.image_size, calibration.rotation,
+                np.asarray(calibration.translation, dtype=np.float64).reshape(3, 1),
+                flags=cv2.CALIB_ZERO_DISPARITY, alpha=alpha,
+            )
+        self.__maps = {}
+
+    @staticmethod
+    def load(path: str, **kwargs) -> 'StereoRectification':
+        """Calibration and, if present, rectification of a ``ParameterStore``."""
+        store = ParameterStore(path)
+        return StereoRectification(StereoCalibration.from_parameters(store), parameters=store, **kwargs)
+
+    def parameters(self, include_maps: bool = True) -> Dict[str, np.ndarray]:
+        """Rectification, pseudo inverses of the projections and optionally the remap tables."""
+        parameters = {
+            "rectify_alpha": np.array(self.alpha),
+            "R1": self.left_rotation, "R2": self.right_rotation,
+            "P1": self.left_projection, "P2": self.right_projection,
+            "P1_pinv": np.linalg.pinv(self.left_projection),
+            "P2_pinv": np.linalg.pinv(self.right_projection),
+            "Q": self.disparity_to_depth,
+        }
+        if include_maps:
+            if not self.__maps:
+                self.__maps = self.__load_maps()
+            parameters.update(self.__maps)
+        return parameters
+
+    def __getstate__(self):
+        # the tables are large, a child process rather maps or reads them again
+        state = self.__dict__.copy()
+        state["_StereoRectification__maps"] = {}
+        return state
+
+    def __eye(self, eye: int):
+        calibration = self.calibration
+        if eye == 0:
+            return (calibration.left_matrix, calibration.left_distortion,
+                    self.left_rotation, self.left_projection)
+        return (calibration.right_matrix, calibration.right_distortion,
+                self.right_rotation, self.right_projection)
+
+    def maps(self, eye: int, fixed_point: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """Remap tables of the left (0) or right (1) camera.
+
+        The fixed point ``CV_16SC2`` variant is about twice as fast to remap with
+        at a negligible loss of precision.
+        """
+        if not self.__maps:
+            self.__maps = self.__load_maps()
+        prefix = "fixed" if fixed_point else "float"
+        return self.__maps[f"map_{prefix}{eye}_x"], self.__maps[f"map_{prefix}{eye}_y"]
+
+    def __cache_path(self) -> str:
+        key = f"{self.calibration.digest()}_{self.alpha:g}"
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def __load_maps(self) -> dict:
+        names = [f"map_{prefix}{eye}_{axis}" for prefix in ("float", "fixed")
+                 for eye in (0, 1) for axis in "xy"]
+        if self.__parameters is not None and all(name in self.__parameters for name in names):
+            return {name: self.__parameters[name] for name in names}
+
+        path = self.__cache_path() if self.cache_dir is not None else None
+        if path is not None and os.path.exists(path):
+            with np.load(path) as data:
+                return dict(data)
+
+        maps = {}
+        for eye in (0, 1):
+            matrix, distortion, rotation, projection = self.__eye(eye)
+            map_x, map_y = cv2.initUndistortRectifyMap(
+                matrix, distortion, rotation, projection,
+                self.calibration.image_size, cv2.CV_32FC1,
+            )
+            fixed_x, fixed_y = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+            maps.update({
+                f"map_float{eye}_x": map_x, f"map_float{eye}_y": map_y,
+                f"map_fixed{eye}_x": fixed_x, f"map_fixed{eye}_y": fixed_y,
+            })
+
+        if path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # written next to the target and renamed so concurrent readers never see half a file
+            temporary = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(temporary, **maps)
+            os.replace(temporary, path)
+        return maps
+
+    def remap(self, frame: np.ndarray, eye: int, fixed_point: bool = True,
+              dst: Optional[np.ndarray] = None) -> np.ndarray:
+        map_x, map_y = self.maps(eye, fixed_point)
+        return cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, dst=dst)
+
+    def rectify_points(self, points: np.ndarray, eye: int) -> np.ndarray:
+        """Maps (N, 2) raw pixel coordinates into the rectified image."""
+        matrix, distortion, rotation, projection = self.__eye(eye)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        return cv2.undistortPoints(points, matrix, distortion, R=rotation, P=projection).reshape(-1, 2)
+
+    def scale(self, eye: int) -> float:
+        """Approximate ratio of rectified to raw pixel sizes, e.g. for radii."""
+        matrix, _, _, projection = self.__eye(eye)
+        return float(projection[0, 0] / matrix[0, 0])
+
+
+class StereoFrameRectifier(Mapper):
+    """Remaps both frames of a stereo pair into the rectified images."""
+
+    def __init__(self, rectification: StereoRectification, fixed_point: bool = True):
+        super().__init__()
+        self.rectification = rectification
+        self.fixed_point = fixed_point
+
+    def map(self, obj: Any) -> Any:
+        return tuple(
+            self.rectification.remap(frame, eye, self.fixed_point)
+            for eye, frame in enumerate(obj)
+        )
+
+
+class StereoCircleRectifier(Mapper):
+    """Moves the detected circles of both eyes into rectified coordinates.
+
+    Only the centers are undistorted, which costs next to nothing compared to
+    remapping whole frames and is all the triangulation needs.
+    """
+
+    def __init__(self, rectification: StereoRectification):
+        super().__init__()
+        self.rectification = rectification
+
+    def map(self, obj: Any) -> Any:
+        return tuple(self.__rectify(circle, eye) for eye, circle in enumerate(obj))
+
+    def __rectify(self, circle: Optional[Circle], eye: int) -> Optional[Circle]:
+        if circle is None:
+            return None
+        position = self.rectification.rectify_points(circle.position, eye)[0]
+        return Circle(position, circle.radius * self.rectification.scale(eye))
@@ -0,0 +1,257 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from geometry.geom import Sphere
+from pipeline.envelope import Envelope
+from pipeline.pipeline import Supplier
+from post_processing.kalman import GRAVITY_MM
+
+# LAB color of the ball in src/main.py
+BALL_LAB = (200, 157, 199)
+
+
+def stereo_matrices(focal: float = 700.0, principal: Tuple[float, float] = (640.0, 360.0),
+                    baseline: float = 120.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Projection matrices of an ideal rectified pair, the right camera sits ``baseline`` mm
+    to the right, i.e. ``Tx = -fx * B`` as described in src/main.py."""
+    cx, cy = principal
+    left = np.array([[focal, 0, cx, 0], [0, focal, cy, 0], [0, 0, 1, 0]], dtype=np.float64)
+    right = left.copy()
+    right[0, 3] = -focal * baseline
+    return left, right
+
+
+def ballistic_trajectory(count: int, fps: float = 60.0,
+                         start: Sequence[float] = (-500.0, 300.0, 1500.0),
+                         velocity: Sequence[float] = (1600.0, -3000.0, 400.0),
+                         gravity: Sequence[float] = GRAVITY_MM) -> np.ndarray:
+    """(count, 3) positions in mm of a ball sampled at ``fps``, thrown again from
+    ``start`` every time it falls back to its starting height."""
+    start, velocity, gravity = (np.asarray(v, dtype=np.float64) for v in (start, velocity, gravity))
+    t = np.arange(count) / fps
+    if velocity[1] * gravity[1] < 0:
+        t = np.mod(t, -2 * velocity[1] / gravity[1])
+    t = t[:, None]
+    return start + velocity * t + 0.5 * gravity * t ** 2
+
+
+def project(matrix: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """(N, 3) world points to (N, 2) pixels."""
+    homogeneous = np.hstack((points, np.ones((len(points), 1)))) @ matrix.T
+    return homogeneous[:, :2] / homogeneous[:, 2:]
+
+
+@dataclass
+class SceneEffects:
+    """Image degradations of ``SyntheticStereoScene``, all off by default."""
+
+    # standard deviation of the sensor noise in gray levels
+    noise: float = 0.0
+    # width in pixels of the soft edge of every sphere, like defocus
+    blur: float = 0.0
+    # relative amplitude of a global brightness flicker and its period in seconds
+    lighting: float = 0.0
+    lighting_period: float = 1.0
+    # spheres of other colors drifting through the scene
+    distractors: int = 0
+    # LAB color of the distractors, random colors unlike the ball by default
+    distractor_lab: Optional[Sequence[int]] = None
+
+
+class SyntheticStereoScene:
+    """Renders balls of ``radius`` mm into both eyes of ``stereo_matrices`` over a
+    textured background, side by side like the stereo camera delivers them.
+
+    Frames are rendered in batches: the background of every frame is written in
+    one pass that scales by the lighting to one of ``NOISE_VARIANTS`` pre-noised
+    backgrounds, then only the small patches covered by spheres are composited,
+    nearest last. Times in seconds drive the lighting and the distractors.
+    """
+
+    NOISE_VARIANTS = 8
+    NOISE_TILE = 256
+    # distractors start in this box in mm and drift with up to DISTRACTOR_SPEED mm/s
+    DISTRACTOR_BOX = ((-900.0, -500.0, 1000.0), (900.0, 500.0, 3000.0))
+    DISTRACTOR_SPEED = 400.0
+
+    def __init__(self, resolution: Tuple[int, int] = (1280, 720), radius: float = 40.0,
+                 color_lab: Sequence[int] = BALL_LAB, seed: int = 0,
+                 effects: Optional[SceneEffects] = None, **camera):
+        self.resolution = resolution
+        self.radius = radius
+        self.effects = effects or SceneEffects()
+        self.left_matrix, self.right_matrix = stereo_matrices(**camera)
+        width, height = resolution
+        self.__rng = np.random.default_rng(seed)
+        background = self.__rng.integers(30, 120, (height, width, 3), dtype=np.uint8)
+        background = np.hstack((cv2.GaussianBlur(background, (21, 21), 5),) * 2)
+        self.color = self.lab_to_bgr(color_lab)
+
+        if self.effects.noise > 0:
+            noise = self.__rng.standard_normal((self.NOISE_VARIANTS,) + background.shape, dtype=np.float32)
+            self.__backgrounds = np.clip(background + noise * self.effects.noise, 0, 255).astype(np.uint8)
+            # the spheres take their noise from random windows of this tile
+            self.__patch_noise = noise[0, :self.NOISE_TILE, :self.NOISE_TILE] * self.effects.noise
+        else:
+            self.__backgrounds = background[None]
+
+        count = self.effects.distractors
+        low, high = (np.array(corner) for corner in self.DISTRACTOR_BOX)
+        self.distractor_start = self.__rng.uniform(low, high, (count, 3))
+        self.distractor_velocity = self.__rng.uniform(-1, 1, (count, 3)) * self.DISTRACTOR_SPEED
+        self.distractor_radius = self.__rng.uniform(0.5, 1.5, count) * radius
+        if self.effects.distractor_lab is not None:
+            lab = np.tile(self.effects.distractor_lab, (count, 1))
+        else:
+            # a and b at least 40 away from the ball so the color segmentation can tell them apart
+            offsets = self.__rng.uniform(40, 100, (count, 2)) * self.__rng.choice((-1, 1), (count, 2))
+            lab = np.column_stack((self.__rng.uniform(80, 230, count),
+                                   np.clip(np.array(color_lab[1:]) + offsets, 0, 255)))
+        self.distractor_colors = [self.lab_to_bgr(color) for color in lab]
+
+    @staticmethod
+    def lab_to_bgr(lab: Sequence[float]) -> np.ndarray:
+        return cv2.cvtColor(np.uint8([[lab]]), cv2.COLOR_LAB2BGR)[0, 0].astype(np.float32)
+
+    def distractors(self, t: float) -> np.ndarray:
+        """(distractors, 3) positions in mm at ``t`` seconds."""
+        return self.distractor_start + self.distractor_velocity * t
+
+    def gain(self, t: float) -> float:
+        if not self.effects.lighting:
+            return 1.0
+        return 1.0 + self.effects.lighting * np.sin(2 * np.pi * t / self.effects.lighting_period)
+
+    def spheres(self, positions: np.ndarray) -> List[Sphere]:
+        """Ground truth of one frame of ``render_batch``."""
+        return [Sphere(position, self.radius) for position in np.reshape(positions, (-1, 3))]
+
+    def render(self, position: np.ndarray, t: float = 0.0) -> np.ndarray:
+        return self.render_batch(np.asarray(position)[None], np.array([t]))[0]
+
+    def render_batch(self, positions: np.ndarray, times: Optional[np.ndarray] = None,
+                     fps: float = 60.0) -> np.ndarray:
+        """(N, 3) or (N, balls, 3) ball positions in mm to (N, height, 2 * width, 3)
+        frames, ``times`` default to the frame index over ``fps``."""
+        positions = np.asarray(positions, dtype=np.float64).reshape(len(positions), -1, 3)
+        count, balls = positions.shape[:2]
+        times = np.arange(count) / fps if times is None else np.asarray(times)
+        width, height = self.resolution
+
+        # every sphere of the batch at once: balls first, then the distractors
+        distractors = self.distractor_start + self.distractor_velocity * times[:, None, None]
+        points = np.concatenate((positions, distractors), axis=1)
+        radii = np.concatenate((np.full(balls, self.radius), self.distractor_radius))
+        colors = [self.color] * balls + self.distractor_colors
+        flat = points.reshape(-1, 3)
+        centers = [project(matrix, flat).reshape(count, -1, 2)
+                   for matrix in (self.left_matrix, self.right_matrix)]
+        pixel_radii = self.left_matrix[0, 0] * radii / np.maximum(points[..., 2], 1e-6)
+        order = np.argsort(-points[..., 2], axis=1)
+
+        frames = np.empty((count, height, 2 * width, 3), dtype=np.uint8)
+        for i in range(count):
+            gain = self.gain(times[i])
+            background = self.__backgrounds[self.__rng.integers(len(self.__backgrounds))]
+            if gain == 1.0:
+                np.copyto(frames[i], background)
+            else:
+                # saturating scale in one pass, a lot faster than cv2.LUT here
+                cv2.convertScaleAbs(background, frames[i], gain)
+            for j in order[i]:
+                if points[i, j, 2] <= 0:
+                    continue
+                for eye, offset in ((0, 0), (1, width)):
+                    self.__paint(frames[i], centers[eye][i, j], pixel_radii[i, j], colors[j] * gain,
+                                 offset, width)
+        return frames
+
+    def __paint(self, frame: np.ndarray, center: np.ndarray, radius: float, color: np.ndarray,
+                offset: int, width: int) -> None:
+        # a linear ramp of the coverage over the edge anti-aliases it, a wider one blurs it
+        edge = max(1.0, self.effects.blur)
+        reach = radius + edge
+        x0, y0 = (max(int(np.floor(c - reach)), 0) for c in center)
+        x1, y1 = min(int(np.ceil(center[0] + reach)) + 1, width), \
+            min(int(np.ceil(center[1] + reach)) + 1, frame.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        y, x = np.ogrid[y0:y1, x0:x1]
+        distance = np.sqrt((x - center[0]) ** 2 + (y - center[1]) ** 2, dtype=np.float32)
+        coverage = np.clip((radius - distance) / edge + 0.5, 0, 1)[..., None]
+        layer = np.broadcast_to(color, coverage.shape[:2] + (3,))
+        if self.effects.noise > 0:
+            rows, cols = layer.shape[:2]
+            if rows <= self.NOISE_TILE and cols <= self.NOISE_TILE:
+                top = self.__rng.integers(self.NOISE_TILE - rows + 1)
+                left = self.__rng.integers(self.NOISE_TILE - cols + 1)
+                layer = layer + self.__patch_noise[top:top + rows, left:left + cols]
+            else:
+                layer = layer + self.__rng.standard_normal(layer.shape, dtype=np.float32) * self.effects.noise
+        region = frame[y0:y1, x0 + offset:x1 + offset]
+        blended = region * (1 - coverage) + layer * coverage
+        np.clip(blended + 0.5, 0, 255, out=blended)
+        region[...] = blended
+
+
+class SyntheticStereoSupplier(Supplier):
+    """Supplies the frames of ``scene`` along ``trajectory``, (count, 3) or
+    (count, balls, 3) positions sampled at ``fps``, rendered ``batch_size`` at a time.
+
+    ``ground_truth(sequence)`` returns the spheres of a supplied frame. With
+    ``paced`` frames are released at ``fps`` and rendered one at a time, a batch
+    would hold back every frame due while it renders. Otherwise they are
+    released as fast as they are taken. Without ``loop`` the supplier sets
+    ``finished`` after the last frame and then blocks until stopped.
+    """
+
+    def __init__(self, scene: SyntheticStereoScene, trajectory: np.ndarray, fps: float = 60.0,
+                 paced: bool = False, loop: bool = False, count: Optional[int] = None,
+                 batch_size: int = 16):
+        super().__init__()
+        self.scene = scene
+        self.trajectory = np.asarray(trajectory, dtype=np.float64)
+        self.fps = fps
+        self.paced = paced
+        self.loop = loop
+        self.count = len(self.trajectory) if count is None else count
+        self.batch_size = batch_size
+        self.finished = threading.Event()
+        self.started_at: Optional[float] = None
+        self.__stopped = threading.Event()
+        self.__sequence = 0
+        self.__batch: List[np.ndarray] = []
+
+    def ground_truth(self, sequence: int) -> List[Sphere]:
+        return self.scene.spheres(self.trajectory[sequence % len(self.trajectory)])
+
+    def supply(self) -> Any:
+        if self.__sequence >= self.count and not self.loop:
+            self.finished.set()
+            self.__stopped.wait()
+            return None
+        if not self.__batch:
+            batch_size = 1 if self.paced else self.batch_size
+            sequences = np.arange(self.__sequence, self.__sequence + batch_size)
+            if not self.loop:
+                sequences = sequences[sequences < self.count]
+            positions = self.trajectory[sequences % len(self.trajectory)]
+            self.__batch = list(self.scene.render_batch(positions, sequences / self.fps))
+            self.__batch.reverse()
+        if self.started_at is None:
+            # the clock starts with the first frame, not before rendering it
+            self.started_at = time.monotonic()
+        if self.paced:
+            delay = self.started_at + self.__sequence / self.fps - time.monotonic()
+            if delay > 0:
+                self.__stopped.wait(delay)
+        self.__sequence += 1
+        return Envelope.capture(self.__batch.pop(), self.__sequence - 1)
+
+    def stop(self):
+        self.__stopped.set()
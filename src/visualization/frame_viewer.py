@@ -1,31 +1,116 @@
-from typing import Any
+import threading
+import time
+from typing import Any, Dict, Optional
 
 import cv2
+import numpy as np
 
 from pipeline.pipeline import Consumer
 
 WINDOW_NAME = "View"
 
 
+class DebugViewer:
+    """Shows the debug images of observed components, all windows from one thread.
+
+    Components reach it through ``PipelineComponent.observe``: ``due`` lets at
+    most ``rate`` images per second and window through, so nothing is rendered
+    for the others, and ``publish`` only stores the image as the newest of its
+    window. A slow display therefore drops images instead of slowing down a
+    stage. Without a display the viewer turns itself off on the first image.
+
+    The workers of a thread stage share the viewer, a copy in a process stage
+    shows its images from a thread of that process.
+    """
+
+    # how long the viewer thread waits for images before it lets the GUI handle its events
+    EVENT_INTERVAL = 0.05
+
+    def __init__(self, rate: float = 10.0):
+        self.rate = rate
+        self.shown = 0
+        self.enabled = True
+        self.__interval = 1.0 / rate
+        self.__next_due: Dict[str, float] = {}
+        self.__pending: Dict[str, np.ndarray] = {}
+        self.__condition = threading.Condition()
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def __reduce__(self):
+        # locks and windows can not be copied into a process, the copy starts out fresh
+        return DebugViewer, (self.rate,)
+
+    def __deepcopy__(self, memo):
+        # workers of a stage share the viewer, one GUI thread per process is enough
+        return self
+
+    def due(self, name: str) -> bool:
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        with self.__condition:
+            if now < self.__next_due.get(name, 0.0):
+                return False
+            self.__next_due[name] = now + self.__interval
+            return True
+
+    def publish(self, name: str, image: np.ndarray) -> None:
+        if self.__thread is None:
+            self.start()
+        with self.__condition:
+            self.__pending[name] = image
+            self.__condition.notify()
+
+    def start(self) -> 'DebugViewer':
+        with self.__condition:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="debug-viewer", daemon=True)
+                self.__thread.start()
+        return self
+
+    def __run(self) -> None:
+        try:
+            while not self.__stopped.is_set():
+                with self.__condition:
+                    if not self.__pending:
+                        self.__condition.wait(self.EVENT_INTERVAL)
+                    pending, self.__pending = self.__pending, {}
+                for name, image in pending.items():
+                    cv2.imshow(name, image)
+                    self.shown += 1
+                cv2.waitKey(1)
+            cv2.destroyAllWindows()
+        except cv2.error as error:
+            # headless OpenCV builds or no display
+            print(f"DebugViewer disabled, cannot show images: {error}")
+            self.enabled = False
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout=1.0)
+
+
 class FrameViewer(Consumer):
+    """Hands the frames or stereo pairs reaching it to ``viewer``, anything else
+    is skipped. Stages that do not pass images on, like ``ColorSegmenter`` with
+    its ``Detection`` records, are observed directly with ``attach_observer``
+    instead."""
+
     __window_index = 0
 
-    def __init__(self):
+    def __init__(self, viewer: DebugViewer, name: Optional[str] = None):
         super().__init__()
-        self.__window_name = WINDOW_NAME + "_" + str(FrameViewer.__window_index)
-        FrameViewer.__window_index += 1
+        if name is None:
+            name = WINDOW_NAME + "_" + str(FrameViewer.__window_index)
+            FrameViewer.__window_index += 1
+        self.attach_observer(viewer, name)
 
     def consume(self, obj: Any) -> None:
         if type(obj) is tuple:
-            cv2.imshow(self.__window_name, obj[2])
-            cv2.waitKey(1)
-            cv2.imshow(self.__window_name + "_orig", obj[1])
-            cv2.waitKey(1)
-            cv2.imshow(self.__window_name + "_circle", obj[0])
-            cv2.waitKey(1)
-        else:
-            cv2.imshow(self.__window_name, obj)
-            cv2.waitKey(1)
-
-    def stop(self):
-        cv2.destroyWindow(WINDOW_NAME)
+            for channel, frame in zip(("left", "right"), obj):
+                if isinstance(frame, np.ndarray):
+                    self.observe(frame.copy, channel)
+        elif isinstance(obj, np.ndarray):
+            self.observe(obj.copy)
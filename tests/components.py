@@ -0,0 +1,64 @@
+"""Small pipeline components shared by the tests.
+
+They live in a module of their own so that process stages can unpickle them.
+"""
+import threading
+import time
+
+from pipeline.pipeline import Consumer, Mapper, Supplier
+
+
+class CountingSupplier(Supplier):
+    """Supplies 0, 1, ... ``count - 1`` and then blocks until stopped."""
+
+    def __init__(self, count: int):
+        super().__init__()
+        self.count = count
+        self.__next = 0
+        self.__stopped = threading.Event()
+
+    def supply(self):
+        if self.__next >= self.count:
+            self.__stopped.wait()
+            return None
+        self.__next += 1
+        return self.__next - 1
+
+    def stop(self):
+        self.__stopped.set()
+
+
+class SleepingMapper(Mapper):
+    """Doubles numbers after sleeping ``seconds``."""
+
+    def __init__(self, seconds: float = 0.0):
+        super().__init__()
+        self.seconds = seconds
+
+    def map(self, obj):
+        time.sleep(self.seconds)
+        return obj * 2
+
+
+class Collector(Consumer):
+    """Collects what reaches it and sets ``done`` after ``count`` items."""
+
+    def __init__(self, count: int, wants_envelope: bool = False):
+        super().__init__()
+        self.count = count
+        self.wants_envelope = wants_envelope
+        self.items = []
+        self.done = threading.Event()
+
+    def consume(self, obj):
+        self.items.append(obj)
+        if len(self.items) == self.count:
+            self.done.set()
+
+
+def run_until_collected(pipeline, collector, timeout: float = 30.0) -> None:
+    pipeline.run()
+    try:
+        assert collector.done.wait(timeout)
+    finally:
+        pipeline.stop()
@@ -0,0 +1,110 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from post_processing import assignment
+from post_processing.assignment import assign
+
+
+@pytest.fixture
+def greedy(monkeypatch):
+    monkeypatch.setattr(assignment, "linear_sum_assignment", None)
+
+
+@pytest.fixture(params=["hungarian", "greedy"])
+def method(request):
+    if request.param == "hungarian":
+        if assignment.linear_sum_assignment is None:
+            pytest.skip("scipy is not installed")
+    else:
+        request.getfixturevalue("greedy")
+    return request.param
+
+
+def brute_force(cost):
+    """Least total cost among the pairings with the most feasible pairs, for N <= M."""
+    rows, cols = cost.shape
+    best = (0, 0.0)
+    for chosen in itertools.permutations(range(cols), rows):
+        pairs = [cost[row, col] for row, col in enumerate(chosen) if np.isfinite(cost[row, col])]
+        best = max(best, (len(pairs), -sum(pairs)))
+    return best[0], -best[1]
+
+
+def total(cost, rows, cols):
+    return cost[rows, cols].sum()
+
+
+def assert_valid(cost, rows, cols):
+    assert len(set(rows)) == len(rows) and len(set(cols)) == len(cols)
+    assert np.isfinite(cost[rows, cols]).all()
+
+
+def test_empty(method):
+    for cost in (np.zeros((0, 0)), np.zeros((0, 3)), np.zeros((2, 0)), np.full((2, 2), np.inf)):
+        rows, cols = assign(cost)
+        assert len(rows) == len(cols) == 0
+
+
+def test_clear_cut(method):
+    cost = np.array([
+        [9.0, 0.1, 9.0],
+        [0.2, 9.0, 9.0],
+        [9.0, 9.0, 0.3],
+    ])
+    rows, cols = assign(cost)
+    assert sorted(zip(rows, cols)) == [(0, 1), (1, 0), (2, 2)]
+
+
+def test_never_pairs_infeasible(method):
+    cost = np.array([
+        [1.0, np.inf, np.inf],
+        [np.inf, np.inf, np.inf],
+        [np.inf, 2.0, np.inf],
+    ])
+    rows, cols = assign(cost)
+    assert sorted(zip(rows, cols)) == [(0, 0), (2, 1)]
+
+
+def test_rectangular(method):
+    cost = np.array([[5.0, 1.0, 7.0, 3.0], [2.0, 8.0, 1.5, 9.0]])
+    for matrix in (cost, cost.T):
+        rows, cols = assign(matrix)
+        assert_valid(matrix, rows, cols)
+        assert len(rows) == 2
+        assert total(matrix, rows, cols) == pytest.approx(2.5)
+
+
+def test_hungarian_is_optimal():
+    if assignment.linear_sum_assignment is None:
+        pytest.skip("scipy is not installed")
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        cost = rng.random((4, 5))
+        cost[rng.random(cost.shape) < 0.3] = np.inf
+        rows, cols = assign(cost)
+        assert_valid(cost, rows, cols)
+        count, best = brute_force(cost)
+        assert len(rows) == count
+        assert total(cost, rows, cols) == pytest.approx(best)
+
+
+def test_greedy_is_feasible_and_never_better(greedy):
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        cost = rng.random((4, 5))
+        cost[rng.random(cost.shape) < 0.3] = np.inf
+        rows, cols = assign(cost)
+        assert_valid(cost, rows, cols)
+        count, best = brute_force(cost)
+        assert len(rows) <= count
+        if len(rows) == count:
+            assert total(cost, rows, cols) >= best - 1e-9
+
+
+def test_greedy_can_miss_pairs(greedy):
+    # taking the cheapest pair first leaves the second row without a partner
+    cost = np.array([[1.0, 2.0], [3.0, np.inf]])
+    rows, cols = assign(cost)
+    assert list(zip(rows, cols)) == [(0, 0)]
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from capture.frame_supplier import FrameSupplier, SynchronizedStereoSupplier
+from pipeline.envelope import Envelope
+from capture.grabber import CaptureThread
+
+
+class FakeCapture:
+    """Stands in for a cv2.VideoCapture, every frame holds its own index.
+
+    After ``count`` frames ``grab`` fails like a device that stopped delivering.
+    """
+
+    def __init__(self, count=None, interval=0.002, offset_msec=0.0, period_msec=33.0):
+        self.count = count
+        self.interval = interval
+        self.offset_msec = offset_msec
+        self.period_msec = period_msec
+        self.index = -1
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self.offset_msec + self.index * self.period_msec
+        return 0.0
+
+    def grab(self):
+        if self.count is not None and self.index + 1 >= self.count:
+            return False
+        time.sleep(self.interval)
+        self.index += 1
+        return True
+
+    def retrieve(self):
+        return True, np.array([self.index])
+
+    def read(self):
+        return (True, np.array([self.index])) if self.grab() else (False, None)
+
+    def release(self):
+        self.released = True
+
+
+def stop_later(component, delay=0.2):
+    timer = threading.Timer(delay, component.stop)
+    timer.start()
+    return timer
+
+
+def test_take_latest_counts_the_skipped_frames():
+    capture = FakeCapture(count=10, interval=0.0)
+    grabber = CaptureThread(capture, buffer_size=1).start()
+    time.sleep(0.2)
+    grabbed, skipped = grabber.take_latest(1.0)
+    assert grabbed.frame[0] == 9
+    assert skipped == 9
+    # nothing new arrives from the exhausted device
+    assert grabber.take_latest(0.05) == (None, 0)
+    grabber.stop()
+    assert capture.released
+
+
+def test_pairs_frames_by_device_time():
+    # the right device started a frame earlier and is 3 ms ahead of the left one since
+    left = FakeCapture(count=20)
+    right = FakeCapture(count=21, offset_msec=-30.0)
+    supplier = SynchronizedStereoSupplier(left, right, use_device_time=True, tolerance=0.008)
+    try:
+        pairs = [supplier.supply() for _ in range(10)]
+    finally:
+        supplier.stop()
+    for sequence, envelope in enumerate(pairs):
+        left_frame, right_frame = envelope.payload
+        assert envelope.sequence == sequence
+        assert right_frame[0] == left_frame[0] + 1
+    assert supplier.dropped >= 1
+    assert left.released and right.released
+
+
+def test_stop_ends_the_wait_for_a_pair():
+    supplier = SynchronizedStereoSupplier(FakeCapture(count=2), FakeCapture(count=0), use_device_time=True)
+    timer = stop_later(supplier)
+    started = time.monotonic()
+    assert supplier.supply() is None
+    assert time.monotonic() - started < 2.0
+    timer.join()
+
+
+def test_frame_supplier_reads_in_the_foreground():
+    supplier = FrameSupplier(FakeCapture(count=3, interval=0.0))
+    assert [supplier.supply()[0] for _ in range(3)] == [0, 1, 2]
+    assert supplier.supply() is None
+
+
+def test_background_supplier_hands_out_the_freshest_frame():
+    capture = FakeCapture(count=50, interval=0.001)
+    supplier = FrameSupplier(capture, background=True)
+    try:
+        time.sleep(0.2)
+        first = supplier.supply()
+        second = supplier.supply()
+    finally:
+        supplier.stop()
+    assert isinstance(first, Envelope)
+    assert first.payload[0] == 49
+    assert first.skipped == 49 and supplier.skipped == 49
+    assert (first.sequence, second) == (0, None)
+    assert first.captured_monotonic <= time.monotonic()
+    assert capture.released
+
+
+def test_background_supplier_can_be_stopped_without_frames():
+    supplier = FrameSupplier(FakeCapture(count=0), background=True)
+    timer = stop_later(supplier)
+    started = time.monotonic()
+    assert supplier.supply() is None
+    assert time.monotonic() - started < 2.0
+    timer.join()
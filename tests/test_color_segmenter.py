@@ -0,0 +1,99 @@
+import cv2
+import numpy as np
+import pytest
+
+from detection.color_thresholding import ColorSegmenter
+
+BALL_BGR = (40, 60, 220)
+BACKGROUND_BGR = (90, 140, 60)
+BASE_COLOR = cv2.cvtColor(np.uint8([[BALL_BGR]]), cv2.COLOR_BGR2LAB)[0, 0].astype(np.float32)
+TOLERANCE = [0.5, 0.06, 0.06]
+# a smaller blob of the ball's color far away from the ball's path
+DISTRACTOR = ((580, 420), 9)
+
+
+class RecordingObserver:
+    def __init__(self):
+        self.images = {}
+
+    def due(self, name):
+        return True
+
+    def publish(self, name, image):
+        self.images[name] = image
+
+
+def frame_with_ball(center, radius=20, seed=0):
+    frame = np.full((480, 640, 3), BACKGROUND_BGR, dtype=np.uint8)
+    cv2.circle(frame, DISTRACTOR[0], DISTRACTOR[1], BALL_BGR, -1)
+    cv2.circle(frame, tuple(int(round(value)) for value in center), radius, BALL_BGR, -1)
+    noise = np.random.default_rng(seed).integers(-6, 7, frame.shape)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def trajectory(count=8):
+    return [(120.0 + 25 * step, 100.0 + 15 * step) for step in range(count)]
+
+
+def assert_same_ball(detection, reference, center):
+    assert detection is not None and reference is not None
+    np.testing.assert_allclose(detection.center, reference.center, atol=1.0)
+    np.testing.assert_allclose(detection.axes, reference.axes, atol=2.0)
+    np.testing.assert_allclose(detection.center, center, atol=1.5)
+
+
+@pytest.mark.parametrize("classifier", ["lab", "lut"])
+def test_tracking_window_finds_the_same_ball(classifier):
+    full = ColorSegmenter(BASE_COLOR, TOLERANCE, classifier=classifier)
+    tracking = ColorSegmenter(BASE_COLOR, TOLERANCE, classifier=classifier, track=True)
+    observer = RecordingObserver()
+    tracking.attach_observer(observer, "tracking")
+    for step, center in enumerate(trajectory()):
+        frame = frame_with_ball(center, seed=step)
+        assert_same_ball(tracking.map(frame), full.map(frame), center)
+        if step > 0:
+            # from the second frame on only the window around the predicted position is searched
+            mask = observer.images["tracking_mask"]
+            assert mask[DISTRACTOR[0][1], DISTRACTOR[0][0]] == 0
+            ys, xs = np.nonzero(mask)
+            assert np.abs(xs - center[0]).max() < 100 and np.abs(ys - center[1]).max() < 100
+
+
+def test_tracking_recovers_after_losing_the_ball():
+    tracking = ColorSegmenter(BASE_COLOR, TOLERANCE, track=True)
+    assert tracking.map(frame_with_ball((120, 100))) is not None
+    # the ball jumps out of the window, the full frame search has to find it again
+    far = (500.0, 150.0)
+    tracking.map(frame_with_ball(far))
+    detection = tracking.map(frame_with_ball(far, seed=1))
+    np.testing.assert_allclose(detection.center, far, atol=1.5)
+
+
+def test_search_hint_moves_the_window():
+    tracking = ColorSegmenter(BASE_COLOR, TOLERANCE, track=True)
+    observer = RecordingObserver()
+    tracking.attach_observer(observer, "tracking")
+    tracking.map(frame_with_ball((120, 100)))
+    tracking.set_search_hint(np.array([400.0, 300.0]))
+    detection = tracking.map(frame_with_ball((400, 300)))
+    np.testing.assert_allclose(detection.center, (400, 300), atol=1.5)
+    # found in the window around the hint, the distractor was never looked at
+    assert observer.images["tracking_mask"][DISTRACTOR[0][1], DISTRACTOR[0][0]] == 0
+
+
+# the coarse opening removes blobs narrower than the structuring element, so the
+# ball has to be about morph_ksize * 2 ** levels pixels wide
+@pytest.mark.parametrize("levels, radius", [(1, 20), (2, 20), (3, 32)])
+@pytest.mark.parametrize("classifier", ["lab", "lut"])
+def test_pyramid_finds_the_same_ball(levels, radius, classifier):
+    full = ColorSegmenter(BASE_COLOR, TOLERANCE, classifier=classifier)
+    pyramid = ColorSegmenter(BASE_COLOR, TOLERANCE, classifier=classifier, pyramid_levels=levels)
+    for step, center in enumerate(trajectory(4)):
+        frame = frame_with_ball(center, radius, seed=step)
+        assert_same_ball(pyramid.map(frame), full.map(frame), center)
+
+
+def test_pyramid_without_a_ball():
+    pyramid = ColorSegmenter(BASE_COLOR, TOLERANCE, pyramid_levels=2)
+    frame = np.full((480, 640, 3), BACKGROUND_BGR, dtype=np.uint8)
+    assert pyramid.map(frame) is None
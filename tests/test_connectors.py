@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from pipeline.pipeline import (
+    MAX_QUEUE_BUFFER,
+    OverflowPolicy,
+    ProcessPipelineConnector,
+    ThreadPipelineConnector,
+)
+
+CONNECTORS = [ThreadPipelineConnector, ProcessPipelineConnector]
+
+
+def fill(connector, count):
+    for item in range(count):
+        connector.put(item)
+
+
+def drain(connector, count):
+    return [connector.get() for _ in range(count)]
+
+
+@pytest.mark.parametrize("connector_type", CONNECTORS)
+def test_capacity_follows_the_policy(connector_type):
+    assert connector_type(OverflowPolicy.LATEST).capacity == 1
+    for policy in (OverflowPolicy.BLOCK, OverflowPolicy.DROP_OLDEST, OverflowPolicy.DROP_NEWEST):
+        assert connector_type(policy).capacity == MAX_QUEUE_BUFFER
+
+
+@pytest.mark.parametrize("connector_type", CONNECTORS)
+def test_drop_oldest_keeps_the_newest_items(connector_type):
+    connector = connector_type(OverflowPolicy.DROP_OLDEST)
+    fill(connector, MAX_QUEUE_BUFFER + 3)
+    assert drain(connector, MAX_QUEUE_BUFFER) == list(range(3, MAX_QUEUE_BUFFER + 3))
+    assert connector.get_dropped() == 3
+
+
+@pytest.mark.parametrize("connector_type", CONNECTORS)
+def test_drop_newest_keeps_the_oldest_items(connector_type):
+    connector = connector_type(OverflowPolicy.DROP_NEWEST)
+    fill(connector, MAX_QUEUE_BUFFER + 3)
+    assert drain(connector, MAX_QUEUE_BUFFER) == list(range(MAX_QUEUE_BUFFER))
+    assert connector.get_dropped() == 3
+
+
+@pytest.mark.parametrize("connector_type", CONNECTORS)
+def test_latest_keeps_only_the_last_item(connector_type):
+    connector = connector_type(OverflowPolicy.LATEST)
+    fill(connector, 5)
+    assert connector.get() == 4
+    assert connector.get_dropped() == 4
+    connector.put(5)
+    assert connector.get() == 5
+    assert connector.get_dropped() == 4
+
+
+def test_capacity_can_be_changed_on_the_instance():
+    connector = ThreadPipelineConnector(OverflowPolicy.DROP_OLDEST)
+    connector.capacity = 2
+    fill(connector, 5)
+    assert connector.get_size() == 2
+    assert drain(connector, 2) == [3, 4]
+    assert connector.get_dropped() == 3
+
+
+def test_block_waits_for_a_get():
+    connector = ThreadPipelineConnector(OverflowPolicy.BLOCK)
+    fill(connector, MAX_QUEUE_BUFFER)
+    put = threading.Event()
+    producer = threading.Thread(target=lambda: (connector.put("late"), put.set()), daemon=True)
+    producer.start()
+    assert not put.wait(0.2)
+    assert connector.get() == 0
+    assert put.wait(5)
+    producer.join(5)
+    assert drain(connector, MAX_QUEUE_BUFFER) == list(range(1, MAX_QUEUE_BUFFER)) + ["late"]
+    assert connector.get_dropped() == 0
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+import redis
+
+from broadcast.redis_broadcast import RedisBroadcast
+from components import Collector, CountingSupplier, SleepingMapper, run_until_collected
+from pipeline.envelope import Envelope
+from debug.resp_server import RespStandInServer
+from pipeline.pipeline import Pipeline, Supplier
+
+COUNT = 10
+
+
+class EnvelopeSupplier(Supplier):
+    """Supplies envelopes with its own sequence numbers and capture times."""
+
+    def __init__(self):
+        super().__init__()
+        self.supplied = 0
+
+    def supply(self):
+        time.sleep(0.001)
+        self.supplied += 1
+        return Envelope.capture(self.supplied, 100 + self.supplied, captured_at=1000.0 + self.supplied,
+                                skipped=self.supplied % 2)
+
+
+def test_with_payload_copies_the_stage_times():
+    envelope = Envelope.capture("frame", 3, captured_at=1.0, captured_monotonic=2.0, skipped=4)
+    envelope.stamp("first")
+    copy = envelope.with_payload("result")
+    copy.stamp("second")
+    assert (copy.payload, copy.sequence, copy.captured_at, copy.captured_monotonic, copy.skipped) == \
+        ("result", 3, 1.0, 2.0, 4)
+    assert [name for name, _ in envelope.stage_times] == ["first"]
+    assert [name for name, _ in copy.stage_times] == ["first", "second"]
+
+
+@pytest.mark.parametrize("process", [False, True])
+def test_pipeline_keeps_sequence_and_timestamps(process):
+    collector = Collector(COUNT, wants_envelope=True)
+    pipeline = (
+        Pipeline.builder()
+        .add(CountingSupplier(COUNT))
+        .add(SleepingMapper(), process=process)
+        .add(collector)
+        .build()
+    )
+    started = time.monotonic()
+    run_until_collected(pipeline, collector)
+    for number, envelope in enumerate(collector.items):
+        assert isinstance(envelope, Envelope)
+        assert (envelope.sequence, envelope.payload) == (number, number * 2)
+        assert abs(envelope.captured_at - time.time()) < 30
+        stamps = [stamp for _, stamp in envelope.stage_times]
+        assert [name for name, _ in envelope.stage_times] == ["CountingSupplier", "SleepingMapper"]
+        assert started <= envelope.captured_monotonic <= stamps[0] <= stamps[1] <= time.monotonic()
+
+
+@pytest.mark.parametrize("process", [False, True])
+def test_supplied_envelopes_are_passed_on(process):
+    collector = Collector(COUNT, wants_envelope=True)
+    pipeline = (
+        Pipeline.builder()
+        .add(EnvelopeSupplier())
+        .add(SleepingMapper(), process=process)
+        .add(collector)
+        .build()
+    )
+    run_until_collected(pipeline, collector)
+    for number, envelope in enumerate(collector.items, start=1):
+        assert (envelope.payload, envelope.sequence) == (number * 2, 100 + number)
+        assert envelope.captured_at == 1000.0 + number
+        assert envelope.skipped == number % 2
+
+
+def test_redis_broadcast_measures_until_the_publish():
+    server = RespStandInServer().start()
+    try:
+        broadcast = RedisBroadcast(redis.Redis(port=server.port), "ball")
+        for number in range(COUNT):
+            envelope = Envelope.capture({"x": number, "y": 0.0, "z": 1.0}, number,
+                                        captured_monotonic=time.monotonic() - 1.0)
+            broadcast.consume(envelope)
+        broadcast.stop()
+    finally:
+        server.stop()
+    latencies = broadcast.publish_latency.snapshot()
+    assert broadcast.sent == len(latencies) == COUNT
+    assert all(1.0 <= latency < 30 for latency in latencies)
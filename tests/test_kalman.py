@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from geometry.geom import Sphere
+from pipeline.envelope import Envelope
+from post_processing.kalman import GRAVITY_MM, KalmanTrajectoryFilter, RoiFeedback
+
+DT = 1 / 60
+START = np.array([-500.0, -200.0, 2000.0])
+VELOCITY = np.array([3000.0, -2500.0, 500.0])
+NOISE = 5.0
+
+
+def ballistic(step):
+    t = step * DT
+    return START + VELOCITY * t + 0.5 * np.asarray(GRAVITY_MM) * t ** 2
+
+
+def as_dict(position):
+    return {"x": position[0], "y": position[1], "z": position[2]}
+
+
+def run(kalman, measurements):
+    return [kalman.map(Envelope.capture(measurement, step, captured_monotonic=100.0 + step * DT))
+            for step, measurement in enumerate(measurements)]
+
+
+def position(result):
+    return np.array([result["x"], result["y"], result["z"]])
+
+
+@pytest.mark.parametrize("estimate_acceleration", [False, True])
+def test_smooths_a_noisy_throw(estimate_acceleration):
+    rng = np.random.default_rng(0)
+    truth = [ballistic(step) for step in range(60)]
+    measured = [point + rng.normal(0, NOISE, 3) for point in truth]
+    results = run(KalmanTrajectoryFilter(estimate_acceleration=estimate_acceleration),
+                  [as_dict(point) for point in measured])
+
+    settled = slice(20, None)
+    raw_error = np.linalg.norm(np.array(measured) - truth, axis=1)[settled]
+    filtered_error = np.linalg.norm(np.array([position(r) for r in results]) - truth, axis=1)[settled]
+    assert filtered_error.mean() < raw_error.mean()
+    assert not any(result["predicted"] for result in results)
+    velocity = np.array([results[-1][key] for key in ("vx", "vy", "vz")])
+    expected = VELOCITY + np.asarray(GRAVITY_MM) * 59 * DT
+    np.testing.assert_allclose(velocity, expected, atol=300)
+
+
+def test_bridges_a_gap_and_drops_the_track_after_max_gap():
+    measurements = [as_dict(ballistic(step)) for step in range(15)] + [None] * 4
+    results = run(KalmanTrajectoryFilter(max_gap=3), measurements)
+    bridged = results[15:18]
+    assert all(result["predicted"] for result in bridged)
+    for step, result in zip(range(15, 18), bridged):
+        np.testing.assert_allclose(position(result), ballistic(step), atol=20)
+    assert results[18] is None
+
+
+def test_gate_rejects_an_outlier():
+    measurements = [as_dict(ballistic(step)) for step in range(15)]
+    measurements[10] = as_dict(ballistic(10) + [1000.0, 0.0, 0.0])
+    results = run(KalmanTrajectoryFilter(), measurements)
+    assert results[10]["predicted"]
+    np.testing.assert_allclose(position(results[10]), ballistic(10), atol=20)
+    assert not results[11]["predicted"]
+
+
+def test_accepts_spheres_and_starts_with_the_first_measurement():
+    kalman = KalmanTrajectoryFilter()
+    assert kalman.map(Envelope.capture(None, 0)) is None
+    result = kalman.map(Envelope.capture(Sphere(START, 20.0), 1))
+    np.testing.assert_allclose(position(result), START)
+    assert not result["predicted"]
+    assert np.array(result["covariance"]).shape == (3, 3)
+
+
+class HintRecorder:
+    def __init__(self):
+        self.hints = []
+
+    def set_search_hint(self, center):
+        self.hints.append(center)
+
+
+def test_predictions_steer_the_segmenters():
+    left = np.array([[700, 0, 640, 0], [0, 700, 360, 0], [0, 0, 1, 0]], dtype=np.float64)
+    right = left.copy()
+    right[0, 3] = -700 * 120.0
+    segmenters = HintRecorder(), HintRecorder()
+    kalman = KalmanTrajectoryFilter(on_predict=RoiFeedback(left, right, *segmenters))
+    run(kalman, [as_dict(ballistic(step)) for step in range(10)])
+    assert len(segmenters[0].hints) == len(segmenters[1].hints) == 10
+
+    expected = ballistic(10)
+    u = 700 * expected[0] / expected[2] + 640
+    np.testing.assert_allclose(segmenters[0].hints[-1][0], u, atol=3)
+    np.testing.assert_allclose(segmenters[1].hints[-1][0], u - 700 * 120.0 / expected[2], atol=3)
+    np.testing.assert_allclose(segmenters[0].hints[-1][1], segmenters[1].hints[-1][1])
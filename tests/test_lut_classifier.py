@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+import pytest
+
+from detection.color_thresholding import ColorSegmenter, equalization_lut
+from detection.lut_classifier import LabLutClassifier
+
+LOWER = np.array([40, 150, 140], dtype=np.uint8)
+UPPER = np.array([220, 200, 190], dtype=np.uint8)
+BALL_BGR = (40, 60, 220)
+BACKGROUND_BGR = (90, 140, 60)
+
+
+def lab_mask(frame, lower, upper, equalization=None):
+    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+    if equalization is not None:
+        lab[:, :, 0] = cv2.LUT(lab[:, :, 0], equalization)
+    return cv2.inRange(lab, lower, upper)
+
+
+def bin_centers(bits, shape, seed=0):
+    """Random frame of bin centers, where the table is exact and not an approximation."""
+    shift = 8 - bits
+    values = np.random.default_rng(seed).integers(0, 1 << bits, shape, dtype=np.uint16)
+    return ((values << shift) + ((1 << shift) >> 1)).astype(np.uint8)
+
+
+def ball_frame():
+    frame = np.full((120, 160, 3), BACKGROUND_BGR, dtype=np.uint8)
+    cv2.circle(frame, (80, 60), 25, BALL_BGR, -1)
+    noise = np.random.default_rng(1).integers(-6, 7, frame.shape)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def test_full_table_matches_lab_in_range():
+    frame = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    classifier = LabLutClassifier(LOWER, UPPER, bits=8)
+    assert not classifier.can_equalize
+    np.testing.assert_array_equal(classifier.classify(frame), lab_mask(frame, LOWER, UPPER))
+
+
+@pytest.mark.parametrize("bits", [4, 5, 6])
+def test_equalized_table_matches_lab_in_range(bits):
+    frame = bin_centers(bits, (64, 64, 3))
+    classifier = LabLutClassifier(LOWER, UPPER, bits=bits)
+    equalization = equalization_lut(cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)[:, :, 0])
+    np.testing.assert_array_equal(classifier.classify(frame, equalization),
+                                  lab_mask(frame, LOWER, UPPER, equalization))
+    np.testing.assert_array_equal(classifier.classify(frame), lab_mask(frame, LOWER, UPPER))
+
+
+def test_rebuild_changes_the_range():
+    frame = bin_centers(5, (64, 64, 3))
+    classifier = LabLutClassifier(LOWER, UPPER, bits=5)
+    other_lower, other_upper = np.array([0, 0, 0], np.uint8), np.array([255, 128, 128], np.uint8)
+    classifier.rebuild(other_lower, other_upper)
+    np.testing.assert_array_equal(classifier.classify(frame), lab_mask(frame, other_lower, other_upper))
+
+
+@pytest.mark.parametrize("lut_bits", [5, 6, 8])
+def test_segmenters_agree_on_the_ball(lut_bits):
+    frame = ball_frame()
+    base_color = cv2.cvtColor(np.uint8([[BALL_BGR]]), cv2.COLOR_BGR2LAB)[0, 0].astype(np.float32)
+    tolerance = [0.5, 0.06, 0.06]
+    # the LAB path blurs the frame and the LUT path the mask, without blur both segment the same
+    lab = ColorSegmenter(base_color, tolerance, blur_ksize=1, classifier="lab")
+    lut = ColorSegmenter(base_color, tolerance, blur_ksize=1, classifier="lut", lut_bits=lut_bits)
+    lab_binary = lab.apply_color_thresholding(frame).copy()
+    lut_binary = lut.apply_color_thresholding(frame).copy()
+    overlap = np.count_nonzero(lab_binary & lut_binary) / np.count_nonzero(lab_binary | lut_binary)
+    assert overlap > 0.95
+
+    lut.set_color(cv2.cvtColor(np.uint8([[BACKGROUND_BGR]]), cv2.COLOR_BGR2LAB)[0, 0].astype(np.float32))
+    assert np.count_nonzero(lut.apply_color_thresholding(frame) & lut_binary) == 0
@@ -0,0 +1,101 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from stereo.parameter_store import (
+    CHECKSUM_KEY,
+    SCHEMA_KEY,
+    SCHEMA_VERSION,
+    ParameterStore,
+    ParameterStoreError,
+    save_parameters,
+)
+
+
+@pytest.fixture
+def arrays():
+    rng = np.random.default_rng(0)
+    return {
+        "K1": rng.normal(size=(3, 3)),
+        "map_x": rng.random((48, 64)).astype(np.float32),
+        "fortran": np.asfortranarray(rng.integers(0, 100, (5, 7), dtype=np.int16)),
+        "image_size": np.array([640, 480]),
+        "scalar": np.array(1.5),
+        "empty": np.zeros((0, 3)),
+    }
+
+
+@pytest.fixture
+def path(tmp_path, arrays):
+    path = str(tmp_path / "calibration.npz")
+    save_parameters(path, **arrays)
+    return path
+
+
+def test_round_trip(path, arrays):
+    store = ParameterStore(path, verify=True)
+    assert store.schema_version == SCHEMA_VERSION
+    assert set(store) == set(arrays)
+    assert len(store) == len(arrays)
+    for name, array in arrays.items():
+        assert store[name].dtype == array.dtype
+        np.testing.assert_array_equal(store[name], array)
+    assert isinstance(store["map_x"], np.memmap)
+    assert SCHEMA_KEY in store and CHECKSUM_KEY not in set(store)
+    with pytest.raises(KeyError):
+        store["missing"]
+
+
+def test_pickles_by_path(path, arrays):
+    store = pickle.loads(pickle.dumps(ParameterStore(path)))
+    np.testing.assert_array_equal(store["map_x"], arrays["map_x"])
+
+
+def test_rejects_reserved_names(tmp_path):
+    with pytest.raises(ValueError):
+        save_parameters(str(tmp_path / "store.npz"), checksum=np.zeros(1))
+
+
+def test_verify_detects_corruption(path, arrays):
+    with open(path, "rb") as file:
+        content = bytearray(file.read())
+    position = content.find(arrays["map_x"].tobytes())
+    assert position >= 0
+    content[position] ^= 0xFF
+    with open(path, "wb") as file:
+        file.write(content)
+
+    ParameterStore(path)
+    with pytest.raises(ParameterStoreError, match="Checksum"):
+        ParameterStore(path, verify=True)
+
+
+def test_rejects_newer_schema(tmp_path):
+    path = str(tmp_path / "store.npz")
+    np.savez(path, K1=np.eye(3), **{SCHEMA_KEY: np.array(SCHEMA_VERSION + 1),
+                                    CHECKSUM_KEY: np.array("")})
+    with pytest.raises(ParameterStoreError, match="schema version"):
+        ParameterStore(path)
+
+
+def test_rejects_plain_npz(tmp_path):
+    path = str(tmp_path / "store.npz")
+    np.savez(path, K1=np.eye(3))
+    with pytest.raises(ParameterStoreError, match="not a parameter store"):
+        ParameterStore(path)
+
+
+def test_rejects_compressed_npz(tmp_path):
+    path = str(tmp_path / "store.npz")
+    np.savez_compressed(path, K1=np.eye(3), **{SCHEMA_KEY: np.array(SCHEMA_VERSION)})
+    with pytest.raises(ParameterStoreError, match="compressed"):
+        ParameterStore(path)
+
+
+def test_rejects_object_arrays(tmp_path):
+    path = str(tmp_path / "store.npz")
+    np.savez(path, objects=np.array([{"a": 1}], dtype=object), **{SCHEMA_KEY: np.array(SCHEMA_VERSION)})
+    store = ParameterStore(path)
+    with pytest.raises(ParameterStoreError, match="python objects"):
+        store["objects"]
@@ -0,0 +1,56 @@
+import random
+import threading
+import time
+
+from components import Collector, CountingSupplier, run_until_collected
+from pipeline.pipeline import Mapper, Pipeline
+from pipeline.reorder import ReorderBuffer
+
+COUNT = 200
+
+
+class JitteryMapper(Mapper):
+    """Takes a random time per item, so the workers finish out of order."""
+
+    def map(self, obj):
+        time.sleep(random.uniform(0, 0.002))
+        return obj, threading.get_ident()
+
+
+def test_emits_in_sequence_order():
+    emitted = []
+    buffer = ReorderBuffer(emitted.append)
+    for sequence in (2, 0, 3, 1, 5):
+        buffer.submit(sequence, sequence)
+    assert emitted == [0, 1, 2, 3]
+    assert buffer.get_size() == 1
+
+
+def test_concurrent_submits_keep_the_order():
+    emitted = []
+    buffer = ReorderBuffer(emitted.append)
+    sequences = list(range(1000))
+    random.Random(0).shuffle(sequences)
+    threads = [threading.Thread(target=lambda part=sequences[i::4]: [buffer.submit(s, s) for s in part])
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert emitted == list(range(1000))
+    assert buffer.get_size() == 0
+
+
+def test_several_workers_keep_the_order():
+    collector = Collector(COUNT)
+    pipeline = (
+        Pipeline.builder()
+        .add(CountingSupplier(COUNT))
+        .add(JitteryMapper(), workers=4)
+        .add(collector)
+        .build()
+    )
+    run_until_collected(pipeline, collector)
+    assert [item for item, _ in collector.items] == list(range(COUNT))
+    # the items really were spread over the workers
+    assert len({worker for _, worker in collector.items}) > 1
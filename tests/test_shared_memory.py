@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+
+from pipeline.shared_memory import MIN_SHARED_BYTES, SharedFrameRing, SharedFrameRingClosed
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing(2, 4 * 1280 * 720 * 3)
+    yield ring
+    ring.unlink()
+
+
+def frames():
+    rng = np.random.default_rng(0)
+    left = rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    return {"pair": (left, left[:, ::-1].copy()), "small": [np.arange(4.0)], "sequence": 7}
+
+
+def assert_same(result, expected):
+    assert result["sequence"] == expected["sequence"]
+    for got, want in zip(result["pair"] + tuple(result["small"]), expected["pair"] + tuple(expected["small"])):
+        np.testing.assert_array_equal(got, want)
+
+
+def test_round_trip_moves_large_arrays_only(ring):
+    obj = frames()
+    slot, packed = ring.encode(obj)
+    assert slot is not None
+    # the frames are placeholders now, small arrays travel as they are
+    assert not isinstance(packed["pair"][0], np.ndarray)
+    assert packed["small"][0].nbytes < MIN_SHARED_BYTES and isinstance(packed["small"][0], np.ndarray)
+    assert_same(ring.decode(slot, packed), obj)
+    ring.release(slot)
+
+
+def test_copy_outlives_the_slot(ring):
+    obj = frames()
+    slot, packed = ring.encode(obj)
+    copied = ring.decode(slot, packed, copy=True)
+    ring.release(slot)
+    # both slots are written over, the copy must not change
+    others = [ring.encode({"pair": (np.zeros_like(obj["pair"][0]),)}) for _ in range(2)]
+    assert_same(copied, obj)
+    for other, _ in others:
+        ring.release(other)
+
+
+def test_released_slots_are_reused(ring):
+    obj = frames()
+    slots = [ring.encode(obj)[0] for _ in range(2)]
+    assert sorted(slots) == [0, 1]
+    ring.release(slots[0])
+    assert ring.encode(obj)[0] == slots[0]
+
+
+def test_acquire_fails_once_closed(ring):
+    for _ in range(2):
+        ring.acquire()
+    ring.close()
+    with pytest.raises(SharedFrameRingClosed):
+        ring.acquire()
+
+
+def _echo_checksums(ring, slot, packed, results):
+    # runs in a spawned process, like a process stage
+    obj = ring.decode(slot, packed)
+    results.put([int(array.astype(np.int64).sum()) for array in obj["pair"]])
+    ring.release(slot)
+
+
+def test_round_trip_through_a_process():
+    context = multiprocessing.get_context("spawn")
+    ring = SharedFrameRing(2, 4 * 1280 * 720 * 3, context)
+    results = context.Queue()
+    obj = frames()
+    slot, packed = ring.encode(obj)
+    process = context.Process(target=_echo_checksums, args=(ring, slot, packed, results))
+    process.start()
+    # a slot that is never handed back would block acquire, closing turns that into an error
+    timeout = threading.Timer(30, ring.close)
+    timeout.start()
+    try:
+        assert results.get(timeout=60) == [int(array.astype(np.int64).sum()) for array in obj["pair"]]
+        process.join(timeout=10)
+        assert sorted((ring.acquire(), ring.acquire())) == [0, 1]
+    finally:
+        timeout.cancel()
+        process.join(timeout=10)
+        ring.unlink()
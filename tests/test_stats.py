@@ -0,0 +1,62 @@
+import pytest
+
+from components import Collector, CountingSupplier, SleepingMapper, run_until_collected
+from pipeline.pipeline import Pipeline
+from pipeline.stats import RollingHistogram, StageStats, format_stats
+
+COUNT = 20
+SLEEP = 0.01
+
+
+def test_summarize_uses_nearest_rank():
+    summary = RollingHistogram.summarize([float(value) for value in range(1, 101)], scale=1e3)
+    assert summary["count"] == 100
+    assert summary["mean"] == pytest.approx(50.5e3)
+    assert (summary["p50"], summary["p95"], summary["p99"]) == (50e3, 95e3, 99e3)
+    assert RollingHistogram.summarize([])["p50"] is None
+
+
+def test_histogram_keeps_the_window():
+    histogram = RollingHistogram(window=3)
+    for value in range(5):
+        histogram.record(value)
+    assert histogram.snapshot() == [2, 3, 4]
+
+
+def test_merge_combines_the_workers():
+    workers = [StageStats(), StageStats()]
+    workers[0].record(0.001, 0.002, None)
+    workers[1].record(None, 0.004, 0.003)
+    merged = StageStats.merge("stage", workers)
+    assert merged["items"] == 2
+    assert merged["service_ms"]["count"] == 2
+    assert merged["service_ms"]["mean"] == pytest.approx(3.0)
+    assert merged["wait_input_ms"]["count"] == 1
+    assert merged["blocked_output_ms"]["p50"] == pytest.approx(3.0)
+    assert merged["latency_ms"]["count"] == 0
+
+
+@pytest.mark.parametrize("process", [False, True])
+def test_pipeline_records_every_stage(process):
+    collector = Collector(COUNT)
+    pipeline = (
+        Pipeline.builder()
+        .add(CountingSupplier(COUNT))
+        .add(SleepingMapper(SLEEP), process=process)
+        .add(collector)
+        .build()
+    )
+    run_until_collected(pipeline, collector)
+    supplier, mapper, consumer = pipeline.stats()
+    assert [stage["stage"] for stage in (supplier, mapper, consumer)] == \
+        ["CountingSupplier", "SleepingMapper", "Collector"]
+    assert supplier["items"] >= COUNT
+    assert mapper["items"] == consumer["items"] == COUNT
+    # in a process stage the service time is measured in the child
+    assert mapper["service_ms"]["p50"] >= SLEEP * 1e3 * 0.9
+    assert consumer["service_ms"]["p50"] < SLEEP * 1e3
+    # the consumer waits for the slow mapper
+    assert consumer["wait_input_ms"]["p50"] > 0
+    assert pipeline.latency()["count"] == COUNT
+    assert pipeline.latency()["p50"] >= SLEEP * 1e3 * 0.9
+    assert "SleepingMapper" in format_stats(pipeline.stats())
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from geometry.geom import SpatialGeometryTransformer
+
+POINTS = np.array([
+    [0.0, 0.0, 1500.0],
+    [-400.0, 250.0, 1200.0],
+    [300.0, -200.0, 2500.0],
+    [50.0, 80.0, 800.0],
+])
+
+METHODS = ("midpoint", "dlt", "optimize")
+
+
+def camera(center=(0.0, 0.0, 0.0), yaw=0.0, focal=700.0):
+    """Projection matrix of a camera at ``center`` mm turned by ``yaw`` radians."""
+    intrinsics = np.array([[focal, 0, 640], [0, focal, 360], [0, 0, 1]], dtype=np.float64)
+    rotation = np.array([[np.cos(yaw), 0, -np.sin(yaw)], [0, 1, 0], [np.sin(yaw), 0, np.cos(yaw)]])
+    translation = -rotation @ np.asarray(center, dtype=np.float64)
+    return intrinsics @ np.hstack((rotation, translation[:, None]))
+
+
+def project(matrix, points):
+    homogeneous = np.hstack((points, np.ones((len(points), 1)))) @ matrix.T
+    return homogeneous[:, :2] / homogeneous[:, 2:]
+
+
+def triangulate(method, left, right, points, noise=None):
+    left_points, right_points = project(left, points), project(right, points)
+    if noise is not None:
+        left_points, right_points = left_points + noise[0], right_points + noise[1]
+    transformer = SpatialGeometryTransformer(left, right, method)
+    return transformer.triangulate_points(left_points, right_points, equalize_rows=False)
+
+
+@pytest.fixture(params=METHODS)
+def method(request):
+    if request.param == "optimize":
+        pytest.importorskip("scipy")
+    return request.param
+
+
+@pytest.mark.parametrize("right", [camera((120.0, 0.0, 0.0)), camera((150.0, 20.0, -30.0), yaw=0.1)],
+                         ids=["rectified", "verged"])
+def test_recovers_known_points(method, right):
+    result = triangulate(method, camera(), right, POINTS)
+    np.testing.assert_allclose(result, POINTS, atol=0.5)
+
+
+def test_camera_center_is_the_null_space():
+    center = SpatialGeometryTransformer.camera_center(camera((150.0, 20.0, -30.0), yaw=0.1))
+    np.testing.assert_allclose(center, [150.0, 20.0, -30.0, 1.0], atol=1e-9)
+
+
+def test_methods_agree_on_noisy_points():
+    pytest.importorskip("scipy")
+    left, right = camera(), camera((120.0, 0.0, 0.0))
+    noise = np.random.default_rng(0).normal(0, 0.5, (2,) + (len(POINTS), 2))
+    results = [triangulate(method, left, right, POINTS, noise) for method in METHODS]
+    for result in results[1:]:
+        np.testing.assert_allclose(result, results[0], atol=1.0)
+
+
+def test_fallback_matrices_of_main_keep_millimeters(method):
+    # the ideal cameras main.py assumes without a calibration, Tx = -fx * B with B = 120 mm
+    left = np.array([[700, 0, 640, 0], [0, 700, 360, 0], [0, 0, 1, 0]], dtype=np.float64)
+    right = np.array([[700, 0, 640, -700 * 120.0], [0, 700, 360, 0], [0, 0, 1, 0]], dtype=np.float64)
+    np.testing.assert_allclose(right, camera((120.0, 0.0, 0.0)))
+    ball = np.array([[100.0, 0.0, 1000.0]])
+    np.testing.assert_allclose(triangulate(method, left, right, ball), ball, atol=0.5)